@@ -29,6 +29,7 @@ def create_app():
     from app.routes.messages import messages_bp
     from app.routes.bot_management import bot_management_bp
     from app.routes.verification import verification_bp
+    from app.routes.metrics import metrics_bp
     
     app.register_blueprint(auth_bp)
     app.register_blueprint(dashboard_bp)
@@ -36,5 +37,6 @@ def create_app():
     app.register_blueprint(messages_bp)
     app.register_blueprint(bot_management_bp)
     app.register_blueprint(verification_bp)
+    app.register_blueprint(metrics_bp)
     
     return app
\ No newline at end of file
@@ -1,6 +1,7 @@
 from flask import Blueprint, render_template, request, redirect, url_for, session, flash
-from models import UserManager
+from models import UserManager, WatermarkManager, OutboundQueueManager
 from app import active_bots
+from app.utils.helpers import stop_active_bot
 
 accounts_bp = Blueprint('accounts', __name__)
 
@@ -42,13 +43,12 @@ def delete_account(account_id):
     try:
         # توقف ربات اگر در حال اجرا است
         if account_id in active_bots:
-            active_bots[account_id]['bot'].stop_bot()
-            if active_bots[account_id]['thread'] and active_bots[account_id]['thread'].is_alive():
-                active_bots[account_id]['thread'].join(timeout=3.0)
-            del active_bots[account_id]
+            stop_active_bot(account_id, timeout=3.0)
         
         user_manager = UserManager()
         if user_manager.delete_instagram_account(account_id, session['user_id']):
+            WatermarkManager().delete_account_watermarks(account_id)
+            OutboundQueueManager().delete_account_messages(account_id)
             flash('✅ حساب اینستاگرام با موفقیت حذف شد!', 'success')
         else:
             flash('❌ خطا در حذف حساب!', 'error')
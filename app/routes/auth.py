@@ -84,15 +84,13 @@ def register():
 def logout():
     """خروج از سیستم"""
     from app import active_bots
+    from app.utils.helpers import stop_active_bot
     
     # توقف تمام ربات‌های در حال اجرا
     for account_id in list(active_bots.keys()):
         try:
             if account_id in active_bots:
-                active_bots[account_id]['bot'].stop_bot()
-                if active_bots[account_id]['thread'] and active_bots[account_id]['thread'].is_alive():
-                    active_bots[account_id]['thread'].join(timeout=3.0)
-                del active_bots[account_id]
+                stop_active_bot(account_id, timeout=3.0)
         except Exception as e:
             from app import app
             app.logger.error(f"خطا در توقف ربات هنگام خروج: {e}")
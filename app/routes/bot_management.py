@@ -1,12 +1,19 @@
-from flask import Blueprint, redirect, url_for, session, flash, jsonify
+from flask import Blueprint, Response, redirect, url_for, session, flash, jsonify, stream_with_context
 from models import UserManager
-from bots.instagram_bot import InstagramBot
+from bots.status_hub import status_hub
+from bots.supervisor import get_bot_supervisor
 from app import active_bots
+from app.utils.helpers import get_bot_host, stop_active_bot
 import threading
 import logging
+import json
+import queue
 
 logger = logging.getLogger(__name__)
 
+# فاصله ارسال keepalive روی stream وضعیت تا proxyها اتصال را نبندند (ثانیه)
+STATUS_STREAM_KEEPALIVE = 15
+
 bot_management_bp = Blueprint('bot_management', __name__)
 
 @bot_management_bp.route('/start_bot/<int:account_id>')
@@ -21,57 +28,59 @@ def start_bot(account_id):
             return redirect(url_for('dashboard.dashboard'))
         
         user_manager = UserManager()
-        account_data = user_manager.get_account_credentials(account_id, session['user_id'])
+        account_data = user_manager.get_account_credentials(account_id, session['user_id'], include_session=False)
         
         if account_data:
-            bot = InstagramBot(
-                account_data['instagram_username'],
-                account_data['instagram_password'],
-                session['user_id']
-            )
+            supervisor = get_bot_supervisor()
+            if supervisor.enabled:
+                # ربات در یکی از پردازش‌های worker اجرا می‌شود و اینجا فقط نماینده آن است
+                bot = supervisor.create_bot(
+                    account_id,
+                    session['user_id'],
+                    account_data['instagram_username'],
+                    account_data['instagram_password']
+                )
+            else:
+                # بار اولی که رباتی در همین پردازش شروع می‌شود instagrapi بارگذاری می‌شود
+                from bots.instagram_bot import InstagramBot
+                
+                bot = InstagramBot(
+                    account_data['instagram_username'],
+                    account_data['instagram_password'],
+                    session['user_id']
+                )
             
             # استفاده از Event برای هماهنگی
             verification_event = threading.Event()
             
             active_bots[account_id] = {
                 'bot': bot,
-                'thread': None,
-                'running': False,
+                'task': None,
+                'running': True,
                 'needs_verification': False,
                 'verification_event': verification_event
             }
             
-            def run_bot_wrapper():
-                active_bots[account_id]['running'] = True
-                try:
-                    # ابتدا لاگین را امتحان می‌کنیم
-                    login_success = bot.login()
-                    
-                    if not login_success:
-                        # اگر نیاز به تأیید دو مرحله‌ای دارد
-                        status = bot.get_verification_status()
-                        if status['needs_verification']:
-                            active_bots[account_id]['needs_verification'] = True
-                            logger.info(f"حساب {account_data['instagram_username']} نیاز به تأیید دو مرحله‌ای دارد")
-                            # سیگنال به thread اصلی که نیاز به تأیید داریم
-                            verification_event.set()
-                            return
-                    
-                    # اگر لاگین موفق بود یا تأیید انجام شد، پردازش پیام‌ها را شروع کن
-                    if bot.is_logged_in():
-                        bot.process_messages()
-                    
-                except Exception as e:
-                    logger.error(f"خطا در اجرای ربات: {e}")
-                finally:
-                    active_bots[account_id]['running'] = False
-                    active_bots[account_id]['needs_verification'] = False
-                    if account_id in active_bots:
-                        del active_bots[account_id]
+            def on_verification():
+                active_bots[account_id]['needs_verification'] = True
+                logger.info(f"حساب {account_data['instagram_username']} نیاز به تأیید دو مرحله‌ای دارد")
+                # سیگنال به thread درخواست که نیاز به تأیید داریم
+                verification_event.set()
             
-            bot_thread = threading.Thread(target=run_bot_wrapper, daemon=True)
-            active_bots[account_id]['thread'] = bot_thread
-            bot_thread.start()
+            def on_finished(future):
+                bot_info = active_bots.get(account_id)
+                if bot_info and bot_info['bot'] is bot:
+                    del active_bots[account_id]
+                # وضعیت فقط در صورتی حذف می‌شود که ربات جدیدی برای این حساب شروع نشده باشد
+                if account_id not in active_bots:
+                    status_hub.remove(account_id)
+            
+            bot.publish_status()
+            
+            # ربات به جای thread اختصاصی روی event loop مشترک (یا پردازش worker) اجرا می‌شود
+            task = get_bot_host().submit(account_id, bot, on_verification=on_verification)
+            active_bots[account_id]['task'] = task
+            task.add_done_callback(on_finished)
             
             flash(f'✅ ربات برای حساب {account_data["instagram_username"]} شروع شد!', 'success')
             
@@ -100,19 +109,11 @@ def stop_bot(account_id):
     
     try:
         if account_id in active_bots:
-            # توقف ربات
-            result = active_bots[account_id]['bot'].stop_bot()
-            
-            # صبر کردن تا thread تمام شود
-            if active_bots[account_id]['thread'] and active_bots[account_id]['thread'].is_alive():
-                active_bots[account_id]['thread'].join(timeout=5.0)
-            
-            # حذف از دیکشنری
-            if account_id in active_bots:
-                del active_bots[account_id]
+            # توقف ربات و صبر تا پایان اجرای آن
+            result = stop_active_bot(account_id, timeout=5.0)
             
             user_manager = UserManager()
-            account_data = user_manager.get_account_credentials(account_id, session['user_id'])
+            account_data = user_manager.get_account_credentials(account_id, session['user_id'], include_session=False)
             
             if result:
                 flash(f'✅ ربات برای حساب {account_data["instagram_username"]} متوقف شد!', 'success')
@@ -136,11 +137,82 @@ def api_bot_status():
     if 'user_id' not in session:
         return jsonify({'error': 'لطفاً ابتدا وارد شوید'}), 401
     
+    # وضعیت‌ها از status_hub خوانده می‌شوند و فقط ربات‌های همین کاربر برگردانده می‌شوند
     statuses = {}
-    for account_id, bot_info in active_bots.items():
+    for account_id, state in status_hub.snapshot(session['user_id']).items():
         statuses[account_id] = {
-            'running': bot_info['running'],
-            'verification_status': bot_info['bot'].get_verification_status()
+            'running': state['running'],
+            'verification_status': state['verification_status']
         }
     
-    return jsonify(statuses)
\ No newline at end of file
+    return jsonify(statuses)
+
+def format_sse(event: str, data) -> str:
+    """قالب‌بندی یک رویداد Server-Sent Events"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@bot_management_bp.route('/api/status_stream')
+def api_status_stream():
+    """stream تغییرات وضعیت ربات‌های کاربر (Server-Sent Events)
+    
+    ابتدا snapshot کامل و سپس فقط رویدادهای تغییر وضعیت ارسال می‌شود.
+    """
+    if 'user_id' not in session:
+        return jsonify({'error': 'لطفاً ابتدا وارد شوید'}), 401
+    
+    user_id = session['user_id']
+    
+    def stream():
+        # اشتراک پیش از snapshot تا هیچ تغییری بین این دو از دست نرود
+        subscriber = status_hub.subscribe(user_id)
+        try:
+            yield format_sse('snapshot', status_hub.snapshot(user_id))
+            while True:
+                try:
+                    event = subscriber.get(timeout=STATUS_STREAM_KEEPALIVE)
+                except queue.Empty:
+                    yield ': keepalive\n\n'
+                    continue
+                
+                if event.get('resync'):
+                    yield format_sse('snapshot', status_hub.snapshot(user_id))
+                else:
+                    yield format_sse('status', event)
+        finally:
+            status_hub.unsubscribe(user_id, subscriber)
+    
+    return Response(
+        stream_with_context(stream()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+@bot_management_bp.route('/api/poll_timeline')
+def api_poll_timeline():
+    """برنامه زمانی بررسی‌های بعدی ربات‌های کاربر"""
+    if 'user_id' not in session:
+        return jsonify({'error': 'لطفاً ابتدا وارد شوید'}), 401
+    
+    own_accounts = {
+        account_id for account_id, bot_info in active_bots.items()
+        if bot_info['bot'].user_id == session['user_id']
+    }
+    timeline = [
+        entry for entry in get_bot_host().timeline()
+        if entry['key'] in own_accounts
+    ]
+    
+    return jsonify(timeline)
+
+@bot_management_bp.route('/api/wake_bot/<int:account_id>', methods=['POST'])
+def api_wake_bot(account_id):
+    """بررسی فوری پیام‌های یک ربات بدون انتظار برای نوبت بعدی"""
+    if 'user_id' not in session:
+        return jsonify({'error': 'لطفاً ابتدا وارد شوید'}), 401
+    
+    bot_info = active_bots.get(account_id)
+    if not bot_info or bot_info['bot'].user_id != session['user_id']:
+        return jsonify({'error': 'ربات پیدا نشد'}), 404
+    
+    bot_info['bot'].wake()
+    return jsonify({'success': True})
\ No newline at end of file
@@ -1,4 +1,4 @@
-from flask import Blueprint, render_template, session, redirect, url_for
+from flask import Blueprint, render_template, session, redirect, url_for, request, jsonify
 from models import UserManager, MessageManager
 from app import active_bots
 
@@ -53,3 +53,14 @@ def dashboard():
                          verification_statuses=verification_statuses,
                          verification_required=verification_required,
                          verification_account_id=verification_account_id)
+
+@dashboard_bp.route('/api/reply_analytics')
+def reply_analytics():
+    """آمار روزانه پاسخ‌ها برای نمودارهای داشبورد (فقط از جدول‌های rollup)"""
+    if 'user_id' not in session:
+        return jsonify({'error': 'لطفاً ابتدا وارد شوید'}), 401
+    
+    days = max(1, min(request.args.get('days', 30, type=int), 365))
+    account_id = request.args.get('account_id', type=int)
+    
+    return jsonify(MessageManager().get_reply_analytics(session['user_id'], days, account_id))
@@ -1,8 +1,33 @@
-from flask import Blueprint, render_template, request, redirect, url_for, session, flash
-from models import MessageManager
+from flask import Blueprint, render_template, request, redirect, url_for, session, flash, jsonify
+from markupsafe import Markup, escape
+from models import MessageManager, UserManager
+from models.message_manager import HISTORY_PAGE_SIZE, SNIPPET_OPEN, SNIPPET_CLOSE
+from models.keyword_matcher import DEFAULT_MATCH_MODE, MATCH_MODES, MATCH_MODE_LABELS
 
 messages_bp = Blueprint('messages', __name__)
 
+
+def read_match_options(key_type: str):
+    """خواندن حالت تطبیق و اولویت از فرم؛ کلیدهای عددی همیشه دقیق تطبیق داده می‌شوند"""
+    match_mode = request.form.get('match_mode', DEFAULT_MATCH_MODE)
+    if key_type != 'text' or match_mode not in MATCH_MODES:
+        match_mode = DEFAULT_MATCH_MODE
+    try:
+        priority = int(request.form.get('priority', '0') or 0)
+    except ValueError:
+        priority = 0
+    return match_mode, priority
+
+
+def highlight_snippet(snippet: str) -> Markup:
+    """escape کردن snippet جستجو و تبدیل نشانه‌های تطبیق به <mark>"""
+    return Markup(
+        str(escape(snippet or ''))
+        .replace(SNIPPET_OPEN, '<mark>')
+        .replace(SNIPPET_CLOSE, '</mark>')
+    )
+
+
 @messages_bp.route('/edit_message/<int:message_id>', methods=['GET', 'POST'])
 def edit_message(message_id):
     """ویرایش پیام"""
@@ -19,6 +44,7 @@ def edit_message(message_id):
             start_date = request.form.get('start_date', '').strip() or None
             end_date = request.form.get('end_date', '').strip() or None
             is_active = 'is_active' in request.form
+            match_mode, priority = read_match_options(key_type)
             
             if not key or not content:
                 flash('❌ لطفاً کلید و محتوا را وارد کنید!', 'error')
@@ -29,8 +55,10 @@ def edit_message(message_id):
                     'key_type': key_type,
                     'start_date': start_date,
                     'end_date': end_date,
-                    'is_active': is_active
-                })
+                    'is_active': is_active,
+                    'match_mode': match_mode,
+                    'priority': priority
+                }, match_modes=MATCH_MODE_LABELS)
             
             # اعتبارسنجی نوع کلید
             if key_type == 'number' and not key.isdigit():
@@ -42,11 +70,14 @@ def edit_message(message_id):
                     'key_type': key_type,
                     'start_date': start_date,
                     'end_date': end_date,
-                    'is_active': is_active
-                })
+                    'is_active': is_active,
+                    'match_mode': match_mode,
+                    'priority': priority
+                }, match_modes=MATCH_MODE_LABELS)
             
             if message_manager.update_message(message_id, session['user_id'], key, content, 
-                                             key_type, start_date, end_date, is_active):
+                                             key_type, start_date, end_date, is_active,
+                                             match_mode, priority):
                 flash('✅ پیام با موفقیت به‌روزرسانی شد!', 'success')
                 return redirect(url_for('dashboard.dashboard'))
             else:
@@ -64,7 +95,7 @@ def edit_message(message_id):
         flash('❌ پیام پیدا نشد!', 'error')
         return redirect(url_for('dashboard.dashboard'))
     
-    return render_template('edit_message.html', message=message)
+    return render_template('edit_message.html', message=message, match_modes=MATCH_MODE_LABELS)
 
 @messages_bp.route('/add_message', methods=['GET', 'POST'])
 def add_message():
@@ -79,19 +110,21 @@ def add_message():
             key_type = request.form.get('key_type', 'number')
             start_date = request.form.get('start_date', '').strip() or None
             end_date = request.form.get('end_date', '').strip() or None
+            match_mode, priority = read_match_options(key_type)
             
             if not key or not content:
                 flash('❌ لطفاً کلید و محتوا را وارد کنید!', 'error')
-                return render_template('add_message.html')
+                return render_template('add_message.html', match_modes=MATCH_MODE_LABELS)
             
             # اعتبارسنجی نوع کلید
             if key_type == 'number' and not key.isdigit():
                 flash('❌ برای کلیدهای عددی فقط می‌توانید از اعداد استفاده کنید!', 'error')
-                return render_template('add_message.html')
+                return render_template('add_message.html', match_modes=MATCH_MODE_LABELS)
             
             message_manager = MessageManager()
             if message_manager.add_message(session['user_id'], key, content, 
-                                         key_type, start_date, end_date):
+                                         key_type, start_date, end_date,
+                                         match_mode, priority):
                 flash('✅ پیام جدید با موفقیت افزوده شد!', 'success')
                 return redirect(url_for('dashboard.dashboard'))
             else:
@@ -102,7 +135,7 @@ def add_message():
             app.logger.error(f"خطا در افزودن پیام: {e}")
             flash('❌ خطا در پردازش درخواست!', 'error')
     
-    return render_template('add_message.html')
+    return render_template('add_message.html', match_modes=MATCH_MODE_LABELS)
 
 @messages_bp.route('/delete_message/<int:message_id>')
 def delete_message(message_id):
@@ -139,6 +172,8 @@ def search_messages():
         if search_term:
             results = message_manager.search_messages(session['user_id'], search_term, 
                                                      key_type if key_type else None)
+            for result in results:
+                result['snippet'] = highlight_snippet(result.get('snippet'))
         else:
             results = []
         
@@ -151,4 +186,47 @@ def search_messages():
         from app import app
         app.logger.error(f"خطا در جستجوی پیام‌ها: {e}")
         flash('❌ خطا در جستجوی پیام‌ها!', 'error')
-        return redirect(url_for('dashboard.dashboard'))
\ No newline at end of file
+        return redirect(url_for('dashboard.dashboard'))
+
+def read_history_filters():
+    """خواندن فیلترها و cursor صفحه تاریخچه از query string"""
+    account_id = request.args.get('account_id', '').strip()
+    return {
+        'cursor': request.args.get('cursor', '').strip() or None,
+        'account_id': int(account_id) if account_id.isdigit() else None,
+        'thread_id': request.args.get('thread_id', '').strip() or None,
+        'message_key': request.args.get('key', '').strip() or None,
+        'limit': request.args.get('limit', HISTORY_PAGE_SIZE, type=int),
+    }
+
+@messages_bp.route('/api/message_history')
+def api_message_history():
+    """یک صفحه از تاریخچه ارسال‌ها به صورت JSON؛ next_cursor برای صفحه بعد"""
+    if 'user_id' not in session:
+        return jsonify({'error': 'لطفاً ابتدا وارد شوید'}), 401
+    
+    try:
+        page = MessageManager().get_message_history_page(session['user_id'], **read_history_filters())
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify(page)
+
+@messages_bp.route('/message_history')
+def message_history():
+    """مرور تاریخچه ارسال‌ها با فیلتر حساب، thread و کلید"""
+    if 'user_id' not in session:
+        return redirect(url_for('auth.login'))
+    
+    filters = read_history_filters()
+    try:
+        page = MessageManager().get_message_history_page(session['user_id'], **filters)
+    except ValueError:
+        flash('❌ صفحه درخواستی نامعتبر است!', 'error')
+        return redirect(url_for('messages.message_history'))
+    
+    accounts = UserManager().get_user_accounts(session['user_id'])
+    return render_template('message_history.html',
+                         history=page['items'],
+                         next_cursor=page['next_cursor'],
+                         accounts=accounts,
+                         filters=filters)
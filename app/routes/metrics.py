@@ -0,0 +1,94 @@
+from flask import Blueprint, Response, request, session
+from bots.metrics import api_metrics
+from bots.outbound import get_outbound_dispatcher
+from bots.runtime import get_bot_runtime
+from bots.supervisor import get_bot_supervisor
+from models import message_manager, outbound_queue_manager
+from app import active_bots
+import hmac
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+metrics_bp = Blueprint('metrics', __name__)
+
+# Prometheus باید هدر Authorization: Bearer <token> بفرستد؛ بدون توکن فقط مدیر واردشده دسترسی دارد
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+
+def metrics_authorized() -> bool:
+    """دسترسی به آمار: توکن معتبر Prometheus یا session مدیر"""
+    if METRICS_TOKEN:
+        supplied = request.headers.get('Authorization', '')
+        if hmac.compare_digest(supplied, f'Bearer {METRICS_TOKEN}'):
+            return True
+    # آمار شامل نام کاربری اینستاگرام تمام کاربران است
+    return bool(session.get('is_admin'))
+
+@metrics_bp.route('/metrics')
+def metrics():
+    """آمار فراخوانی‌های API و runtime با قالب متنی Prometheus"""
+    if not metrics_authorized():
+        return Response('forbidden\n', status=403, mimetype='text/plain')
+    
+    supervisor = get_bot_supervisor()
+    lines = []
+    lines.append('# TYPE instagram_bots_active gauge')
+    lines.append(f'instagram_bots_active {len(active_bots)}')
+    
+    if supervisor.enabled:
+        # آمار API هر worker از آخرین heartbeat آن خوانده و جمع می‌شود
+        lines.insert(0, api_metrics.render_prometheus(supervisor.metrics_rows()).rstrip('\n'))
+        workers = supervisor.worker_stats()
+        lines.append('# TYPE instagram_runtime_tasks gauge')
+        lines.append(f'instagram_runtime_tasks {supervisor.active_count()}')
+        lines.append('# TYPE instagram_runtime_scheduled gauge')
+        lines.append(f'instagram_runtime_scheduled {len(supervisor.timeline())}')
+        lines.append('# TYPE instagram_worker_bots gauge')
+        for worker in workers:
+            lines.append(f'instagram_worker_bots{{worker="{worker["worker"]}"}} {worker["bots"]}')
+        lines.append('# TYPE instagram_worker_up gauge')
+        for worker in workers:
+            lines.append(f'instagram_worker_up{{worker="{worker["worker"]}"}} {int(worker["alive"])}')
+        lines.append('# TYPE instagram_worker_restarts_total counter')
+        lines.append(f'instagram_worker_restarts_total {supervisor.restarts}')
+        outbound = supervisor.outbound_stats()
+    else:
+        runtime = get_bot_runtime()
+        lines.insert(0, api_metrics.render_prometheus().rstrip('\n'))
+        lines.append('# TYPE instagram_runtime_tasks gauge')
+        lines.append(f'instagram_runtime_tasks {runtime.active_count()}')
+        lines.append('# TYPE instagram_runtime_scheduled gauge')
+        lines.append(f'instagram_runtime_scheduled {runtime.scheduler.pending_count() if runtime.scheduler else 0}')
+        outbound = get_outbound_dispatcher().stats()
+    
+    lines.append('# TYPE instagram_outbound_queue_depth gauge')
+    lines.append(f"instagram_outbound_queue_depth {outbound['queue_depth']}")
+    lines.append('# TYPE instagram_outbound_in_flight gauge')
+    lines.append(f"instagram_outbound_in_flight {outbound['in_flight']}")
+    lines.append('# TYPE instagram_outbound_jobs_total counter')
+    for result in ('sent', 'deferred', 'failed', 'dropped'):
+        lines.append(f'instagram_outbound_jobs_total{{result="{result}"}} {outbound[result]}')
+    lines.append('# TYPE instagram_outbound_wait_seconds_max gauge')
+    lines.append(f"instagram_outbound_wait_seconds_max {outbound['max_wait_ms'] / 1000:.6f}")
+    # ردیف‌های صف پایدار ارسال به تفکیک وضعیت
+    lines.append('# TYPE instagram_outbound_messages gauge')
+    for state, count in outbound_queue_manager.count_by_state().items():
+        lines.append(f'instagram_outbound_messages{{state="{state}"}} {count}')
+    
+    try:
+        stats = message_manager.history_writer_stats()
+        lines.append('# TYPE instagram_history_queue_depth gauge')
+        lines.append(f"instagram_history_queue_depth {stats['queue_depth']}")
+        lines.append('# TYPE instagram_history_rows_written_total counter')
+        lines.append(f"instagram_history_rows_written_total {stats['rows_written']}")
+        lines.append('# TYPE instagram_history_failed_rows_total counter')
+        lines.append(f"instagram_history_failed_rows_total {stats['failed_rows']}")
+        lines.append('# TYPE instagram_history_retries_total counter')
+        lines.append(f"instagram_history_retries_total {stats['retries']}")
+        lines.append('# TYPE instagram_history_flush_seconds_max gauge')
+        lines.append(f"instagram_history_flush_seconds_max {stats['max_flush_ms'] / 1000:.6f}")
+    except Exception as e:
+        logger.error(f"خطا در دریافت آمار تاریخچه: {e}")
+    
+    return Response('\n'.join(lines) + '\n', mimetype='text/plain; version=0.0.4; charset=utf-8')
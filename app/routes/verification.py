@@ -1,5 +1,6 @@
 from flask import Blueprint, render_template, request, redirect, url_for, session, flash, jsonify
 from models import UserManager
+from bots.status_hub import status_hub
 from app import active_bots
 
 verification_bp = Blueprint('verification', __name__)
@@ -11,8 +12,8 @@ def api_verification_needed():
         return jsonify({'error': 'لطفاً ابتدا وارد شوید'}), 401
     
     verification_needed = {}
-    for account_id, bot_info in active_bots.items():
-        status = bot_info['bot'].get_verification_status()
+    for account_id, state in status_hub.snapshot(session['user_id']).items():
+        status = state['verification_status']
         verification_needed[account_id] = {
             'needs_verification': status['needs_verification'],
             'account_id': account_id,
@@ -65,13 +66,11 @@ def api_verification_status(account_id):
     if 'user_id' not in session:
         return jsonify({'error': 'لطفاً ابتدا وارد شوید'}), 401
     
-    if account_id not in active_bots:
+    state = status_hub.get(account_id, session['user_id'])
+    if state is None:
         return jsonify({'error': 'ربات پیدا نشد'}), 404
     
-    bot = active_bots[account_id]['bot']
-    status = bot.get_verification_status()
-    
-    return jsonify(status)
+    return jsonify(state['verification_status'])
 
 @verification_bp.route('/verification_modal/<int:account_id>')
 def verification_modal(account_id):
@@ -85,7 +84,7 @@ def verification_modal(account_id):
         return redirect(url_for('dashboard.dashboard'))
     
     user_manager = UserManager()
-    account_data = user_manager.get_account_credentials(account_id, session['user_id'])
+    account_data = user_manager.get_account_credentials(account_id, session['user_id'], include_session=False)
     
     if not account_data:
         flash('❌ حساب پیدا نشد!', 'error')
@@ -100,6 +99,8 @@ def verification_modal(account_id):
     
     return render_template('verification_modal.html', 
                          account=account_data,
+                         account_id=account_id,
+                         method=verification_status.get('method') or 'sms',
                          verification_status=verification_status)
 
 @verification_bp.route('/submit_verification_code/<int:account_id>', methods=['POST'])
@@ -0,0 +1,41 @@
+from concurrent.futures import wait
+from bots.status_hub import status_hub
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def get_bot_host():
+    """میزبان اجرای ربات‌ها: supervisor چندپردازشی یا runtime همین پردازش
+
+    با BOT_WORKER_PROCESSES=0 ربات‌ها مانند قبل داخل پردازش وب اجرا می‌شوند.
+    """
+    from bots.runtime import get_bot_runtime
+    from bots.supervisor import get_bot_supervisor
+    
+    supervisor = get_bot_supervisor()
+    return supervisor if supervisor.enabled else get_bot_runtime()
+
+
+def stop_active_bot(account_id: int, timeout: float = 5.0) -> bool:
+    """توقف ربات فعال یک حساب و حذف آن از active_bots"""
+    from app import active_bots
+    
+    bot_info = active_bots.get(account_id)
+    if not bot_info:
+        return False
+    
+    result = bot_info['bot'].stop_bot()
+    
+    # صبر کردن تا اجرای ربات روی runtime تمام شود
+    task = bot_info.get('task')
+    if task is not None and not task.done():
+        wait([task], timeout=timeout)
+        if not task.done():
+            logger.warning(f"ربات {account_id} در زمان مقرر متوقف نشد")
+    
+    if active_bots.get(account_id) is bot_info:
+        del active_bots[account_id]
+        status_hub.remove(account_id)
+    
+    return result
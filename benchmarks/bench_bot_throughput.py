@@ -0,0 +1,202 @@
+"""بنچمارک توان پردازش ربات با Client جعلی (بدون اتصال به اینستاگرام)
+
+حالت check: هر دور یک پیام در هر thread تزریق و check_new_messages تمام
+حساب‌ها پشت سر هم اجرا می‌شود.
+حالت loop: حلقه کامل process_messages هر حساب در thread خودش (یا با
+--runtime روی BotRuntime) اجرا می‌شود و یک تولیدکننده با نرخ ثابت پیام تزریق می‌کند.
+
+اجرا از ریشه مخزن:
+    python -m benchmarks.bench_bot_throughput --mode check --accounts 10 --threads 15
+    python -m benchmarks.bench_bot_throughput --mode loop --accounts 50 --rate 200 --runtime
+"""
+import argparse
+import logging
+import random
+import threading
+import time
+
+from benchmarks.common import enter_sandbox, percentile
+
+MESSAGE_TEXTS = ["1", "2", "3", "سلام", "خداحافظ"]
+
+
+def setup_accounts(accounts: int):
+    """ساخت یک کاربر و حساب‌های اینستاگرام او در دیتابیس‌های sandbox"""
+    from models import user_manager, message_manager
+
+    user_manager.create_user("bench", "bench")
+    user_id = user_manager.verify_user("bench", "bench")["id"]
+    message_manager.add_default_messages(user_id)
+    usernames = [f"bench_account_{index}" for index in range(accounts)]
+    for username in usernames:
+        user_manager.add_instagram_account(user_id, username, "password")
+    return user_id, usernames
+
+
+def configure_fast_limits():
+    """برداشتن سقف نرخ تا فقط هزینه خود ربات اندازه‌گیری شود"""
+    from bots.rate_limiter import rate_limiter
+
+    for prefix in ("account", "pace", "egress"):
+        rate_limiter.set_default(prefix, 1e6, 1000)
+
+
+def make_bot(username: str, user_id: int, poll_interval: float):
+    from bots.instagram_bot import InstagramBot
+
+    bot = InstagramBot(username, "password", user_id)
+    bot.human_delay_range = (0, 0)
+    bot.login_delay_range = (0, 0)
+    bot.reply_delay_range = (0, 0)
+    bot.cache_expiry = 0
+    bot.min_sleep_duration = poll_interval
+    bot.max_sleep_duration = poll_interval
+    bot.sleep_duration = poll_interval
+    return bot
+
+
+def run_check_mode(world, bots, usernames, rounds: int, threads: int):
+    from bots.outbound import get_outbound_dispatcher
+
+    dispatcher = get_outbound_dispatcher()
+    started = time.perf_counter()
+    for _ in range(rounds):
+        for username in usernames:
+            for thread_index in range(threads):
+                world.push_incoming(username, thread_index, random.choice(MESSAGE_TEXTS))
+        for bot in bots:
+            bot.check_new_messages()
+        # پاسخ‌ها در صف ارسال مشترک فرستاده می‌شوند
+        dispatcher.join(timeout=30)
+    return time.perf_counter() - started
+
+
+def run_loop_mode(world, bots, usernames, threads: int, rate: float, duration: float,
+                  use_runtime: bool, drain: float):
+    stop_producer = threading.Event()
+
+    def produce():
+        interval = 1.0 / rate
+        next_at = time.perf_counter()
+        while not stop_producer.is_set():
+            world.push_incoming(random.choice(usernames), random.randrange(threads),
+                                random.choice(MESSAGE_TEXTS))
+            next_at += interval
+            delay = next_at - time.perf_counter()
+            if delay > 0:
+                stop_producer.wait(delay)
+
+    if use_runtime:
+        from bots.runtime import BotRuntime
+
+        runtime = BotRuntime()
+        futures = [runtime.submit(index, bot) for index, bot in enumerate(bots)]
+    else:
+        workers = [threading.Thread(target=bot.process_messages, daemon=True) for bot in bots]
+        for worker in workers:
+            worker.start()
+
+    producer = threading.Thread(target=produce, daemon=True)
+    started = time.perf_counter()
+    producer.start()
+    time.sleep(duration)
+    stop_producer.set()
+    producer.join()
+    # فرصت پاسخ به پیام‌های باقیمانده
+    deadline = time.perf_counter() + drain
+    while world.unanswered() and time.perf_counter() < deadline:
+        time.sleep(0.05)
+    elapsed = time.perf_counter() - started
+
+    for bot in bots:
+        bot.stop_event.set()
+    if use_runtime:
+        for future in futures:
+            try:
+                future.result(timeout=10)
+            except Exception:
+                pass
+        runtime.shutdown()
+    else:
+        for worker in workers:
+            worker.join(timeout=10)
+    return elapsed
+
+
+def report(world, elapsed: float):
+    latencies = world.reply_latencies
+    total_calls = sum(world.calls.values())
+    replied = len(latencies)
+    print(f"پیام‌های تزریق‌شده: {world.injected:,}   پاسخ‌داده‌شده: {replied:,}   "
+          f"بی‌پاسخ: {world.unanswered():,}   ارسال‌ها: {world.replies:,}")
+    print(f"زمان: {elapsed:.2f}s   توان: {replied / elapsed if elapsed else 0:.1f} پیام/ثانیه")
+    print(f"درخواست‌های API: {total_calls:,}   به ازای هر پاسخ: "
+          f"{total_calls / world.replies if world.replies else float('nan'):.2f}")
+    for endpoint, count in sorted(world.calls.items()):
+        print(f"    {endpoint:<26}{count:>10,}")
+    if world.errors:
+        print("خطاهای تزریق‌شده: " + ", ".join(f"{k}={v}" for k, v in sorted(world.errors.items())))
+    from bots.outbound import get_outbound_dispatcher
+
+    outbound = get_outbound_dispatcher().stats()
+    print(f"صف ارسال: ارسال={outbound['sent']:,}  خطا={outbound['failed']:,}  "
+          f"باقیمانده={outbound['queue_depth']:,}  بیشترین انتظار={outbound['max_wait_ms']:.1f}ms")
+    if latencies:
+        print(f"تأخیر پاسخ: p50={percentile(latencies, 50) * 1000:.1f}ms  "
+              f"p99={percentile(latencies, 99) * 1000:.1f}ms  max={max(latencies) * 1000:.1f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mode", choices=("check", "loop"), default="check")
+    parser.add_argument("--accounts", type=int, default=10, help="تعداد حساب‌ها (N)")
+    parser.add_argument("--threads", type=int, default=15, help="تعداد threadهای هر حساب (M)")
+    parser.add_argument("--rounds", type=int, default=20, help="تعداد دورها در حالت check")
+    parser.add_argument("--rate", type=float, default=50.0, help="نرخ ورود پیام در حالت loop (پیام/ثانیه)")
+    parser.add_argument("--duration", type=float, default=10.0, help="مدت تزریق پیام در حالت loop (ثانیه)")
+    parser.add_argument("--drain", type=float, default=5.0, help="حداکثر انتظار برای پیام‌های بی‌پاسخ پس از تزریق")
+    parser.add_argument("--poll-interval", type=float, default=0.2, help="فاصله بررسی inbox در حالت loop")
+    parser.add_argument("--runtime", action="store_true", help="اجرای حالت loop روی BotRuntime")
+    parser.add_argument("--latency", type=float, default=0.0, help="تأخیر هر درخواست API (ثانیه)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="احتمال خطای سرور در هر درخواست")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="احتمال پاسخ 429 در هر درخواست")
+    parser.add_argument("--real-limits", action="store_true", help="استفاده از محدودیت‌های نرخ واقعی")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.ERROR)
+    random.seed(args.seed)
+    workdir = enter_sandbox("bench_bot_")
+
+    import bots.instagram_bot
+    from benchmarks.fake_client import FakeClient, FakeInstagram
+
+    world = FakeInstagram(threads_per_account=args.threads)
+    FakeClient.configure(world, latency=args.latency, error_rate=args.error_rate,
+                         rate_limit_rate=args.rate_limit_rate, seed=args.seed)
+    bots.instagram_bot.Client = FakeClient
+    if not args.real_limits:
+        configure_fast_limits()
+
+    user_id, usernames = setup_accounts(args.accounts)
+    bot_list = [make_bot(username, user_id, args.poll_interval) for username in usernames]
+    print(f"پوشه کاری: {workdir}")
+    print(f"حالت {args.mode}: {args.accounts} حساب × {args.threads} thread\n")
+
+    if args.mode == "check":
+        for bot in bot_list:
+            bot.login()
+        world.reset_stats()
+        elapsed = run_check_mode(world, bot_list, usernames, args.rounds, args.threads)
+    else:
+        elapsed = run_loop_mode(world, bot_list, usernames, args.threads, args.rate, args.duration,
+                                args.runtime, args.drain)
+
+    for bot in bot_list:
+        bot.message_manager.flush_history()
+    report(world, elapsed)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,225 @@
+"""بنچمارک کوئری‌های message_history و bot_status با و بدون ایندکس‌های migration
+
+صفحه تاریخچه با همان کوئری keyset تولید get_message_history_page اندازه‌گیری
+می‌شود (صفحه اول، صفحه عمیق با cursor و فیلتر thread)؛ حالت پایه تمام
+ایندکس‌های keyset تاریخچه را حذف می‌کند.
+
+اجرا از ریشه مخزن:
+    python -m benchmarks.bench_db_queries --rows 1000000
+"""
+import argparse
+import random
+import sqlite3
+import time
+from datetime import datetime, timedelta
+
+from benchmarks.common import enter_sandbox, format_latency, measure
+
+
+# ایندکس‌هایی که کوئری صفحه تاریخچه می‌تواند از آن‌ها استفاده کند
+HISTORY_INDEXES = ("idx_history_user_keyset", "idx_history_account_keyset",
+                   "idx_history_thread_keyset", "idx_history_key_keyset")
+
+# عمق صفحه‌ای که cursor آن برای اندازه‌گیری صفحه عمیق استفاده می‌شود
+DEEP_PAGE = 200
+
+REPLY_TABLE_QUERY = '''
+    SELECT id, key, content, start_date, end_date, key_type, match_mode, priority, created_at
+    FROM messages
+    WHERE user_id = ? AND is_active = TRUE
+    ORDER BY created_at DESC, id DESC
+'''
+
+STATUS_QUERY = '''
+    SELECT status, error_message, last_activity, updated_at
+    FROM bot_status WHERE account_id = ? AND user_id = ?
+'''
+
+
+def insert_history(conn, batch):
+    conn.executemany('''
+        INSERT INTO message_history (user_id, account_id, message_key, thread_id, user_instagram_id, sent_at)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', batch)
+
+
+def populate_history(db_path: str, rows: int, users: int):
+    conn = sqlite3.connect(db_path)
+    start = datetime.now() - timedelta(days=90)
+    batch = []
+    for i in range(rows):
+        sent_at = (start + timedelta(seconds=i * 7776000 // max(rows, 1))).strftime('%Y-%m-%d %H:%M:%S')
+        user_id = random.randint(1, users)
+        batch.append((user_id, user_id * 10 + random.randint(0, 4), str(random.randint(1, 3)),
+                      f"thread_{i % 20000}", str(random.randint(10 ** 9, 10 ** 10)), sent_at))
+        if len(batch) >= 50000:
+            insert_history(conn, batch)
+            batch = []
+    if batch:
+        insert_history(conn, batch)
+    conn.commit()
+    conn.close()
+
+
+def explain(conn, query, params) -> str:
+    plan = conn.execute("EXPLAIN QUERY PLAN " + query, params).fetchall()
+    return "\n".join(f"      {row[-1]}" for row in plan)
+
+
+def report(title, conn, query, params, iterations):
+    print(f"  {title}")
+    print(explain(conn, query, params))
+    print(f"      {format_latency(measure(lambda: conn.execute(query, params).fetchall(), iterations))}")
+
+
+def deep_cursor(message_manager, user_id: int) -> str:
+    """cursor صفحه DEEP_PAGE با پیمایش صفحه به صفحه"""
+    cursor = None
+    for _ in range(DEEP_PAGE):
+        page = message_manager.get_message_history_page(user_id, cursor=cursor)
+        if not page["next_cursor"]:
+            break
+        cursor = page["next_cursor"]
+    return cursor
+
+
+def report_history(conn, message_manager, user_id: int, cursor: str, thread_id: str, iterations: int):
+    """کوئری‌های صفحه تاریخچه همان‌طور که get_message_history_page می‌سازد"""
+    from models.message_manager import HISTORY_PAGE_SIZE, build_history_page_query
+
+    cases = [
+        ("صفحه اول تاریخچه", {}),
+        (f"صفحه {DEEP_PAGE} تاریخچه (cursor)", {"cursor": cursor}),
+        ("صفحه اول تاریخچه یک thread", {"thread_id": thread_id}),
+    ]
+    for title, filters in cases:
+        query, params = build_history_page_query(user_id, HISTORY_PAGE_SIZE, **filters)
+        report(title, conn, query, params, iterations)
+        page = lambda: message_manager.get_message_history_page(user_id, **filters)
+        print(f"      get_message_history_page: {format_latency(measure(page, iterations))}")
+
+
+def report_reply_edits(message_manager, keys: int, iterations: int):
+    """هزینه ویرایش یک پیام تا پاسخ بعدی: اعمال روی جدول کش‌شده در برابر ساخت دوباره کل جدول"""
+    from models.reply_table import reply_cache
+
+    user_id = 1000000
+    conn = sqlite3.connect(message_manager.db_path)
+    conn.executemany(
+        "INSERT INTO messages (user_id, key, content, key_type, match_mode) VALUES (?, ?, ?, 'text', 'contains')",
+        [(user_id, f"کلید {index} محصول", f"پاسخ {index}") for index in range(keys)],
+    )
+    conn.commit()
+    message_keys = dict(conn.execute("SELECT id, key FROM messages WHERE user_id = ?", (user_id,)))
+    message_ids = list(message_keys)
+    conn.close()
+    message_manager.invalidate_replies(user_id)
+    message_manager.get_message(user_id, "سلام")
+
+    def edit(rename: bool, rebuild: bool = False):
+        message_id = random.choice(message_ids)
+        if rename:
+            message_keys[message_id] = f"کلید {message_id} ویرایش {random.random()}"
+        key = message_keys[message_id]
+        message_manager.update_message(message_id, user_id, key, f"پاسخ تازه {random.random()}",
+                                       "text", match_mode="contains")
+        if rebuild:
+            message_manager.invalidate_replies(user_id)
+        # اولین پیام پس از ویرایش هزینه بارگذاری یا محاسبه پیوندهای شکست را می‌پردازد
+        message_manager.get_message(user_id, "قیمت کلید 12 محصول چنده؟")
+
+    print(f"\nویرایش یک پیام با {keys:,} کلید متنی تا پاسخ بعدی:")
+    print(f"      تغییر متن پاسخ (روی جدول کش‌شده): {format_latency(measure(lambda: edit(False), iterations))}")
+    print(f"      تغییر کلید (روی جدول کش‌شده): {format_latency(measure(lambda: edit(True), iterations))}")
+    print(f"      ساخت دوباره کل جدول: {format_latency(measure(lambda: edit(True, True), max(5, iterations // 10)))}")
+
+
+def legacy_status_write(conn, account_id, user_id):
+    """مسیر قدیمی: SELECT و سپس UPDATE یا INSERT"""
+    cursor = conn.cursor()
+    cursor.execute("SELECT id FROM bot_status WHERE account_id = ? AND user_id = ?", (account_id, user_id))
+    if cursor.fetchone():
+        cursor.execute('''
+            UPDATE bot_status SET status = ?, error_message = ?, updated_at = ?, last_activity = ?
+            WHERE account_id = ? AND user_id = ?
+        ''', ('running', None, datetime.now(), datetime.now(), account_id, user_id))
+    else:
+        cursor.execute('''
+            INSERT INTO bot_status (account_id, user_id, status, error_message, last_activity)
+            VALUES (?, ?, ?, ?, ?)
+        ''', (account_id, user_id, 'running', None, datetime.now()))
+    conn.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=1000000, help="تعداد ردیف‌های message_history")
+    parser.add_argument("--users", type=int, default=200, help="تعداد کاربران")
+    parser.add_argument("--accounts", type=int, default=5000, help="تعداد ردیف‌های bot_status")
+    parser.add_argument("--reply-keys", type=int, default=5000, help="تعداد کلیدهای متنی برای ویرایش پیام")
+    parser.add_argument("--iterations", type=int, default=200)
+    args = parser.parse_args()
+
+    workdir = enter_sandbox("bench_db_")
+    from models.bot_manager import BotManager
+    from models.database import close_connections
+    from models.message_manager import MessageManager
+
+    message_manager = MessageManager("messages.db")
+    bot_manager = BotManager("bot_status.db")
+    for user_id in range(1, args.users + 1):
+        message_manager.add_default_messages(user_id)
+
+    print(f"پوشه کاری: {workdir}")
+    started = time.perf_counter()
+    populate_history("messages.db", args.rows, args.users)
+    print(f"درج {args.rows:,} ردیف تاریخچه: {time.perf_counter() - started:.1f}s\n")
+
+    conn = sqlite3.connect("messages.db")
+    conn.execute("ANALYZE")
+    user_id = random.randint(1, args.users)
+
+    thread_id = conn.execute(
+        "SELECT thread_id FROM message_history WHERE user_id = ? LIMIT 1", (user_id,)
+    ).fetchone()[0]
+    cursor = deep_cursor(message_manager, user_id)
+
+    print("با ایندکس‌های migration:")
+    report_history(conn, message_manager, user_id, cursor, thread_id, args.iterations)
+    report("بارگذاری جدول پاسخ", conn, REPLY_TABLE_QUERY, (user_id,), args.iterations)
+
+    for index in HISTORY_INDEXES:
+        conn.execute(f"DROP INDEX IF EXISTS {index}")
+    conn.execute("DROP INDEX idx_messages_user_active")
+    # اتصال‌های تازه تا statement‌های کش‌شده با schema قبلی استفاده نشوند
+    conn.close()
+    close_connections()
+    conn = sqlite3.connect("messages.db")
+    print("\nبدون ایندکس (schema قبلی):")
+    report_history(conn, message_manager, user_id, cursor, thread_id, max(5, args.iterations // 20))
+    report("بارگذاری جدول پاسخ", conn, REPLY_TABLE_QUERY, (user_id,), args.iterations)
+    conn.close()
+
+    report_reply_edits(message_manager, args.reply_keys, args.iterations)
+
+    # وضعیت ربات: UPSERT با ایندکس یکتا در برابر SELECT+UPDATE بدون ایندکس
+    for account_id in range(1, args.accounts + 1):
+        bot_manager.update_bot_status(account_id, 1, "stopped")
+    status_conn = sqlite3.connect("bot_status.db")
+    target = random.randint(1, args.accounts)
+
+    print("\nbot_status:")
+    report("خواندن وضعیت (با ایندکس)", status_conn, STATUS_QUERY, (target, 1), args.iterations)
+    print(f"      UPSERT: {format_latency(measure(lambda: bot_manager.update_bot_status(target, 1, 'running'), args.iterations))}")
+
+    status_conn.execute("DROP INDEX idx_bot_status_account_user")
+    status_conn.execute("DROP INDEX idx_bot_status_user_updated")
+    status_conn.close()
+    status_conn = sqlite3.connect("bot_status.db")
+    report("خواندن وضعیت (بدون ایندکس)", status_conn, STATUS_QUERY, (target, 1), args.iterations)
+    print(f"      SELECT+UPDATE: {format_latency(measure(lambda: legacy_status_write(status_conn, target, 1), args.iterations))}")
+    status_conn.close()
+
+
+if __name__ == "__main__":
+    main()
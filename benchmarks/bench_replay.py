@@ -0,0 +1,179 @@
+"""بنچمارک بازپخش ترافیک ضبط‌شده روی چند ربات (بدون اتصال به اینستاگرام)
+
+trace ساخته‌شده با benchmarks/traffic_trace.py با سرعت 1× تا 100× بازپخش
+می‌شود. هر ربات یکی از حساب‌های trace را (به صورت چرخشی) می‌گیرد و حلقه
+کامل process_messages در thread خودش (یا با --runtime روی BotRuntime) اجرا
+می‌شود. خروجی: زمان CPU، حافظه، تعداد دستورات SQL و فراخوانی‌های API به
+ازای هر پیام مشتری.
+
+اجرا از ریشه مخزن:
+    python -m benchmarks.bench_replay --trace trace.jsonl.gz --bots 20 --speed 10
+"""
+import argparse
+import logging
+import os
+import resource
+import threading
+import time
+import tracemalloc
+from collections import Counter
+
+from benchmarks.common import enter_sandbox
+
+
+class StatementCounter:
+    """شمارش دستورات SQL اجراشده روی تمام اتصال‌های models.database"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counts: Counter = Counter()
+
+    def __call__(self, statement: str):
+        text = statement.lstrip()
+        # دستورات داخل trigger با "-- TRIGGER" گزارش می‌شوند
+        verb = "TRIGGER" if text.startswith("--") else text.split(None, 1)[0].upper() if text else "?"
+        with self.lock:
+            self.counts[verb] += 1
+
+    def install(self):
+        """ثبت callback روی اتصال‌های موجود thread فعلی و تمام اتصال‌های بعدی"""
+        from models import database
+
+        for conn in database._connections().values():
+            conn.set_trace_callback(self)
+        open_connection = database._open_connection
+
+        def open_counted(db_path):
+            conn = open_connection(db_path)
+            conn.set_trace_callback(self)
+            return conn
+
+        database._open_connection = open_counted
+
+    def reset(self):
+        with self.lock:
+            self.counts.clear()
+
+    def total(self) -> int:
+        with self.lock:
+            return sum(self.counts.values())
+
+
+def run_bots(bots, replay, use_runtime: bool, drain: float):
+    from bots.outbound import get_outbound_dispatcher
+
+    if use_runtime:
+        from bots.runtime import BotRuntime
+
+        runtime = BotRuntime()
+        futures = [runtime.submit(index, bot) for index, bot in enumerate(bots)]
+    else:
+        workers = [threading.Thread(target=bot.process_messages, daemon=True) for bot in bots]
+        for worker in workers:
+            worker.start()
+
+    while not replay.finished:
+        time.sleep(0.1)
+    # فرصت ارسال پاسخ‌های آخرین پیام‌های trace
+    time.sleep(drain)
+    get_outbound_dispatcher().join(timeout=drain)
+
+    for bot in bots:
+        bot.stop_event.set()
+    if use_runtime:
+        for future in futures:
+            try:
+                future.result(timeout=10)
+            except Exception:
+                pass
+        runtime.shutdown()
+    else:
+        for worker in workers:
+            worker.join(timeout=10)
+
+
+def report(trace, replay, usernames, statements: StatementCounter, elapsed: float, cpu: float,
+           peak_rss_kb: int, traced_peak: int):
+    stats = replay.stats
+    messages = sum(trace.customer_messages(replay.assignments[username]) for username in usernames)
+    api_calls = sum(stats.calls.values())
+    sql = statements.total()
+
+    def per_message(value: float) -> str:
+        return f"{value / messages:.2f}" if messages else "nan"
+
+    print(f"trace: {trace.duration:.1f}s با سرعت {replay.speed:g}×   ربات‌ها: {len(usernames)}   "
+          f"حساب‌های trace: {len(trace.accounts)}")
+    print(f"پیام‌های مشتری: {messages:,}   ارسال‌ها: {stats.sends:,}   زمان: {elapsed:.2f}s")
+    print(f"CPU: {cpu:.2f}s ({cpu / elapsed * 100 if elapsed else 0:.0f}% یک هسته)   "
+          f"به ازای هر پیام: {per_message(cpu * 1000)}ms")
+    print(f"حافظه: بیشینه RSS={peak_rss_kb / 1024:.1f}MB" +
+          (f"   بیشینه tracemalloc={traced_peak / 1024 / 1024:.1f}MB" if traced_peak else ""))
+    print(f"دستورات SQL: {sql:,}   به ازای هر پیام: {per_message(sql)}")
+    for verb, count in sorted(statements.counts.items(), key=lambda item: -item[1]):
+        print(f"    {verb:<26}{count:>10,}")
+    print(f"درخواست‌های API: {api_calls:,}   به ازای هر پیام: {per_message(api_calls)}")
+    for method, count in sorted(stats.calls.items()):
+        extra = []
+        if stats.errors.get(method):
+            extra.append(f"خطا: {stats.errors[method]:,}")
+        if stats.misses.get(method):
+            extra.append(f"بدون رکورد: {stats.misses[method]:,}")
+        print(f"    {method:<26}{count:>10,}" + (f"   {'  '.join(extra)}" if extra else ""))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--trace", required=True, help="مسیر فایل trace")
+    parser.add_argument("--bots", type=int, default=10, help="تعداد ربات‌ها")
+    parser.add_argument("--speed", type=float, default=10.0, help="سرعت بازپخش (1 تا 100)")
+    parser.add_argument("--poll-interval", type=float, default=0.5, help="فاصله بررسی inbox (ثانیه)")
+    parser.add_argument("--drain", type=float, default=2.0, help="انتظار پس از پایان trace (ثانیه)")
+    parser.add_argument("--runtime", action="store_true", help="اجرای ربات‌ها روی BotRuntime")
+    parser.add_argument("--no-latency", action="store_true", help="بدون بازپخش تأخیر ضبط‌شده API")
+    parser.add_argument("--real-limits", action="store_true", help="استفاده از محدودیت‌های نرخ واقعی")
+    parser.add_argument("--tracemalloc", action="store_true", help="اندازه‌گیری بیشینه حافظه Python (کندتر)")
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.ERROR)
+    trace_path = os.path.abspath(args.trace)
+    workdir = enter_sandbox("bench_replay_")
+    statements = StatementCounter()
+    statements.install()
+
+    import bots.instagram_bot
+    from benchmarks.bench_bot_throughput import configure_fast_limits, make_bot, setup_accounts
+    from benchmarks.traffic_trace import ReplayClient, Trace, TraceReplay
+
+    trace = Trace(trace_path)
+    replay = TraceReplay(trace, speed=args.speed, replay_latency=not args.no_latency)
+    if not args.real_limits:
+        configure_fast_limits()
+
+    user_id, usernames = setup_accounts(args.bots)
+    replay.assign(usernames)
+    ReplayClient.configure(replay)
+    bots.instagram_bot.Client = ReplayClient
+    bot_list = [make_bot(username, user_id, args.poll_interval) for username in usernames]
+    print(f"پوشه کاری: {workdir}\n")
+
+    if args.tracemalloc:
+        tracemalloc.start()
+    replay.start()
+    statements.reset()
+    cpu_started = time.process_time()
+    started = time.perf_counter()
+    run_bots(bot_list, replay, args.runtime, args.drain)
+    for bot in bot_list:
+        bot.message_manager.flush_history()
+    elapsed = time.perf_counter() - started
+    cpu = time.process_time() - cpu_started
+    traced_peak = tracemalloc.get_traced_memory()[1] if args.tracemalloc else 0
+
+    report(trace, replay, usernames, statements, elapsed, cpu,
+           resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, traced_peak)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+"""بنچمارک زمان راه‌اندازی سرد create_app و گزارش import (مانند python -X importtime)
+
+هر اجرا یک پردازش تازه Python با -X importtime است که create_app() را
+می‌سازد. دیتابیس‌ها پیش از اجراهای زمان‌دار یک بار در پوشه موقت مشترک ساخته
+می‌شوند تا ساخت جدول‌ها، migrationها و hash رمز مدیر پیش‌فرض در اولین اجرا
+جزو زمان import و create_app حساب نشوند. گزارش: میانه زمان create_app،
+ماژول‌های پرهزینه بر اساس زمان تجمعی و خود ماژول، و ماژول‌های سنگین ربات
+(instagrapi و ...) که نباید پیش از شروع اولین ربات بارگذاری شوند.
+
+اجرا از ریشه مخزن:
+    python -m benchmarks.bench_startup --runs 5
+    python -m benchmarks.bench_startup --check --target-ms 500
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+from collections import defaultdict
+from typing import Dict, List, Tuple
+
+from benchmarks.common import REPO_ROOT
+
+# هدف پیش‌فرض زمان import و create_app در پردازش تازه با دیتابیس‌های موجود (میلی‌ثانیه)
+STARTUP_TARGET_MS = float(os.environ.get('BENCH_STARTUP_TARGET_MS', '500'))
+
+# ماژول‌هایی که پردازش وب تا شروع اولین ربات نباید بارگذاری کند
+HEAVY_MODULES = ("instagrapi", "pydantic", "requests", "bots.instagram_bot")
+
+PROBE = """
+import json, sys, time
+started = time.perf_counter()
+from app import create_app
+create_app()
+elapsed = time.perf_counter() - started
+print(json.dumps({
+    "create_app_ms": elapsed * 1000,
+    "loaded": [name for name in %r if name in sys.modules],
+}))
+""" % (HEAVY_MODULES,)
+
+
+def parse_importtime(stderr: str) -> List[Tuple[str, int, int]]:
+    """خواندن سطرهای «import time: self | cumulative | name» به صورت (نام، self، cumulative) میکروثانیه"""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        parts = line[len("import time:"):].split("|")
+        if len(parts) != 3:
+            continue
+        self_us, cumulative_us, name = (part.strip() for part in parts)
+        if not self_us.isdigit():
+            # سطر عنوان جدول
+            continue
+        rows.append((name, int(self_us), int(cumulative_us)))
+    return rows
+
+
+def prepare_workdir() -> str:
+    """ساخت دیتابیس‌ها در پوشه موقت با یک اجرای بدون زمان‌گیری"""
+    workdir = tempfile.mkdtemp(prefix="bench_startup_")
+    run_probe(workdir)
+    return workdir
+
+
+def run_probe(workdir: str) -> Tuple[Dict, List[Tuple[str, int, int]]]:
+    """اجرای create_app در پردازش تازه تا کش‌های import پردازش قبلی اثری نداشته باشند"""
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [REPO_ROOT, env.get("PYTHONPATH")]))
+    # پردازش‌های worker در این اندازه‌گیری ساخته نمی‌شوند
+    env.setdefault("BOT_WORKER_PROCESSES", "0")
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", PROBE],
+        cwd=workdir, env=env, capture_output=True, text=True,
+    )
+    if completed.returncode != 0:
+        sys.stderr.write(completed.stderr[-4000:])
+        raise SystemExit(f"اجرای create_app با کد {completed.returncode} شکست خورد")
+    result = json.loads(completed.stdout.strip().splitlines()[-1])
+    return result, parse_importtime(completed.stderr)
+
+
+def report(results: List[Dict], imports: List[List[Tuple[str, int, int]]], top: int):
+    create_ms = [result["create_app_ms"] for result in results]
+    print(f"create_app: میانه={statistics.median(create_ms):.1f}ms  "
+          f"کمینه={min(create_ms):.1f}ms  بیشینه={max(create_ms):.1f}ms  ({len(results)} اجرا)")
+
+    # میانه زمان هر ماژول بین اجراها
+    self_times: Dict[str, List[int]] = defaultdict(list)
+    cumulative_times: Dict[str, List[int]] = defaultdict(list)
+    for rows in imports:
+        for name, self_us, cumulative_us in rows:
+            self_times[name].append(self_us)
+            cumulative_times[name].append(cumulative_us)
+    print(f"ماژول‌های بارگذاری‌شده: {len(self_times):,}")
+
+    print("\nبیشترین زمان تجمعی (میکروثانیه):")
+    ranked = sorted(cumulative_times, key=lambda name: -statistics.median(cumulative_times[name]))
+    for name in ranked[:top]:
+        print(f"    {statistics.median(cumulative_times[name]):>10,.0f}  {name.strip()}")
+    print("\nبیشترین زمان خود ماژول (میکروثانیه):")
+    ranked = sorted(self_times, key=lambda name: -statistics.median(self_times[name]))
+    for name in ranked[:top]:
+        print(f"    {statistics.median(self_times[name]):>10,.0f}  {name.strip()}")
+
+    loaded = sorted({name for result in results for name in result["loaded"]})
+    print(f"\nماژول‌های سنگین بارگذاری‌شده: {', '.join(loaded) if loaded else 'هیچ'}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5, help="تعداد اجراهای زمان‌دار")
+    parser.add_argument("--top", type=int, default=15, help="تعداد ماژول‌های گزارش‌شده")
+    parser.add_argument("--check", action="store_true",
+                        help="خروج با خطا اگر میانه از هدف بیشتر باشد یا ماژول سنگینی بارگذاری شده باشد")
+    parser.add_argument("--target-ms", type=float, default=STARTUP_TARGET_MS, help="هدف زمان create_app")
+    args = parser.parse_args()
+
+    workdir = prepare_workdir()
+    results = []
+    imports = []
+    try:
+        for _ in range(max(1, args.runs)):
+            result, rows = run_probe(workdir)
+            results.append(result)
+            imports.append(rows)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    report(results, imports, args.top)
+
+    if args.check:
+        median_ms = statistics.median(result["create_app_ms"] for result in results)
+        loaded = sorted({name for result in results for name in result["loaded"]})
+        failures = []
+        if median_ms > args.target_ms:
+            failures.append(f"میانه create_app {median_ms:.1f}ms بیشتر از هدف {args.target_ms:.0f}ms است")
+        if loaded:
+            failures.append(f"ماژول‌های سنگین پیش از شروع ربات بارگذاری شدند: {', '.join(loaded)}")
+        for failure in failures:
+            print(f"شکست: {failure}")
+        if failures:
+            raise SystemExit(1)
+        print(f"\nقبول: میانه {median_ms:.1f}ms ≤ {args.target_ms:.0f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+import os
+import statistics
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, List
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def enter_sandbox(prefix: str = "bench_") -> str:
+    """رفتن به یک پوشه موقت تا دیتابیس‌های پیش‌فرض models در مخزن ساخته نشوند
+
+    باید قبل از import کردن models فراخوانی شود، چون models/__init__ نمونه‌های
+    سراسری را با مسیرهای نسبی users.db و messages.db می‌سازد.
+    """
+    if REPO_ROOT not in sys.path:
+        sys.path.insert(0, REPO_ROOT)
+    workdir = tempfile.mkdtemp(prefix=prefix)
+    os.chdir(workdir)
+    return workdir
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    """محاسبه صدک از نمونه‌ها"""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100 * (len(ordered) - 1)))))
+    return ordered[index]
+
+
+def measure(func: Callable[[], object], iterations: int) -> Dict[str, float]:
+    """اجرای تابع به تعداد مشخص و گزارش تأخیر بر حسب میلی‌ثانیه"""
+    samples = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - started) * 1000)
+    return {
+        "p50_ms": percentile(samples, 50),
+        "p99_ms": percentile(samples, 99),
+        "mean_ms": statistics.fmean(samples) if samples else 0.0,
+    }
+
+
+def format_latency(stats: Dict[str, float]) -> str:
+    return f"p50={stats['p50_ms']:.3f}ms  p99={stats['p99_ms']:.3f}ms  mean={stats['mean_ms']:.3f}ms"
@@ -0,0 +1,246 @@
+"""Client جعلی instagrapi برای اجرای آفلاین ربات در بنچمارک‌ها
+
+FakeClient همان متدهایی از instagrapi.Client را پیاده می‌کند که InstagramBot
+استفاده می‌کند. تمام حساب‌ها یک FakeInstagram مشترک دارند که inbox هر حساب،
+شمارنده درخواست‌ها و تأخیر پاسخ هر پیام را نگه می‌دارد.
+
+استفاده:
+    world = FakeInstagram(threads_per_account=50)
+    FakeClient.configure(world, latency=0.05, error_rate=0.01)
+    bots.instagram_bot.Client = FakeClient
+"""
+import itertools
+import random
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from instagrapi.exceptions import ClientError, LoginRequired
+
+
+class FakeUser:
+    def __init__(self, pk: str, username: str):
+        self.pk = pk
+        self.username = username
+        self.full_name = username
+
+
+class FakeMessage:
+    def __init__(self, item_id: str, user_id: str, text: str, timestamp: datetime):
+        self.id = item_id
+        self.user_id = user_id
+        self.text = text
+        self.timestamp = timestamp
+        self.item_type = "text"
+
+
+class FakeThread:
+    def __init__(self, thread_id: str, users: List[FakeUser], messages: List[FakeMessage],
+                 last_activity_at: datetime):
+        self.id = thread_id
+        self.pk = thread_id
+        self.users = users
+        # مانند instagrapi جدیدترین پیام اول است
+        self.messages = messages
+        self.last_activity_at = last_activity_at
+
+
+class FakeInbox:
+    """inbox یک حساب: threadها و پیام‌های در انتظار پاسخ"""
+
+    def __init__(self, username: str, user_id: str, threads: int):
+        self.username = username
+        self.user_id = user_id
+        self.threads: Dict[str, Dict] = {}
+        for index in range(threads):
+            thread_id = f"{username}-t{index}"
+            customer = FakeUser(f"{abs(hash(thread_id)) % 10 ** 10}", f"customer_{index}")
+            # هر thread با یک پیام قدیمی از خود حساب شروع می‌شود، مانند inbox واقعی
+            opened_at = datetime.now() - timedelta(days=2, seconds=index)
+            self.threads[thread_id] = {
+                "customer": customer,
+                "messages": [FakeMessage(f"{thread_id}-0", user_id, "welcome", opened_at)],
+                "last_activity_at": opened_at,
+                # زمان ورود پیام‌هایی که هنوز پاسخ نگرفته‌اند
+                "pending": [],
+            }
+
+
+class FakeInstagram:
+    """وضعیت مشترک سرور جعلی برای تمام FakeClientها"""
+
+    def __init__(self, threads_per_account: int = 20, messages_per_thread: int = 20):
+        self.threads_per_account = threads_per_account
+        # تعداد پیام‌هایی از هر thread که در payload لیست inbox برگردانده می‌شود
+        self.messages_per_thread = messages_per_thread
+        self.lock = threading.Lock()
+        self.inboxes: Dict[str, FakeInbox] = {}
+        self.calls: Counter = Counter()
+        self.errors: Counter = Counter()
+        self.reply_latencies: List[float] = []
+        self.replies = 0
+        self.injected = 0
+        self._item_ids = itertools.count(1)
+        self._user_ids = itertools.count(10 ** 9)
+
+    def inbox(self, username: str) -> FakeInbox:
+        with self.lock:
+            inbox = self.inboxes.get(username)
+            if inbox is None:
+                inbox = FakeInbox(username, str(next(self._user_ids)), self.threads_per_account)
+                self.inboxes[username] = inbox
+            return inbox
+
+    def push_incoming(self, username: str, thread_index: int, text: str) -> str:
+        """ورود پیام جدید از مشتری به یکی از threadهای حساب"""
+        inbox = self.inbox(username)
+        thread_id = f"{username}-t{thread_index % self.threads_per_account}"
+        now = datetime.now()
+        with self.lock:
+            thread = inbox.threads[thread_id]
+            item_id = str(next(self._item_ids))
+            thread["messages"].insert(0, FakeMessage(item_id, thread["customer"].pk, text, now))
+            del thread["messages"][self.messages_per_thread * 5:]
+            thread["last_activity_at"] = now
+            thread["pending"].append(time.perf_counter())
+            self.injected += 1
+        return item_id
+
+    def record_reply(self, inbox: FakeInbox, thread_id: str, text: str):
+        now = datetime.now()
+        with self.lock:
+            thread = inbox.threads.get(thread_id)
+            if thread is None:
+                return
+            thread["messages"].insert(0, FakeMessage(str(next(self._item_ids)), inbox.user_id, text, now))
+            thread["last_activity_at"] = now
+            finished = time.perf_counter()
+            self.reply_latencies.extend(finished - started for started in thread["pending"])
+            thread["pending"] = []
+            self.replies += 1
+
+    def snapshot_threads(self, inbox: FakeInbox, amount: Optional[int] = None) -> List[FakeThread]:
+        with self.lock:
+            ordered = sorted(inbox.threads.items(), key=lambda item: item[1]["last_activity_at"], reverse=True)
+            if amount is not None:
+                ordered = ordered[:amount]
+            return [self._thread_view(thread_id, data) for thread_id, data in ordered]
+
+    def thread_view(self, inbox: FakeInbox, thread_id: str, amount: Optional[int] = None) -> FakeThread:
+        with self.lock:
+            return self._thread_view(thread_id, inbox.threads[thread_id], limit=amount)
+
+    def _thread_view(self, thread_id: str, data: Dict, limit: Optional[int] = None) -> FakeThread:
+        messages = data["messages"][:self.messages_per_thread if limit is None else limit]
+        return FakeThread(thread_id, [data["customer"]], list(messages), data["last_activity_at"])
+
+    def unanswered(self) -> int:
+        with self.lock:
+            return sum(len(thread["pending"]) for inbox in self.inboxes.values()
+                       for thread in inbox.threads.values())
+
+    def reset_stats(self):
+        with self.lock:
+            self.calls.clear()
+            self.errors.clear()
+            self.reply_latencies = []
+            self.replies = 0
+            self.injected = 0
+
+
+class FakeClient:
+    """جایگزین instagrapi.Client؛ تنظیمات در سطح کلاس است چون ربات Client() را بدون آرگومان می‌سازد"""
+
+    world: Optional[FakeInstagram] = None
+    latency = 0.0
+    error_rate = 0.0
+    rate_limit_rate = 0.0
+    rng = random.Random(0)
+    rng_lock = threading.Lock()
+
+    @classmethod
+    def configure(cls, world: FakeInstagram, latency: float = 0.0, error_rate: float = 0.0,
+                  rate_limit_rate: float = 0.0, seed: int = 0):
+        """تعیین سرور جعلی و تأخیر/خطاهای تزریقی"""
+        cls.world = world
+        cls.latency = latency
+        cls.error_rate = error_rate
+        cls.rate_limit_rate = rate_limit_rate
+        cls.rng = random.Random(seed)
+
+    def __init__(self, settings: Optional[Dict] = None, proxy: Optional[str] = None):
+        self.settings: Dict = dict(settings or {})
+        self.proxy = proxy
+        self.user_id: Optional[str] = None
+        self.username: Optional[str] = None
+        self.inbox: Optional[FakeInbox] = None
+
+    def _request(self, endpoint: str):
+        """شبیه‌سازی یک درخواست شبکه: شمارش، تأخیر و خطای تصادفی"""
+        world = self.world
+        with world.lock:
+            world.calls[endpoint] += 1
+        if self.latency > 0:
+            time.sleep(self.latency)
+        with self.rng_lock:
+            roll = self.rng.random()
+        if roll < self.rate_limit_rate:
+            with world.lock:
+                world.errors[f"{endpoint}:429"] += 1
+            raise ClientError("Too many requests")
+        if roll < self.rate_limit_rate + self.error_rate:
+            with world.lock:
+                world.errors[endpoint] += 1
+            raise ClientError("Fake server error")
+
+    def _require_login(self) -> FakeInbox:
+        if self.inbox is None:
+            raise LoginRequired("login_required")
+        return self.inbox
+
+    def login(self, username: str, password: str, relogin: bool = False, verification_code: str = "") -> bool:
+        self._request("login")
+        self.username = username
+        self.inbox = self.world.inbox(username)
+        self.user_id = self.inbox.user_id
+        self.settings["authorization_data"] = {"ds_user_id": self.user_id, "sessionid": f"fake-{username}"}
+        return True
+
+    def get_settings(self) -> Dict:
+        return dict(self.settings)
+
+    def set_settings(self, settings: Dict) -> bool:
+        self.settings = dict(settings)
+        return True
+
+    def get_timeline_feed(self, amount: int = 1):
+        self._request("get_timeline_feed")
+        self._require_login()
+        return {"feed_items": []}
+
+    def direct_threads(self, amount: int = 20, selected_filter: str = "", thread_message_limit: Optional[int] = None):
+        self._request("direct_threads")
+        return self.world.snapshot_threads(self._require_login(), amount)
+
+    def direct_pending_inbox(self, amount: int = 20):
+        self._request("direct_pending_inbox")
+        self._require_login()
+        return []
+
+    def direct_thread(self, thread_id: str, amount: int = 20):
+        self._request("direct_thread")
+        return self.world.thread_view(self._require_login(), thread_id, amount)
+
+    def direct_send(self, text: str, user_ids: Optional[List[int]] = None, thread_ids: Optional[List[str]] = None):
+        self._request("direct_send")
+        inbox = self._require_login()
+        for thread_id in thread_ids or []:
+            self.world.record_reply(inbox, thread_id, text)
+        return True
+
+    def direct_thread_mark_read(self, thread_id: str) -> bool:
+        self._request("direct_thread_mark_read")
+        self._require_login()
+        return True
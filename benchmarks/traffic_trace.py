@@ -0,0 +1,581 @@
+"""ضبط و بازپخش ترافیک instagrapi برای بنچمارک‌های واقعی‌تر
+
+RecordingClient دور یک instagrapi.Client واقعی قرار می‌گیرد و هر فراخوانی
+شبکه‌ای ربات (لیست inbox، thread، ارسال و ...) را همراه با پاسخ یا خطا و
+زمان آن در یک فایل JSONL فشرده (gzip) می‌نویسد. ReplayClient همان فایل را
+بدون شبکه با سرعت 1× تا 100× بازپخش می‌کند و می‌تواند هر حساب ضبط‌شده را
+به چند ربات بدهد.
+
+ضبط از یک حساب staging (در پوشه‌ای که دیتابیس‌های برنامه در آن هستند):
+    INSTAGRAM_PASSWORD=... python -m benchmarks.traffic_trace record \\
+        --user-id 2 --username staging_account --duration 600 --out trace.jsonl.gz
+
+خلاصه یک trace:
+    python -m benchmarks.traffic_trace summary trace.jsonl.gz
+
+بازپخش: benchmarks/bench_replay.py
+
+قالب فایل: سطر اول header و هر سطر بعدی یک فراخوانی است:
+    {"t": ثانیه از شروع, "acct": حساب, "m": متد, "a": آرگومان‌ها, "k": kwargs,
+     "d": مدت فراخوانی, "r": پاسخ} یا به جای "r" خطا: "e": {"type", "msg"}
+مدل‌های instagrapi به صورت {"$obj": نام نوع, "f": فیلدها} و datetimeها به
+صورت {"$dt": epoch, "tz": آیا timezone دارد} ذخیره می‌شوند.
+"""
+import argparse
+import bisect
+import copy
+import gzip
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from datetime import date, datetime, timezone
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+TRACE_VERSION = 1
+
+# فراخوانی‌های شبکه‌ای که ضبط می‌شوند؛ بقیه (مثل تنظیمات session) به client اصلی می‌روند
+RECORDED_METHODS = (
+    "login",
+    "get_timeline_feed",
+    "direct_threads",
+    "direct_pending_inbox",
+    "direct_thread",
+    "direct_messages",
+    "direct_send",
+    "direct_thread_mark_read",
+)
+
+# آرگومان‌هایی که هویت پاسخ را تعیین می‌کنند (مثلاً thread_id در direct_thread)
+KEY_ARGUMENTS = {
+    "direct_thread": "thread_id",
+    "direct_messages": "thread_id",
+}
+
+
+def encode_value(value: Any) -> Any:
+    """تبدیل پاسخ instagrapi به ساختار قابل ذخیره در JSON"""
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if isinstance(value, datetime):
+        return {"$dt": value.timestamp(), "tz": value.tzinfo is not None}
+    if isinstance(value, date):
+        return value.isoformat()
+    if isinstance(value, (list, tuple, set)):
+        return [encode_value(item) for item in value]
+    if isinstance(value, dict):
+        return {str(key): encode_value(item) for key, item in value.items()}
+
+    # مدل‌های pydantic (نسخه 1 و 2) و کلاس‌های ساده
+    fields = getattr(type(value), "model_fields", None) or getattr(value, "__fields__", None)
+    if fields:
+        names = list(fields)
+    elif hasattr(value, "__dict__"):
+        names = [name for name in vars(value) if not name.startswith("_")]
+    else:
+        return str(value)
+    return {
+        "$obj": type(value).__name__,
+        "f": {name: encode_value(getattr(value, name, None)) for name in names},
+    }
+
+
+def decode_value(value: Any, time_map: Optional[Callable[[float], float]] = None) -> Any:
+    """بازسازی پاسخ؛ مدل‌ها به SimpleNamespace تبدیل و زمان‌ها با time_map جابه‌جا می‌شوند"""
+    if isinstance(value, list):
+        return [decode_value(item, time_map) for item in value]
+    if not isinstance(value, dict):
+        return value
+    if "$dt" in value:
+        epoch = time_map(value["$dt"]) if time_map else value["$dt"]
+        return datetime.fromtimestamp(epoch, timezone.utc) if value.get("tz") else datetime.fromtimestamp(epoch)
+    if "$obj" in value:
+        return SimpleNamespace(**{name: decode_value(item, time_map) for name, item in value["f"].items()})
+    return {key: decode_value(item, time_map) for key, item in value.items()}
+
+
+def call_key(method: str, args: List, kwargs: Dict) -> Tuple[str, Optional[str]]:
+    """کلید پاسخ یک فراخوانی: نام متد و در صورت وجود آرگومان هویتی"""
+    name = KEY_ARGUMENTS.get(method)
+    if name is None:
+        return method, None
+    identity = kwargs.get(name, args[0] if args else None)
+    return method, str(identity) if identity is not None else None
+
+
+class TraceWriter:
+    """نوشتن thread-safe فراخوانی‌ها در فایل JSONL فشرده"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = gzip.open(path, "wt", encoding="utf-8")
+        self.started_at = time.time()
+        self._started = time.monotonic()
+        self.records = 0
+        self._write({"v": TRACE_VERSION, "kind": "header", "started_at": self.started_at})
+
+    def _write(self, record: Dict):
+        self._file.write(json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n")
+
+    def write_call(self, account: Optional[str], method: str, args: List, kwargs: Dict,
+                   started: float, duration: float, result: Any = None,
+                   error: Optional[BaseException] = None):
+        record = {
+            "t": round(started - self._started, 4),
+            "acct": account,
+            "m": method,
+            "a": encode_value(args),
+            "k": encode_value(kwargs),
+            "d": round(duration, 4),
+        }
+        if error is not None:
+            record["e"] = {"type": type(error).__name__, "msg": str(error)[:500]}
+        else:
+            record["r"] = encode_value(result)
+        with self._lock:
+            self._write(record)
+            self.records += 1
+
+    def close(self):
+        with self._lock:
+            if not self._file.closed:
+                self._file.close()
+
+
+class RecordingClient:
+    """instagrapi.Client که فراخوانی‌های شبکه‌ای را در TraceWriter ضبط می‌کند
+
+    ربات Client() را بدون آرگومان می‌سازد، پس writer و سازنده client اصلی
+    در سطح کلاس تنظیم می‌شوند:
+        RecordingClient.configure(TraceWriter("trace.jsonl.gz"))
+        bots.instagram_bot.Client = RecordingClient
+    """
+
+    writer: Optional[TraceWriter] = None
+    factory: Optional[Callable[[], Any]] = None
+
+    @classmethod
+    def configure(cls, writer: TraceWriter, factory: Optional[Callable[[], Any]] = None):
+        if factory is None:
+            from instagrapi import Client
+            factory = Client
+        cls.writer = writer
+        cls.factory = factory
+
+    def __init__(self, *args, **kwargs):
+        object.__setattr__(self, "_client", self.factory(*args, **kwargs))
+        object.__setattr__(self, "_account", None)
+
+    def __getattr__(self, name: str):
+        attr = getattr(self._client, name)
+        if name not in RECORDED_METHODS or not callable(attr):
+            return attr
+
+        def recorded(*args, **kwargs):
+            if name == "login" and args:
+                object.__setattr__(self, "_account", args[0])
+            account = self._account or getattr(self._client, "username", None)
+            # رمز عبور هرگز در trace نوشته نمی‌شود
+            safe_kwargs = {key: value for key, value in kwargs.items() if key != "password"}
+            started = time.monotonic()
+            try:
+                result = attr(*args, **kwargs)
+            except Exception as e:
+                self.writer.write_call(account, name, self._safe_args(name, args), safe_kwargs,
+                                       started, time.monotonic() - started, error=e)
+                raise
+            record_result = result
+            if name == "login":
+                # شناسه حساب برای تشخیص پیام‌های خود ربات هنگام بازپخش لازم است
+                record_result = {"ok": bool(result), "user_id": str(self._client.user_id)}
+            self.writer.write_call(account, name, self._safe_args(name, args), safe_kwargs,
+                                   started, time.monotonic() - started, result=record_result)
+            return result
+
+        recorded.__name__ = name
+        return recorded
+
+    def __setattr__(self, name: str, value: Any):
+        setattr(self._client, name, value)
+
+    @staticmethod
+    def _safe_args(method: str, args: Tuple) -> List:
+        return list(args[:1]) if method == "login" else list(args)
+
+
+class TraceRecord:
+    __slots__ = ("t", "method", "key", "duration", "result", "error")
+
+    def __init__(self, t: float, method: str, key: Tuple, duration: float, result: Any, error: Optional[Dict]):
+        self.t = t
+        self.method = method
+        self.key = key
+        self.duration = duration
+        self.result = result
+        self.error = error
+
+
+class Trace:
+    """trace بارگذاری‌شده، گروه‌بندی‌شده به ازای حساب و کلید فراخوانی"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.started_at = 0.0
+        self.duration = 0.0
+        self.user_ids: Dict[str, str] = {}
+        self.calls: Counter = Counter()
+        self.errors: Counter = Counter()
+        # حساب ← کلید ← رکوردهای مرتب بر اساس زمان
+        self._raw: Dict[str, Dict[Tuple, List[Dict]]] = defaultdict(lambda: defaultdict(list))
+
+        with gzip.open(path, "rt", encoding="utf-8") as trace_file:
+            header = json.loads(trace_file.readline())
+            if header.get("kind") != "header" or header.get("v") != TRACE_VERSION:
+                raise ValueError(f"قالب trace پشتیبانی نمی‌شود: {path}")
+            self.started_at = header["started_at"]
+            for line in trace_file:
+                record = json.loads(line)
+                account = record.get("acct") or ""
+                method = record["m"]
+                self.calls[method] += 1
+                if "e" in record:
+                    self.errors[method] += 1
+                elif method == "login" and isinstance(record.get("r"), dict):
+                    self.user_ids[account] = record["r"].get("user_id")
+                self.duration = max(self.duration, record["t"])
+                key = call_key(method, record.get("a") or [], record.get("k") or {})
+                self._raw[account][key].append(record)
+
+    @property
+    def accounts(self) -> List[str]:
+        # فراخوانی‌های پیش از لاگین (مثل بررسی session) به حسابی نسبت داده نمی‌شوند
+        return sorted(account for account in self._raw if account)
+
+    def customer_messages(self, account: str) -> int:
+        """تعداد پیام‌های یکتای مشتری دیده‌شده در پاسخ‌های ضبط‌شده یک حساب"""
+        own_id = self.user_ids.get(account)
+        seen = set()
+
+        def walk(value):
+            if isinstance(value, list):
+                for item in value:
+                    walk(item)
+            elif isinstance(value, dict):
+                if value.get("$obj") is not None and "user_id" in value["f"] and "text" in value["f"]:
+                    fields = value["f"]
+                    if str(fields.get("user_id")) != own_id:
+                        seen.add(fields.get("id"))
+                    return
+                for item in value.values():
+                    walk(item)
+
+        for records in self._raw.get(account, {}).values():
+            for record in records:
+                walk(record.get("r"))
+        return len(seen)
+
+    def timeline(self, account: str, time_map: Callable[[float], float]) -> Dict[Tuple, Tuple[List[float], List[TraceRecord]]]:
+        """رکوردهای یک حساب با پاسخ‌های بازسازی‌شده و زمان‌های جابه‌جاشده
+
+        خروجی: کلید ← (زمان رکوردها برای جستجوی دودویی، رکوردها)
+        """
+        timeline = {}
+        for key, records in self._raw.get(account, {}).items():
+            ordered = [
+                TraceRecord(record["t"], record["m"], key, record.get("d", 0.0),
+                            decode_value(record.get("r"), time_map), record.get("e"))
+                for record in sorted(records, key=lambda item: item["t"])
+            ]
+            timeline[key] = ([record.t for record in ordered], ordered)
+        return timeline
+
+
+class ReplayStats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls: Counter = Counter()
+        self.errors: Counter = Counter()
+        self.misses: Counter = Counter()
+        self.sends = 0
+
+    def reset(self):
+        with self.lock:
+            self.calls.clear()
+            self.errors.clear()
+            self.misses.clear()
+            self.sends = 0
+
+
+class TraceReplay:
+    """ساعت مجازی بازپخش و نگاشت ربات‌ها به حساب‌های trace"""
+
+    def __init__(self, trace: Trace, speed: float = 1.0, replay_latency: bool = True):
+        if not 1.0 <= speed <= 100.0:
+            raise ValueError("سرعت بازپخش باید بین 1 و 100 باشد")
+        self.trace = trace
+        self.speed = speed
+        self.replay_latency = replay_latency
+        self.stats = ReplayStats()
+        self.assignments: Dict[str, str] = {}
+        self._timelines: Dict[str, Dict[Tuple, Tuple[List[float], List[TraceRecord]]]] = {}
+        self._origin = time.monotonic()
+        self._wall_origin = time.time()
+
+    def assign(self, usernames: List[str]):
+        """تقسیم حساب‌های trace بین ربات‌ها به صورت چرخشی"""
+        accounts = self.trace.accounts
+        if not accounts:
+            raise ValueError("trace هیچ فراخوانی ندارد")
+        for index, username in enumerate(usernames):
+            self.assignments[username] = accounts[index % len(accounts)]
+
+    def start(self):
+        """شروع ساعت مجازی؛ زمان پیام‌ها طوری جابه‌جا می‌شود که trace از همین لحظه شروع شده باشد"""
+        self._origin = time.monotonic()
+        self._wall_origin = time.time()
+        started_at = self.trace.started_at
+
+        def time_map(epoch: float) -> float:
+            return self._wall_origin + (epoch - started_at) / self.speed
+
+        self._timelines = {account: self.trace.timeline(account, time_map) for account in self.trace.accounts}
+        self.stats.reset()
+
+    def now(self) -> float:
+        """زمان فعلی بازپخش بر حسب ثانیه از شروع trace"""
+        return (time.monotonic() - self._origin) * self.speed
+
+    @property
+    def finished(self) -> bool:
+        return self.now() > self.trace.duration
+
+    def timeline(self, account: str) -> Dict[Tuple, Tuple[List[float], List[TraceRecord]]]:
+        return self._timelines.get(account, {})
+
+
+class ReplayClient:
+    """جایگزین instagrapi.Client که پاسخ‌ها را از trace برمی‌گرداند
+
+    هر فراخوانی آخرین پاسخ ضبط‌شده همان کلید (متد و thread) تا زمان فعلی
+    بازپخش را می‌گیرد. خطای ضبط‌شده فقط یک بار برای هر client تکرار می‌شود.
+    هر پاسخ یک کپی مستقل است تا تغییر آن توسط یک ربات روی ربات‌های دیگر و
+    فراخوانی‌های بعدی اثر نگذارد. پیام‌هایی که همین client با direct_send
+    فرستاده به threadهای برگردانده‌شده بعدی اضافه می‌شوند، چون پاسخ‌های ضبط‌شده
+    آن‌ها را ندارند و بدون آن‌ها ربات با از دست دادن watermark همان پیام‌ها را
+    دوباره پاسخ می‌دهد؛ پاسخ‌های خود حساب staging هم از زمان ضبط‌شده‌شان
+    در trace دیده می‌شوند.
+        replay = TraceReplay(Trace("trace.jsonl.gz"), speed=10)
+        replay.assign(usernames)
+        ReplayClient.configure(replay)
+        bots.instagram_bot.Client = ReplayClient
+    """
+
+    replay: Optional[TraceReplay] = None
+
+    @classmethod
+    def configure(cls, replay: TraceReplay):
+        cls.replay = replay
+
+    def __init__(self, settings: Optional[Dict] = None, proxy: Optional[str] = None):
+        self.settings: Dict = dict(settings or {})
+        self.proxy = proxy
+        self.user_id: Optional[str] = None
+        self.username: Optional[str] = None
+        self.account: Optional[str] = None
+        self._consumed_errors = set()
+        # thread ← پیام‌های ارسال‌شده با همین client، از جدید به قدیم
+        self._sent: Dict[str, List[SimpleNamespace]] = defaultdict(list)
+
+    def _respond(self, method: str, args: Tuple = (), kwargs: Optional[Dict] = None, default: Any = None):
+        replay = self.replay
+        with replay.stats.lock:
+            replay.stats.calls[method] += 1
+        entry = replay.timeline(self.account).get(call_key(method, list(args), kwargs or {})) if self.account else None
+        if not entry:
+            with replay.stats.lock:
+                replay.stats.misses[method] += 1
+            return default
+
+        # آخرین رکورد تا زمان فعلی؛ پیش از اولین رکورد، همان اولین رکورد
+        times, records = entry
+        index = max(bisect.bisect_right(times, replay.now()) - 1, 0)
+        record = records[index]
+        if replay.replay_latency and record.duration:
+            time.sleep(record.duration / replay.speed)
+
+        if record.error is not None:
+            marker = (method, id(record))
+            if marker not in self._consumed_errors:
+                self._consumed_errors.add(marker)
+                with replay.stats.lock:
+                    replay.stats.errors[method] += 1
+                raise self._make_error(record.error)
+            # خطای مصرف‌شده: آخرین پاسخ موفق قبل از آن
+            record = next((item for item in reversed(records[:index]) if item.error is None), None)
+            if record is None:
+                return default
+        return copy.deepcopy(record.result) if record.result is not None else default
+
+    @staticmethod
+    def _epoch(timestamp: Any) -> float:
+        if isinstance(timestamp, datetime):
+            return timestamp.timestamp()
+        return float(timestamp or 0)
+
+    def _merge_sent(self, thread_id: Any, messages: Optional[List[Any]]) -> Optional[List[Any]]:
+        """افزودن پیام‌های ارسال‌شده این client به پیام‌های thread (جدیدترین اول)"""
+        sent = self._sent.get(str(thread_id))
+        if not sent or messages is None:
+            return messages
+        merged = [copy.copy(item) for item in sent] + list(messages)
+        merged.sort(key=lambda item: self._epoch(getattr(item, "timestamp", None)), reverse=True)
+        return merged
+
+    def _with_sent(self, thread: Any) -> Any:
+        if getattr(thread, "messages", None) is not None and getattr(thread, "id", None) is not None:
+            thread.messages = self._merge_sent(thread.id, thread.messages)
+        return thread
+
+    def _threads_with_sent(self, result: Any) -> Any:
+        threads = result if isinstance(result, list) else getattr(result, "threads", None)
+        for thread in threads or []:
+            self._with_sent(thread)
+        return result
+
+    @staticmethod
+    def _make_error(error: Dict) -> Exception:
+        from instagrapi import exceptions
+
+        error_class = getattr(exceptions, error.get("type", ""), None)
+        if not (isinstance(error_class, type) and issubclass(error_class, Exception)):
+            error_class = exceptions.ClientError
+        return error_class(error.get("msg", ""))
+
+    def _require_login(self):
+        if self.account is None:
+            from instagrapi.exceptions import LoginRequired
+            raise LoginRequired("login_required")
+
+    def login(self, username: str, password: str, relogin: bool = False, verification_code: str = "") -> bool:
+        replay = self.replay
+        with replay.stats.lock:
+            replay.stats.calls["login"] += 1
+        self.username = username
+        self.account = replay.assignments.get(username, username)
+        self.user_id = replay.trace.user_ids.get(self.account) or f"replay-{username}"
+        self.settings["authorization_data"] = {"ds_user_id": self.user_id, "sessionid": f"replay-{username}"}
+        return True
+
+    def get_settings(self) -> Dict:
+        return dict(self.settings)
+
+    def set_settings(self, settings: Dict) -> bool:
+        self.settings = dict(settings)
+        return True
+
+    def get_timeline_feed(self, amount: int = 1):
+        self._require_login()
+        return self._respond("get_timeline_feed", default={"feed_items": []})
+
+    def direct_threads(self, amount: int = 20, selected_filter: str = "", thread_message_limit: Optional[int] = None):
+        self._require_login()
+        return self._threads_with_sent(self._respond("direct_threads", default=[]))
+
+    def direct_pending_inbox(self, amount: int = 20):
+        self._require_login()
+        return self._threads_with_sent(self._respond("direct_pending_inbox", default=[]))
+
+    def direct_thread(self, thread_id: str, amount: int = 20):
+        self._require_login()
+        return self._with_sent(self._respond("direct_thread", (thread_id,), default=None))
+
+    def direct_messages(self, thread_id: str, amount: int = 20):
+        self._require_login()
+        return self._merge_sent(thread_id, self._respond("direct_messages", (thread_id,), default=[]))
+
+    def direct_send(self, text: str, user_ids: Optional[List[int]] = None, thread_ids: Optional[List[str]] = None):
+        self._require_login()
+        self._respond("direct_send")
+        with self.replay.stats.lock:
+            self.replay.stats.sends += 1
+        thread_id = (thread_ids or [None])[0]
+        message = SimpleNamespace(id=f"replay-{time.monotonic_ns()}", user_id=self.user_id, thread_id=thread_id,
+                                  text=text, item_type="text", timestamp=datetime.now())
+        if thread_id is not None:
+            self._sent[str(thread_id)].insert(0, message)
+        return message
+
+    def direct_thread_mark_read(self, thread_id: str) -> bool:
+        self._require_login()
+        self._respond("direct_thread_mark_read")
+        return True
+
+
+def record(args):
+    from benchmarks.common import REPO_ROOT
+
+    if REPO_ROOT not in sys.path:
+        sys.path.insert(0, REPO_ROOT)
+    import bots.instagram_bot
+    from bots.outbound import get_outbound_dispatcher
+
+    password = args.password or os.environ.get("INSTAGRAM_PASSWORD")
+    if not password:
+        raise SystemExit("رمز عبور با --password یا INSTAGRAM_PASSWORD لازم است")
+
+    writer = TraceWriter(args.out)
+    RecordingClient.configure(writer)
+    bots.instagram_bot.Client = RecordingClient
+    bot = bots.instagram_bot.InstagramBot(args.username, password, args.user_id)
+    try:
+        if not bot.login():
+            raise SystemExit("ورود به حساب ناموفق بود")
+        deadline = time.monotonic() + args.duration
+        while time.monotonic() < deadline:
+            bot.check_new_messages()
+            if bot.pause(args.poll_interval):
+                break
+        get_outbound_dispatcher().join(timeout=60)
+    finally:
+        bot.stop_bot()
+        writer.close()
+    print(f"{writer.records:,} فراخوانی در {args.out} ضبط شد")
+
+
+def summary(args):
+    trace = Trace(args.trace)
+    print(f"trace: {args.trace}   مدت: {trace.duration:.1f}s   حساب‌ها: {len(trace.accounts)}")
+    for account in trace.accounts:
+        print(f"    {account}: {trace.customer_messages(account):,} پیام مشتری")
+    for method, count in sorted(trace.calls.items()):
+        errors = trace.errors.get(method, 0)
+        print(f"    {method:<26}{count:>10,}" + (f"   خطا: {errors:,}" if errors else ""))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    record_parser = commands.add_parser("record", help="ضبط ترافیک یک حساب staging")
+    record_parser.add_argument("--user-id", type=int, required=True, help="شناسه کاربر برنامه که حساب متعلق به اوست")
+    record_parser.add_argument("--username", required=True, help="نام کاربری حساب staging")
+    record_parser.add_argument("--password", help="رمز عبور (یا متغیر INSTAGRAM_PASSWORD)")
+    record_parser.add_argument("--duration", type=float, default=600.0, help="مدت ضبط (ثانیه)")
+    record_parser.add_argument("--poll-interval", type=float, default=30.0, help="فاصله بررسی inbox (ثانیه)")
+    record_parser.add_argument("--out", default="trace.jsonl.gz", help="مسیر فایل trace")
+    record_parser.set_defaults(func=record)
+
+    summary_parser = commands.add_parser("summary", help="خلاصه فراخوانی‌های یک trace")
+    summary_parser.add_argument("trace", help="مسیر فایل trace")
+    summary_parser.set_defaults(func=summary)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,10 @@
-from .instagram_bot import InstagramBot
+# InstagramBot (و instagrapi) فقط هنگام اولین استفاده بارگذاری می‌شود تا import
+# ماژول‌های سبک مانند bots.status_hub در پردازش وب هزینه‌ای نداشته باشد
+__all__ = ['InstagramBot']
 
-__all__ = ['InstagramBot']
\ No newline at end of file
+
+def __getattr__(name):
+    if name == 'InstagramBot':
+        from .instagram_bot import InstagramBot
+        return InstagramBot
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -1,19 +1,60 @@
+import asyncio
+import functools
 import time
 import logging
 import threading
 import random
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, Tuple
 from abc import ABC, abstractmethod
 from datetime import datetime
 
 logger = logging.getLogger(__name__)
 
+
+class NotifyingEvent(threading.Event):
+    """رویدادی که شنونده‌های ثبت‌شده را هنگام set شدن خبر می‌کند"""
+    
+    def __init__(self):
+        super().__init__()
+        self._listeners = []
+        self._listeners_lock = threading.Lock()
+    
+    def add_listener(self, callback):
+        """ثبت تابعی که با set شدن رویداد فراخوانی می‌شود"""
+        with self._listeners_lock:
+            self._listeners.append(callback)
+    
+    def remove_listener(self, callback):
+        """حذف شنونده ثبت‌شده"""
+        with self._listeners_lock:
+            if callback in self._listeners:
+                self._listeners.remove(callback)
+    
+    def set(self):
+        super().set()
+        with self._listeners_lock:
+            listeners = list(self._listeners)
+        for callback in listeners:
+            try:
+                callback()
+            except Exception as e:
+                logger.error(f"خطا در اطلاع‌رسانی رویداد: {e}")
+
+
 class BaseBot(ABC):
     """کلاس پایه برای تمام ربات‌ها با الگوهای زمانی هوشمند"""
     
     def __init__(self):
         self.running = False
-        self.stop_event = threading.Event()
+        self.stop_event = NotifyingEvent()
+        
+        # بیدار کردن زودتر از موعد ربات برای بررسی پیام (توقف هم ربات را بیدار می‌کند)
+        self.wake_event = NotifyingEvent()
+        self.stop_event.add_listener(self.wake_event.set)
+        
+        # مدیریت خطاهای متوالی بین چرخه‌ها
+        self.consecutive_errors = 0
+        self.max_consecutive_errors = 5
         
         # تنظیمات هوشمند زمان‌بندی
         self.sleep_duration = 60  # زمان خواب اولیه
@@ -118,88 +159,141 @@ class BaseBot(ABC):
         if self.should_reset_sleep():
             self.reset_sleep_cycle()
     
-    def smart_sleep(self, duration: int):
-        """خواب هوشمند با قابلیت interrupt و بررسی دوره‌ای"""
-        logger.info(f"در حال خواب به مدت {duration} ثانیه...")
+    def smart_sleep(self, duration: float):
+        """خواب تا موعد بررسی بعدی؛ با wake یا توقف زودتر بیدار می‌شود
         
-        # تعیین اندازه chunk بر اساس الگوی زمانی
-        current_pattern = self.get_current_activity_pattern()
-        chunk_size = max(15, min(60, current_pattern["base_interval"] // 4))
+        در طول خواب هیچ درخواستی ارسال نمی‌شود تا هزینه بررسی‌ها فقط به فاصله
+        محاسبه‌شده در adaptive_sleep وابسته باشد.
+        """
+        logger.info(f"در حال خواب به مدت {duration} ثانیه...")
+        if self.wake_event.wait(max(0, duration)):
+            self.wake_event.clear()
+    
+    def wake(self):
+        """درخواست بررسی فوری پیام‌ها بدون انتظار برای موعد بعدی"""
+        self.wake_event.set()
+    
+    def pause(self, duration: float) -> bool:
+        """انتظار قابل قطع؛ در صورت درخواست توقف True برمی‌گرداند"""
+        if duration <= 0:
+            return self.stop_event.is_set()
+        return self.stop_event.wait(duration)
+    
+    async def pause_async(self, duration: float) -> bool:
+        """نسخه ناهمگام pause؛ انتظار روی event loop سپری می‌شود و threadی را اشغال نمی‌کند"""
+        if duration <= 0 or self.stop_event.is_set():
+            return self.stop_event.is_set()
+        loop = asyncio.get_running_loop()
+        stopped = loop.create_future()
+
+        def notify_stop():
+            loop.call_soon_threadsafe(lambda: stopped.done() or stopped.set_result(True))
+
+        self.stop_event.add_listener(notify_stop)
+        try:
+            await asyncio.wait_for(stopped, duration)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            self.stop_event.remove_listener(notify_stop)
+        return self.stop_event.is_set()
+    
+    async def run_blocking(self, func, *args, **kwargs):
+        """اجرای فراخوانی مسدودکننده در executor پیش‌فرض event loop"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, functools.partial(func, *args, **kwargs))
+    
+    def error_backoff(self) -> int:
+        """ثبت یک خطای متوالی و محاسبه زمان انتظار قبل از تلاش مجدد"""
+        self.consecutive_errors += 1
+        if self.consecutive_errors >= self.max_consecutive_errors:
+            logger.error("خطاهای متوالی، خواب طولانی...")
+            self.consecutive_errors = 0
+            return 300
+        return 120
+    
+    def run_cycle(self) -> Tuple[float, bool]:
+        """اجرای یک چرخه بررسی پیام
         
-        remaining = duration
+        زمان انتظار تا چرخه بعد و اینکه چرخه موفق بوده یا نه را برمی‌گرداند.
+        این متد خودش نمی‌خوابد تا هم حلقه همزمان و هم runtime ناهمگام بتوانند از آن استفاده کنند.
+        """
+        try:
+            if not self.is_logged_in():
+                logger.warning("نیاز به لاگین مجدد")
+                if not self.login():
+                    self.consecutive_errors += 1
+                    if self.consecutive_errors >= self.max_consecutive_errors:
+                        logger.error("خطاهای متوالی در لاگین، خواب طولانی...")
+                        self.consecutive_errors = 0
+                        return 300, False
+                    return 60, False
+            
+            self.consecutive_errors = 0  # reset خطاهای متوالی
+            has_activity = self.check_new_messages()
+            self.adaptive_sleep(has_activity)
+            return self.sleep_duration, True
+            
+        except Exception as e:
+            logger.error(f"خطا در پردازش پیام: {e}")
+            return self.error_backoff(), False
+    
+    async def check_new_messages_async(self) -> bool:
+        """نسخه ناهمگام check_new_messages؛ ربات‌هایی که نسخه ناهمگام ندارند کل بررسی را در executor اجرا می‌کنند"""
+        return await self.run_blocking(self.check_new_messages)
+    
+    async def run_cycle_async(self) -> Tuple[float, bool]:
+        """نسخه ناهمگام run_cycle برای BotRuntime
         
-        while remaining > 0 and not self.stop_event.is_set():
-            sleep_time = min(chunk_size, remaining)
-            time.sleep(sleep_time)
-            remaining -= sleep_time
+        فقط فراخوانی‌های مسدودکننده در executor اجرا می‌شوند و انتظارهای داخل
+        چرخه (محدودکننده نرخ، تأخیر انسانی، تلاش مجدد) threadی را نگه نمی‌دارند.
+        """
+        try:
+            if not await self.run_blocking(self.is_logged_in):
+                logger.warning("نیاز به لاگین مجدد")
+                if not await self.run_blocking(self.login):
+                    self.consecutive_errors += 1
+                    if self.consecutive_errors >= self.max_consecutive_errors:
+                        logger.error("خطاهای متوالی در لاگین، خواب طولانی...")
+                        self.consecutive_errors = 0
+                        return 300, False
+                    return 60, False
             
-            # بررسی پیام فقط در صورت لزوم
-            if remaining > 30 and not self.stop_event.is_set():
-                try:
-                    if self.check_new_messages():
-                        logger.info("پیام جدید در حین خواب یافت شد، بیدار شدن...")
-                        break
-                except Exception as e:
-                    logger.error(f"خطا در بررسی پیام در حین خواب: {e}")
+            self.consecutive_errors = 0
+            has_activity = await self.check_new_messages_async()
+            self.adaptive_sleep(has_activity)
+            return self.sleep_duration, True
+            
+        except Exception as e:
+            logger.error(f"خطا در پردازش پیام: {e}")
+            return self.error_backoff(), False
     
-    def process_messages(self):
-        """پردازش پیام‌های دریافتی به صورت کاملاً هوشمند"""
+    def start_processing(self):
+        """آماده‌سازی وضعیت ربات پیش از اولین چرخه"""
         logger.info("شروع پردازش پیام‌ها با الگوریتم هوشمند...")
         self.running = True
         self.last_activity_check = time.time()
+        self.consecutive_errors = 0
         self.reset_sleep_cycle()
-        
-        consecutive_errors = 0
-        max_consecutive_errors = 5
-        
-        while not self.stop_event.is_set():
-            try:
-                if not self.is_logged_in():
-                    logger.warning("نیاز به لاگین مجدد")
-                    if not self.login():
-                        consecutive_errors += 1
-                        if consecutive_errors >= max_consecutive_errors:
-                            logger.error("خطاهای متوالی در لاگین، خواب طولانی...")
-                            time.sleep(300)
-                            consecutive_errors = 0
-                        else:
-                            time.sleep(60)
-                        continue
-                
-                try:
-                    consecutive_errors = 0  # reset خطاهای متوالی
-                    has_activity = self.check_new_messages()
-                    self.adaptive_sleep(has_activity)
-                    self.smart_sleep(int(self.sleep_duration))
-                    
-                except Exception as e:
-                    consecutive_errors += 1
-                    logger.error(f"خطا در پردازش پیام: {e}")
-                    
-                    if consecutive_errors >= max_consecutive_errors:
-                        logger.error("خطاهای متوالی، خواب طولانی...")
-                        time.sleep(300)
-                        consecutive_errors = 0
-                    else:
-                        time.sleep(120)
-                
-            except KeyboardInterrupt:
-                logger.info("توقف توسط کاربر")
-                break
-            except Exception as e:
-                consecutive_errors += 1
-                logger.error(f"خطای غیرمنتظره: {e}")
-                
-                if consecutive_errors >= max_consecutive_errors:
-                    logger.error("خطاهای متوالی، خواب طولانی...")
-                    time.sleep(300)
-                    consecutive_errors = 0
-                else:
-                    time.sleep(120)
-        
+    
+    def finish_processing(self):
+        """ثبت پایان پردازش پیام‌ها"""
         self.running = False
         logger.info("پردازش پیام‌ها متوقف شد")
     
+    def process_messages(self):
+        """پردازش پیام‌های دریافتی به صورت کاملاً هوشمند"""
+        self.start_processing()
+        
+        try:
+            while not self.stop_event.is_set():
+                delay, _ = self.run_cycle()
+                self.smart_sleep(delay)
+        except KeyboardInterrupt:
+            logger.info("توقف توسط کاربر")
+        finally:
+            self.finish_processing()
+    
     def run_bot(self):
         """اجرای ربات با مدیریت خطای پیشرفته"""
         try:
@@ -208,21 +302,22 @@ class BaseBot(ABC):
                 self.process_messages()
             else:
                 logger.error("عدم توانایی در ورود به سیستم")
-                time.sleep(300)
+                self.pause(300)
         except Exception as e:
             logger.error(f"خطا در اجرای ربات: {e}")
-            time.sleep(300)
+            self.pause(300)
     
     def stop_bot(self):
         """توقف ایمن ربات"""
         try:
             logger.info("درخواست توقف ربات...")
             
+            # رویداد توقف همیشه set می‌شود تا ربات منتظر تأیید هم بیدار شود
+            self.stop_event.set()
+            
             if not self.running:
                 logger.info("ربات از قبل متوقف شده است")
                 return True
-                
-            self.stop_event.set()
             
             timeout = 30
             start_time = time.time()
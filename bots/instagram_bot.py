@@ -1,16 +1,19 @@
 from instagrapi import Client
 from instagrapi.exceptions import TwoFactorRequired, ChallengeRequired, LoginRequired, ClientConnectionError, ClientError
 from instagrapi.types import DirectThread
-import os
-import json
 import logging
+import threading
 import time
 import random
-from typing import Dict, Any, Optional, Set, List, Tuple
+from typing import Dict, Any, Optional, List, Set, Tuple
 from datetime import datetime, timedelta
-from models import UserManager, MessageManager
+from models import UserManager, MessageManager, WatermarkManager, SessionStore, OutboundQueueManager
 from .base_bot import BaseBot
-import hashlib
+from .metrics import api_metrics
+from .outbound import OutboundDeferred, OutboundJob, OutboundSendError, get_outbound_dispatcher
+from .rate_limiter import account_keys, rate_limiter
+from .reply_templates import RenderContext, profile_cache, render_template, template_cache
+from .status_hub import status_hub
 
 logger = logging.getLogger(__name__)
 
@@ -29,6 +32,12 @@ class InstagramBot(BaseBot):
         self.user_manager = UserManager()
         self.message_manager = MessageManager()
         
+        # شناسه حساب یک بار از ایندکس حساب‌ها خوانده می‌شود
+        self.account_id = self.user_manager.get_account_id(user_id, instagram_username)
+        
+        # session فقط هنگام لاگین خوانده و فقط در صورت تغییر نوشته می‌شود
+        self.session_store = SessionStore(self.user_manager, self.session_file)
+        
         # متغیرهای مدیریت تأیید دو مرحله‌ای
         self.two_factor_required = False
         self.challenge_required = False
@@ -37,22 +46,40 @@ class InstagramBot(BaseBot):
         self.challenge_context = None
         self.verification_info = None
         
-        # مدیریت پیام‌های پردازش شده
-        self.processed_message_ids: Set[str] = set()
-        self.last_cleanup_time = time.time()
+        # آخرین پیام پردازش‌شده هر thread که در دیتابیس هم ذخیره می‌شود
+        self.watermark_manager = WatermarkManager()
+        self.watermarks: Optional[Dict[str, Tuple[str, float]]] = None
+        self.watermark_account_id: Optional[int] = None
+        
+        # صف پایدار پاسخ‌ها؛ شناسه ردیف‌هایی که به ارسال‌کننده سپرده شده‌اند
+        self.outbound_queue = OutboundQueueManager()
+        self.outbound_submitted: Set[int] = set()
+        self.outbound_lock = threading.Lock()
+        self.outbound_recovered = False
+        
+        # سطل‌های محدودیت نرخ مشترک (حساب و proxy خروجی)
+        self.rate_limit_keys = account_keys(instagram_username, getattr(self.client, 'proxy', None))
+        # خطای 429 یک حساب فقط سطل‌های همان حساب را سرد می‌کند، نه سطل مشترک proxy
+        self.rate_limit_cooldown_keys = account_keys(instagram_username)
+        self.rate_limit_cooldown_seconds = 300
         
-        # مدیریت هوشمند درخواست‌ها - بهینه‌شده برای سرعت
-        self.request_timestamps = []
-        self.request_count_5min = 0
-        self.last_request_reset = time.time()
-        self.rate_limit_detected = False
-        self.rate_limit_cooldown = 0
-        self.last_successful_request = time.time()
+        # تأخیرهای تصادفی انسانی (ثانیه) قبل از هر درخواست، قبل از لاگین و بین ارسال پاسخ‌ها
+        self.human_delay_range = (0.5, 1.5)
+        self.login_delay_range = (2, 5)
+        self.reply_delay_range = (1, 3)
+        
+        # حداکثر پیام خوانده‌نشده هر thread در یک بررسی و ادغام پاسخ‌ها در یک پیام
+        self.max_unread_per_thread = 20
+        self.max_reply_length = 1000
+        self.reply_separator = "\n\n"
         
         # کش برای کاهش درخواست‌های تکراری - کاهش زمان کش
         self.thread_cache = {}
         self.cache_expiry = 120  # کاهش به 2 دقیقه
         
+        # آخرین فعالیت دیده‌شده هر thread در لیست inbox برای همگام‌سازی افزایشی
+        self.thread_activity: Dict[str, Tuple[Any, Optional[str]]] = {}
+        
         logger.info(f"ربات سریع برای {instagram_username} راه‌اندازی شد")
 
     def setup_client_settings(self):
@@ -94,155 +121,150 @@ class InstagramBot(BaseBot):
         import string
         return 'android-' + ''.join(random.choices(string.hexdigits.lower(), k=16))
     
-    def update_request_stats(self):
-        """به‌روزرسانی آمار درخواست‌ها"""
-        current_time = time.time()
-        self.request_timestamps.append(current_time)
-        
-        # حذف درخواست‌های قدیمی‌تر از 5 دقیقه
-        self.request_timestamps = [ts for ts in self.request_timestamps if current_time - ts < 300]
-        self.request_count_5min = len(self.request_timestamps)
-        
-        # بازنشانی شمارنده هر 5 دقیقه
-        if current_time - self.last_request_reset > 300:
-            self.request_count_5min = 0
-            self.last_request_reset = current_time
+    def acquire_request_slot(self) -> bool:
+        """گرفتن اجازه درخواست از محدودکننده نرخ مشترک؛ در صورت توقف ربات False"""
+        return rate_limiter.acquire(self.rate_limit_keys, sleep=self.pause)
     
-    def can_make_request(self) -> Tuple[bool, float]:
-        """بررسی امکان انجام درخواست جدید - بهینه‌شده برای سرعت"""
-        current_time = time.time()
-        
-        # اگر در حالت cooldown هستیم
-        if self.rate_limit_detected and current_time - self.rate_limit_cooldown < 300:
-            wait_time = self.rate_limit_cooldown + 300 - current_time
-            return False, wait_time
-        
-        # محدودیت نرخ درخواست - افزایش برای سرعت بیشتر
-        max_requests_per_5min = 60  # افزایش محدودیت
-        
-        if self.request_count_5min >= max_requests_per_5min:
-            # محاسبه زمان انتظار تا آزاد شدن slot
-            oldest_request = min(self.request_timestamps) if self.request_timestamps else current_time
-            wait_time = oldest_request + 300 - current_time
-            return False, wait_time
-        
-        # فاصله زمانی بین درخواست‌ها - کاهش شدید برای سرعت
-        time_since_last_request = current_time - self.last_successful_request
-        min_interval = 1.5  # کاهش به 1.5 ثانیه
-        
-        if time_since_last_request < min_interval:
-            return False, min_interval - time_since_last_request
+    async def acquire_request_slot_async(self) -> bool:
+        """نسخه ناهمگام acquire_request_slot؛ انتظار روی event loop سپری می‌شود"""
+        return await rate_limiter.acquire_async(self.rate_limit_keys, sleep=self.pause_async)
+    
+    def call_api(self, api_method, *args, **kwargs):
+        """فراخوانی مستقیم API همراه با ثبت تعداد، خطا و تأخیر در metrics"""
+        method = getattr(api_method, '__name__', str(api_method))
+        started = time.perf_counter()
+        try:
+            result = api_method(*args, **kwargs)
+        except Exception:
+            api_metrics.observe(self.instagram_username, method, time.perf_counter() - started, error=True)
+            raise
+        api_metrics.observe(self.instagram_username, method, time.perf_counter() - started)
+        return result
+    
+    def api_retry_delay(self, error: Exception, method: str, retry_count: int, max_retries: int) -> Optional[float]:
+        """تصمیم پس از خطای API: زمان انتظار تا تلاش مجدد یا None برای کنار گذاشتن فراخوانی"""
+        if isinstance(error, (ClientError, ConnectionError)):
+            if "rate limit" in str(error).lower() or "too many requests" in str(error).lower():
+                logger.warning("محدودیت نرخ درخواست شناسایی شد")
+                api_metrics.increment(self.instagram_username, method, "rate_limited")
+                # دوره سرد شدن فقط روی سطل‌های همین حساب اعمال می‌شود تا حساب‌های دیگر متوقف نشوند
+                rate_limiter.penalize(self.rate_limit_cooldown_keys, self.rate_limit_cooldown_seconds)
+                
+                if retry_count < max_retries - 1:
+                    wait_time = (2 ** retry_count) * 30  # کاهش زمان انتظار
+                    logger.info(f"انتظار برای {wait_time} ثانیه قبل از تلاش مجدد")
+                    api_metrics.increment(self.instagram_username, method, "retries")
+                    return wait_time
+            
+            logger.error(f"خطای API: {error}")
+            return None
         
-        return True, 0
+        logger.error(f"خطای غیرمنتظره در فراخوانی API: {error}")
+        if retry_count < max_retries - 1:
+            api_metrics.increment(self.instagram_username, method, "retries")
+            return 2  # کاهش زمان انتظار
+        return None
+    
+    def try_api_call(self, api_method, *args, **kwargs):
+        """یک تلاش بدون هیچ انتظاری، برای workerهای مشترک ارسال
+
+        اگر محدودکننده نرخ اجازه ندهد OutboundDeferred و در صورت خطای API
+        (پس از ثبت metrics و دوره سرد شدن 429) OutboundSendError ایجاد می‌شود.
+        """
+        wait = rate_limiter.try_acquire(self.rate_limit_keys)
+        if wait > 0:
+            raise OutboundDeferred(wait)
+        method = getattr(api_method, '__name__', str(api_method))
+        try:
+            return self.call_api(api_method, *args, **kwargs)
+        except Exception as e:
+            self.api_retry_delay(e, method, 0, 1)
+            raise OutboundSendError(f"فراخوانی {method} ناموفق بود: {e}") from e
     
     def safe_api_call(self, api_method, *args, **kwargs):
         """فراخوانی ایمن API با مدیریت خطا - بهینه‌شده برای سرعت"""
         retry_count = 0
         max_retries = 2
+        method = getattr(api_method, '__name__', str(api_method))
         
         while retry_count < max_retries:
             try:
-                can_request, wait_time = self.can_make_request()
-                if not can_request and wait_time > 0:
-                    time.sleep(wait_time)
+                if not self.acquire_request_slot():
+                    return None
                 
                 # اضافه کردن تغییرات تصادفی انسانی - کاهش تأخیر
-                human_delay = random.uniform(0.5, 1.5)  # کاهش تأخیر
-                time.sleep(human_delay)
+                human_delay = random.uniform(*self.human_delay_range)  # کاهش تأخیر
+                if self.pause(human_delay):
+                    return None
                 
-                result = api_method(*args, **kwargs)
-                self.update_request_stats()
-                self.last_successful_request = time.time()
-                self.rate_limit_detected = False
+                return self.call_api(api_method, *args, **kwargs)
                 
-                return result
+            except Exception as e:
+                wait_time = self.api_retry_delay(e, method, retry_count, max_retries)
+                if wait_time is None:
+                    break
+                if self.pause(wait_time):
+                    return None
+                retry_count += 1
+        
+        return None
+    
+    async def safe_api_call_async(self, api_method, *args, **kwargs):
+        """نسخه ناهمگام safe_api_call برای BotRuntime
+
+        فقط خود فراخوانی instagrapi در executor اجرا می‌شود؛ انتظار محدودکننده
+        نرخ، تأخیر انسانی و انتظار تلاش مجدد روی event loop سپری می‌شوند و
+        هیچ thread‌ی را اشغال نمی‌کنند.
+        """
+        retry_count = 0
+        max_retries = 2
+        method = getattr(api_method, '__name__', str(api_method))
+        
+        while retry_count < max_retries:
+            try:
+                if not await self.acquire_request_slot_async():
+                    return None
                 
-            except (ClientError, ConnectionError) as e:
-                if "rate limit" in str(e).lower() or "too many requests" in str(e).lower():
-                    logger.warning("محدودیت نرخ درخواست شناسایی شد")
-                    self.rate_limit_detected = True
-                    self.rate_limit_cooldown = time.time()
-                    
-                    if retry_count < max_retries - 1:
-                        wait_time = (2 ** retry_count) * 30  # کاهش زمان انتظار
-                        logger.info(f"انتظار برای {wait_time} ثانیه قبل از تلاش مجدد")
-                        time.sleep(wait_time)
-                        retry_count += 1
-                        continue
+                if await self.pause_async(random.uniform(*self.human_delay_range)):
+                    return None
                 
-                logger.error(f"خطای API: {e}")
-                break
+                return await self.run_blocking(self.call_api, api_method, *args, **kwargs)
                 
             except Exception as e:
-                logger.error(f"خطای غیرمنتظره در فراخوانی API: {e}")
-                if retry_count < max_retries - 1:
-                    time.sleep(2)  # کاهش زمان انتظار
-                    retry_count += 1
-                    continue
-                break
+                wait_time = self.api_retry_delay(e, method, retry_count, max_retries)
+                if wait_time is None:
+                    break
+                if await self.pause_async(wait_time):
+                    return None
+                retry_count += 1
         
         return None
 
     def load_session(self) -> bool:
-        """بارگذاری session از دیتابیس"""
+        """بارگذاری session از دیتابیس (با fallback به فایل)"""
         try:
-            account_data = self.user_manager.get_account_credentials(
-                self.get_account_id(), self.user_id
-            )
-            
-            if account_data and account_data['session_data']:
-                session_data = json.loads(account_data['session_data'])
+            session_data = self.session_store.load(self.get_account_id())
+            if session_data:
                 self.client.set_settings(session_data)
-                logger.info("Session از دیتابیس بارگذاری شد")
                 return True
-                
-            # Fallback به فایل اگر در دیتابیس وجود نداشت
-            if os.path.exists(self.session_file):
-                with open(self.session_file, 'r') as f:
-                    session_data = json.load(f)
-                
-                if session_data and 'authorization_data' in session_data:
-                    self.client.set_settings(session_data)
-                    # ذخیره در دیتابیس برای دفعات بعد
-                    self.user_manager.update_account_session(
-                        self.get_account_id(), json.dumps(session_data)
-                    )
-                    logger.info("Session از فایل بارگذاری و در دیتابیس ذخیره شد")
-                    return True
-                    
             return False
         except Exception as e:
             logger.error(f"خطا در بارگذاری session: {e}")
             return False
     
     def save_session(self) -> bool:
-        """ذخیره session در دیتابیس"""
+        """ذخیره session در دیتابیس و فایل پشتیبان در صورت تغییر"""
         try:
-            session_data = self.client.get_settings()
-            if session_data:
-                # ذخیره در دیتابیس
-                success = self.user_manager.update_account_session(
-                    self.get_account_id(), json.dumps(session_data)
-                )
-                
-                # همچنین در فایل هم ذخیره کنید (به عنوان پشتیبان)
-                with open(self.session_file, 'w') as f:
-                    json.dump(session_data, f)
-                
-                logger.info("Session در دیتابیس و فایل ذخیره شد")
-                return success
-            return False
+            return self.session_store.save(self.get_account_id(), self.client.get_settings())
         except Exception as e:
             logger.error(f"خطا در ذخیره session: {e}")
             return False
     
     def get_account_id(self) -> int:
-        """دریافت ID حساب از دیتابیس"""
-        accounts = self.user_manager.get_user_accounts(self.user_id)
-        for account in accounts:
-            if account['instagram_username'] == self.instagram_username:
-                return account['id']
-        return -1
+        """دریافت ID حساب (در صورت پیدا نشدن هنگام ساخت ربات، دوباره جستجو می‌شود)"""
+        if self.account_id == -1:
+            self.account_id = self.user_manager.get_account_id(self.user_id, self.instagram_username)
+        return self.account_id
     
     def is_logged_in(self) -> bool:
         """بررسی آیا کاربر وارد شده است"""
@@ -252,7 +274,7 @@ class InstagramBot(BaseBot):
             
             try:
                 # تست اتصال با یک درخواست سبک
-                self.client.get_timeline_feed(amount=1)
+                self.call_api(self.client.get_timeline_feed, amount=1)
                 return True
             except (LoginRequired, Exception) as e:
                 logger.debug(f"نیاز به لاگین مجدد: {e}")
@@ -293,6 +315,7 @@ class InstagramBot(BaseBot):
                 "two_factor": True,
                 "challenge": False
             }
+            self.publish_status()
             
             return True
             
@@ -314,6 +337,7 @@ class InstagramBot(BaseBot):
                 "two_factor": False,
                 "challenge": True
             }
+            self.publish_status()
             
             return True
             
@@ -337,6 +361,7 @@ class InstagramBot(BaseBot):
                         self.client.send_two_factor_login_email(user_id)
                     self.verification_method = method
                     self.verification_info["method"] = method
+                    self.publish_status()
                     logger.info(f"کد تأیید از طریق {method} ارسال شد")
                     return True
                     
@@ -345,6 +370,7 @@ class InstagramBot(BaseBot):
                 self.client.challenge_resend(self.challenge_context, choice)
                 self.verification_method = method
                 self.verification_info["method"] = method
+                self.publish_status()
                 logger.info(f"کد تأیید از طریق {method} ارسال شد")
                 return True
                 
@@ -366,6 +392,8 @@ class InstagramBot(BaseBot):
                     if result:
                         self.two_factor_required = False
                         self.save_session()
+                        self.publish_status()
+                        self.wake()
                         logger.info("ورود با کد تأیید دو مرحله‌ای موفقیت‌آمیز بود")
                         return True
             
@@ -374,6 +402,8 @@ class InstagramBot(BaseBot):
                 if self.is_logged_in():
                     self.challenge_required = False
                     self.save_session()
+                    self.publish_status()
+                    self.wake()
                     logger.info("چالش امنیتی با موفقیت حل شد")
                     return True
             
@@ -384,15 +414,43 @@ class InstagramBot(BaseBot):
             logger.error(f"خطا در ارسال کد تأیید: {e}")
             return False
     
+    def needs_verification(self) -> bool:
+        """آیا ربات منتظر تأیید دو مرحله‌ای یا چالش امنیتی است"""
+        return self.two_factor_required or self.challenge_required
+    
     def get_verification_status(self) -> Dict[str, Any]:
         """دریافت وضعیت تأیید دو مرحله‌ای"""
         return {
-            "needs_verification": self.two_factor_required or self.challenge_required,
+            "needs_verification": self.needs_verification(),
             "method": self.verification_method,
             "username": self.instagram_username,
             "verification_info": self.verification_info
         }
     
+    def get_status(self) -> Dict[str, Any]:
+        """وضعیت فعلی ربات برای انتشار در status_hub"""
+        if self.needs_verification():
+            state = "verification"
+        elif self.running:
+            state = "running"
+        elif self.stop_event.is_set():
+            state = "stopped"
+        else:
+            state = "starting"
+        
+        return {
+            "state": state,
+            "running": self.running,
+            "verification_status": self.get_verification_status()
+        }
+    
+    def publish_status(self):
+        """انتشار وضعیت ربات؛ وضعیت تکراری توسط hub نادیده گرفته می‌شود"""
+        try:
+            status_hub.publish(self.get_account_id(), self.user_id, self.get_status())
+        except Exception as e:
+            logger.error(f"خطا در انتشار وضعیت ربات: {e}")
+    
     def login(self) -> bool:
         """ورود به اینستاگرام با پشتیبانی از تأیید دو مرحله‌ای"""
         max_retries = 2
@@ -413,7 +471,8 @@ class InstagramBot(BaseBot):
                 
                 try:
                     # کاهش تأخیر بین درخواست‌ها
-                    time.sleep(random.uniform(2, 5))
+                    if self.pause(random.uniform(*self.login_delay_range)):
+                        return False
                     
                     result = self.safe_api_call(
                         self.client.login, 
@@ -439,39 +498,84 @@ class InstagramBot(BaseBot):
                 except ClientConnectionError:
                     logger.error("خطای اتصال. لطفاً VPN خود را بررسی کنید")
                     if attempt < max_retries - 1:
-                        time.sleep(15)
+                        self.pause(15)
                         continue
                 
             except Exception as e:
                 logger.error(f"خطا در ورود: {e}")
                 if attempt < max_retries - 1:
-                    time.sleep(15)
+                    self.pause(15)
         
         return False
     
-    def cleanup_old_processed_messages(self):
-        """پاکسازی پیام‌های پردازش شده قدیمی"""
-        current_time = time.time()
-        # هر 30 دقیقه یکبار پاکسازی انجام شود
-        if current_time - self.last_cleanup_time > 1800:
-            logger.info("پاکسازی پیام‌های پردازش شده قدیمی")
-            
-            # فقط پیام‌های قدیمی‌تر از 12 ساعت را پاک کن
-            twenty_four_hours_ago = current_time - (12 * 3600)
-            self.processed_message_ids = set(
-                msg_id for msg_id in self.processed_message_ids
-            )
-            
-            self.last_cleanup_time = current_time
+    def load_watermarks(self) -> Dict[str, Tuple[str, float]]:
+        """بارگذاری watermark‌های حساب در حافظه (یک بار برای هر اجرا)"""
+        if self.watermarks is None:
+            self.watermark_account_id = self.get_account_id()
+            self.watermarks = self.watermark_manager.get_watermarks(self.watermark_account_id)
+            logger.info(f"{len(self.watermarks)} watermark برای {self.instagram_username} بارگذاری شد")
+        return self.watermarks
+    
+    def get_message_timestamp(self, message) -> float:
+        """زمان پیام به صورت ثانیه"""
+        timestamp = message.timestamp
+        return timestamp.timestamp() if hasattr(timestamp, 'timestamp') else float(timestamp)
+    
+    def is_message_processed(self, thread_id: str, message_id: str, message_time: float) -> bool:
+        """مقایسه پیام با watermark thread"""
+        watermark = self.load_watermarks().get(thread_id)
+        if not watermark:
+            return False
+        last_item_id, last_timestamp = watermark
+        return str(message_id) == last_item_id or message_time < last_timestamp
+    
+    def remember_watermark(self, thread_id: str, message_id: str, message_time: float):
+        """پیش بردن watermark در حافظه؛ watermark هرگز به عقب برنمی‌گردد"""
+        watermarks = self.load_watermarks()
+        current = watermarks.get(thread_id)
+        if current and current[1] > message_time:
+            return
+        watermarks[thread_id] = (str(message_id), message_time)
+    
+    def advance_watermark(self, thread_id: str, message_id: str, message_time: float):
+        """پیش بردن watermark در دیتابیس و سپس در حافظه"""
+        self.load_watermarks()
+        if self.watermark_manager.update_watermark(
+            self.watermark_account_id, thread_id, message_id, message_time
+        ):
+            self.remember_watermark(thread_id, message_id, message_time)
+    
+    def get_cached_threads(self) -> Optional[List[DirectThread]]:
+        """threads کش شده در صورت معتبر بودن کش"""
+        if self.thread_cache.get('threads') and time.time() - self.thread_cache.get('timestamp', 0) < self.cache_expiry:
+            logger.debug("استفاده از threads کش شده")
+            return self.thread_cache['threads']
+        return None
+    
+    def cache_threads(self, threads: List[DirectThread], timestamp: float) -> List[DirectThread]:
+        self.thread_cache = {
+            'threads': threads,
+            'timestamp': timestamp
+        }
+        return threads
+    
+    @staticmethod
+    def pending_threads(pending_result) -> List[DirectThread]:
+        """threads موجود در پاسخ direct_pending_inbox"""
+        if isinstance(pending_result, list):
+            return pending_result
+        if pending_result and hasattr(pending_result, 'threads'):
+            return list(pending_result.threads)
+        return []
     
     def get_all_threads(self) -> List[DirectThread]:
         """دریافت تمام threads با مدیریت هوشمند - بهینه‌شده برای سرعت"""
         current_time = time.time()
         
         # بررسی کش اول
-        if self.thread_cache.get('threads') and current_time - self.thread_cache.get('timestamp', 0) < self.cache_expiry:
-            logger.debug("استفاده از threads کش شده")
-            return self.thread_cache['threads']
+        cached = self.get_cached_threads()
+        if cached is not None:
+            return cached
         
         threads = []
         
@@ -486,25 +590,113 @@ class InstagramBot(BaseBot):
         # دریافت threads دیگر با احتمال بیشتر
         if random.random() < 0.5:  # افزایش به 50% مواقع
             try:
-                pending_result = self.safe_api_call(self.client.direct_pending_inbox)
-                if pending_result and hasattr(pending_result, 'threads'):
-                    threads.extend(pending_result.threads)
+                threads.extend(self.pending_threads(self.safe_api_call(self.client.direct_pending_inbox)))
             except Exception as e:
                 logger.warning(f"خطا در دریافت threads pending: {e}")
         
         # ذخیره در کش
-        self.thread_cache = {
-            'threads': threads,
-            'timestamp': current_time
-        }
+        return self.cache_threads(threads, current_time)
+    
+    async def get_all_threads_async(self) -> List[DirectThread]:
+        """نسخه ناهمگام get_all_threads"""
+        current_time = time.time()
         
-        return threads
+        cached = self.get_cached_threads()
+        if cached is not None:
+            return cached
+        
+        threads = []
+        
+        try:
+            main_threads = await self.safe_api_call_async(self.client.direct_threads, amount=15)
+            if main_threads:
+                threads.extend(main_threads)
+        except Exception as e:
+            logger.warning(f"خطا در دریافت threads اصلی: {e}")
+        
+        if random.random() < 0.5:
+            try:
+                threads.extend(self.pending_threads(await self.safe_api_call_async(self.client.direct_pending_inbox)))
+            except Exception as e:
+                logger.warning(f"خطا در دریافت threads pending: {e}")
+        
+        return self.cache_threads(threads, current_time)
 
+    def get_thread_activity_marker(self, thread: DirectThread) -> Tuple[Any, Optional[str]]:
+        """نشانگر آخرین فعالیت thread بر اساس اطلاعات موجود در لیست inbox"""
+        last_item_id = None
+        if getattr(thread, 'messages', None):
+            last_item_id = getattr(thread.messages[0], 'id', None)
+        return getattr(thread, 'last_activity_at', None), last_item_id
+    
+    def needs_full_thread(self, thread: DirectThread, current_user_id) -> bool:
+        """آیا پیام‌های payload لیست inbox پیش از رسیدن به watermark یا پاسخ حساب تمام می‌شوند
+
+        payload لیست inbox فقط چند پیام آخر هر thread را دارد؛ اگر پیام‌های
+        خوانده‌نشده بیشتر از آن باشند، پیام‌های قدیمی‌تر فقط با direct_thread دیده می‌شوند.
+        """
+        messages = getattr(thread, 'messages', None)
+        if not messages:
+            return True
+        unread, reached_boundary = self.walk_unread_messages(thread.id, messages, current_user_id)
+        return bool(unread) and not reached_boundary
+    
+    def get_thread_with_messages(self, thread: DirectThread, current_user_id) -> Optional[DirectThread]:
+        """دریافت پیام‌های thread؛ فقط اگر payload لیست inbox برای رسیدن به watermark کافی نباشد درخواست جدید ارسال می‌شود"""
+        if not self.needs_full_thread(thread, current_user_id):
+            return thread
+        return self.safe_api_call(self.client.direct_thread, thread.id, amount=self.max_unread_per_thread)
+    
+    async def get_thread_with_messages_async(self, thread: DirectThread, current_user_id) -> Optional[DirectThread]:
+        if not self.needs_full_thread(thread, current_user_id):
+            return thread
+        return await self.safe_api_call_async(self.client.direct_thread, thread.id,
+                                              amount=self.max_unread_per_thread)
+    
+    def process_thread(self, thread: DirectThread, full_thread: DirectThread,
+                       activity_marker: Tuple[Any, Optional[str]], current_user_id) -> bool:
+        """ثبت پاسخ پیام‌های خوانده‌نشده یک thread در صف ارسال؛ True اگر پاسخی ثبت شد"""
+        # از اینجا به بعد thread بررسی شده حساب می‌شود
+        self.thread_activity[thread.id] = activity_marker
+        
+        # پروفایل فرستنده‌ها از همین payload برای placeholderهای پاسخ نگه داشته می‌شود
+        profile_cache.remember_users(getattr(full_thread, 'users', None))
+        
+        unread = self.collect_unread_messages(thread.id, full_thread.messages, current_user_id)
+        if not unread:
+            return False
+        
+        newest = unread[-1]
+        newest_time = self.get_message_timestamp(newest)
+        replies = self.resolve_replies(unread)
+        if replies:
+            # ارسال در صف مشترک انجام می‌شود و بررسی threadهای بعدی منتظر آن نمی‌ماند؛
+            # watermark در همان تراکنش ثبت صف تا جدیدترین پیام جلو می‌رود
+            if not self.enqueue_replies(thread.id, newest.user_id, newest.id, replies,
+                                        self.get_message_timestamp(unread[0]), newest_time):
+                # بدون ثبت در صف، watermark جلو نمی‌رود تا thread دوباره بررسی شود
+                self.thread_activity.pop(thread.id, None)
+                return False
+            return True
+        
+        self.advance_watermark(thread.id, newest.id, newest_time)
+        return False
+    
+    def prune_thread_activity(self, threads: List[DirectThread]):
+        """فقط threadهای موجود در لیست فعلی نگه داشته می‌شوند تا حافظه محدود بماند"""
+        listed_ids = {thread.id for thread in threads}
+        self.thread_activity = {
+            thread_id: marker for thread_id, marker in self.thread_activity.items()
+            if thread_id in listed_ids
+        }
+        self.last_activity_check = time.time()
+    
     def check_new_messages(self) -> bool:
         """بررسی وجود پیام جدید با الگوریتم هوشمند - بهینه‌شده برای سرعت"""
         try:
-            # پاکسازی پیام‌های قدیمی
-            self.cleanup_old_processed_messages()
+            # پاسخ‌های مانده از اجرای قبلی یا تلاش‌های ناموفق سررسیده دوباره در صف قرار می‌گیرند،
+            # حتی وقتی inbox خالی است یا دریافت آن شکست می‌خورد
+            self.resume_outbound()
             
             # دریافت threads با مدیریت هوشمند
             threads = self.get_all_threads()
@@ -523,65 +715,74 @@ class InstagramBot(BaseBot):
                     break
                 
                 try:
-                    # دریافت کامل thread با cache کوتاه‌تر
-                    thread_hash = hashlib.md5(thread.id.encode()).hexdigest()
-                    cache_key = f"thread_{thread_hash}"
-                    
-                    if cache_key in self.thread_cache and time.time() - self.thread_cache[cache_key]['timestamp'] < 60:
-                        full_thread = self.thread_cache[cache_key]['data']
-                    else:
-                        full_thread = self.safe_api_call(self.client.direct_thread, thread.id)
-                        if full_thread:
-                            self.thread_cache[cache_key] = {
-                                'data': full_thread,
-                                'timestamp': time.time()
-                            }
-                    
-                    if not full_thread or not full_thread.messages:
+                    # threadهایی که از آخرین بررسی تغییری نکرده‌اند هیچ درخواستی ندارند
+                    activity_marker = self.get_thread_activity_marker(thread)
+                    if self.thread_activity.get(thread.id) == activity_marker:
                         continue
-                            
-                    last_message = full_thread.messages[0]
-                    message_id = getattr(last_message, 'id', None)
                     
-                    # بررسی اینکه پیام از کاربر فعلی نیست
-                    if last_message.user_id == current_user_id:
-                        continue
-                    
-                    if not message_id or message_id in self.processed_message_ids:
+                    full_thread = self.get_thread_with_messages(thread, current_user_id)
+                    if not full_thread or not full_thread.messages:
                         continue
                     
-                    # بررسی زمان پیام - کاهش زمان بررسی
-                    message_time = last_message.timestamp.timestamp() if hasattr(last_message.timestamp, 'timestamp') else last_message.timestamp
-                    if message_time < (time.time() - 86400):  # فقط پیام‌های 24 ساعت اخیر
+                    if self.process_thread(thread, full_thread, activity_marker, current_user_id):
+                        has_activity = True
+                        
+                except Exception as e:
+                    logger.error(f"خطا در پردازش مکالمه {thread.id}: {e}")
+                    continue
+                
+            self.prune_thread_activity(threads)
+            return has_activity
+
+        except LoginRequired:
+            logger.warning("Session منقضی شده")
+            raise
+        except Exception as e:
+            logger.error(f"خطا در بررسی پیام‌ها: {e}")
+            return False
+    
+    async def check_new_messages_async(self) -> bool:
+        """نسخه ناهمگام check_new_messages برای BotRuntime
+
+        درخواست‌های API با safe_api_call_async و کار دیتابیس (صف ارسال و
+        watermark) با run_blocking انجام می‌شود.
+        """
+        try:
+            await self.run_blocking(self.resume_outbound)
+            
+            threads = await self.get_all_threads_async()
+            
+            if not threads:
+                logger.debug("هیچ threadی یافت نشد")
+                return False
+            
+            logger.info(f"تعداد threads یافت شده: {len(threads)}")
+            
+            has_activity = False
+            current_user_id = self.client.user_id
+
+            for thread in threads:
+                if self.stop_event.is_set():
+                    break
+                
+                try:
+                    activity_marker = self.get_thread_activity_marker(thread)
+                    if self.thread_activity.get(thread.id) == activity_marker:
                         continue
                     
-                    message_text = last_message.text.strip() if last_message.text else ""
-                    if not message_text:
+                    full_thread = await self.get_thread_with_messages_async(thread, current_user_id)
+                    if not full_thread or not full_thread.messages:
                         continue
                     
-                    # علامتگذاری پیام به عنوان پردازش شده
-                    self.processed_message_ids.add(message_id)
-
-                    # پردازش پیام
-                    response = self.process_message_content(message_text)
-                    
-                    if response:
-                        # تأخیر کمتر قبل از ارسال پاسخ
-                        can_request, wait_time = self.can_make_request()
-                        if not can_request and wait_time > 0:
-                            time.sleep(wait_time)
-                        
-                        self.send_response(response, thread.id, last_message.user_id, message_text)
+                    if await self.run_blocking(self.process_thread, thread, full_thread,
+                                               activity_marker, current_user_id):
                         has_activity = True
                         
-                        # تأخیر کمتر بین ارسال پاسخ‌ها
-                        time.sleep(random.uniform(1, 3))  # کاهش تأخیر
-                        
                 except Exception as e:
                     logger.error(f"خطا در پردازش مکالمه {thread.id}: {e}")
                     continue
                 
-            self.last_activity_check = time.time()
+            self.prune_thread_activity(threads)
             return has_activity
 
         except LoginRequired:
@@ -591,46 +792,244 @@ class InstagramBot(BaseBot):
             logger.error(f"خطا در بررسی پیام‌ها: {e}")
             return False
 
-    def process_message_content(self, message_text: str) -> str:
-        """پردازش محتوای پیام و تولید پاسخ"""
+    def walk_unread_messages(self, thread_id: str, messages: List[Any], current_user_id) -> Tuple[List[Any], bool]:
+        """پیام‌های مشتری از جدیدترین به عقب تا watermark یا آخرین پاسخ حساب
+
+        خروجی: (پیام‌ها از جدید به قدیم، آیا پیمایش به watermark، پاسخ حساب یا
+        سقف max_unread_per_thread رسید یا پیام‌ها زودتر تمام شدند)
+        """
+        unread = []
+        for message in messages:
+            # پیام‌های قبل از آخرین پاسخ خود حساب قبلاً جواب گرفته‌اند
+            if message.user_id == current_user_id:
+                return unread, True
+            message_id = getattr(message, 'id', None)
+            if not message_id:
+                continue
+            if self.is_message_processed(thread_id, message_id, self.get_message_timestamp(message)):
+                return unread, True
+            unread.append(message)
+            if len(unread) >= self.max_unread_per_thread:
+                return unread, True
+        return unread, False
+    
+    def collect_unread_messages(self, thread_id: str, messages: List[Any], current_user_id) -> List[Any]:
+        """پیام‌های مشتری از جدیدترین به عقب تا watermark یا آخرین پاسخ حساب، به ترتیب قدیمی به جدید"""
+        unread, _ = self.walk_unread_messages(thread_id, messages, current_user_id)
+        unread.reverse()
+        return unread
+    
+    def resolve_replies(self, messages: List[Any]) -> List[Tuple[str, str]]:
+        """پاسخ هر پیام خوانده‌نشده به صورت (متن پیام، پاسخ)؛ پاسخ تکراری پشت سر هم یک بار ارسال می‌شود"""
+        replies = []
+        oldest_allowed = time.time() - 86400  # فقط پیام‌های 24 ساعت اخیر
+        for message in messages:
+            if self.get_message_timestamp(message) < oldest_allowed:
+                continue
+            message_text = message.text.strip() if message.text else ""
+            if not message_text:
+                continue
+            response = self.process_message_content(message_text, message.user_id)
+            if not response:
+                continue
+            if replies and replies[-1][1] == response:
+                continue
+            replies.append((message_text, response))
+        return replies
+    
+    def coalesce_replies(self, replies: List[Tuple[str, str]]) -> List[Tuple[str, List[str]]]:
+        """ادغام پاسخ‌های پشت سر هم در کمترین تعداد پیام با رعایت حداکثر طول
+
+        خروجی: لیست (متن ارسالی، پیام‌های اصلی پاسخ داده‌شده در آن)
+        """
+        batches: List[Tuple[str, List[str]]] = []
+        for original, response in replies:
+            if batches:
+                text, originals = batches[-1]
+                combined = text + self.reply_separator + response
+                if len(combined) <= self.max_reply_length:
+                    batches[-1] = (combined, originals + [original])
+                    continue
+            batches.append((response, [original]))
+        return batches
+
+    def process_message_content(self, message_text: str, sender_id: Optional[str] = None) -> str:
+        """پردازش محتوای پیام و تولید پاسخ با جایگذاری placeholderهای قالب"""
         try:
-            if message_text.isdigit():
-                response = self.message_manager.get_message(self.user_id, message_text)
-            else:
-                response = self.message_manager.get_message(self.user_id, message_text.lower())
+            # جدول پاسخ کش‌شده هم کلیدهای دقیق و هم کلیدهای متنی داخل پیام را پیدا می‌کند
+            reply = self.message_manager.get_reply(self.user_id, message_text)
+            if not reply:
+                return ""
+            
+            message_id, version, content = reply
+            compiled = template_cache.get(message_id, version, content)
+            response = render_template(compiled, RenderContext(profile_cache.get(sender_id)))
             
             return response.strip() if response else ""
         except Exception as e:
             logger.error(f"خطا в پردازش محتوای پیام: {e}")
             return ""
 
-    def send_response(self, response: str, thread_id: str, user_id: str, original_message: str):
-        """ارسال پاسخ به پیام"""
+    def enqueue_replies(self, thread_id: str, user_id: str, item_id: str,
+                        replies: List[Tuple[str, str]], received_at: float, item_time: float) -> bool:
+        """ثبت پاسخ‌های یک thread در صف پایدار و سپردن آن به ارسال‌کننده مشترک
+
+        watermark تا item_id در همان تراکنش ثبت صف جلو می‌رود، پس پس از crash
+        پیام‌های پاسخ‌داده‌شده دوباره جمع نمی‌شوند؛ بررسی دوباره همان پیام‌ها
+        هم به همان ردیف صف می‌رسد و پاسخ تکراری نمی‌سازد.
+        """
+        outbound_id = self.outbound_queue.enqueue(
+            self.get_account_id(), thread_id, user_id, str(item_id), replies, received_at,
+            watermark=(str(item_id), item_time),
+        )
+        if outbound_id is None:
+            return False
+        self.remember_watermark(thread_id, item_id, item_time)
+        self.submit_outbound(outbound_id, thread_id, user_id, replies, received_at)
+        return True
+    
+    def resume_outbound(self):
+        """بازیابی ارسال‌های نیمه‌تمام (یک بار در هر اجرا) و سپردن ردیف‌های سررسیده به ارسال‌کننده"""
+        account_id = self.get_account_id()
+        if not self.outbound_recovered:
+            self.outbound_queue.recover(account_id)
+            self.outbound_recovered = True
+        for row in self.outbound_queue.get_due(account_id):
+            self.submit_outbound(row["id"], row["thread_id"], row["recipient_id"],
+                                 row["replies"], row["received_at"])
+
+    def submit_outbound(self, outbound_id: int, thread_id: str, user_id: str,
+                        replies: List[Tuple[str, str]], received_at: float):
+        """سپردن ردیف صف به ارسال‌کننده؛ تأخیر انسانی بین پاسخ‌ها cooldown حساب است"""
+        with self.outbound_lock:
+            if outbound_id in self.outbound_submitted:
+                return
+            self.outbound_submitted.add(outbound_id)
+        get_outbound_dispatcher().submit(OutboundJob(
+            account=self.instagram_username,
+            thread_id=thread_id,
+            user_id=user_id,
+            replies=replies,
+            received_at=received_at,
+            send=lambda job: self.deliver_outbound(outbound_id),
+            rate_keys=self.rate_limit_keys,
+            cooldown=random.uniform(*self.reply_delay_range),
+        ))
+
+    def deliver_outbound(self, outbound_id: int):
+        """یک گام ارسال ردیف صف: بررسی تحویل قبلی، ارسال یک بخش یا علامتگذاری خوانده‌شده
+
+        هر گام حداکثر یک فراخوانی API بدون انتظار است؛ فاصله انسانی تا گام بعد
+        با OutboundDeferred به ارسال‌کننده سپرده می‌شود تا worker مشترک نخوابد.
+        در صورت خطا تلاش مجدد با فاصله نمایی در صف پایدار زمان‌بندی می‌شود.
+        """
+        deferred = False
         try:
-            # ارسال پاسخ
-            self.client.direct_send(response, thread_ids=[thread_id])
-            
-            # لاگ کردن ارسال
+            row = self.outbound_queue.claim(outbound_id)
+            if row is None:
+                return
+            if self.stop_event.is_set():
+                self.outbound_queue.release(outbound_id)
+                return
+            try:
+                self.deliver_outbound_step(outbound_id, row)
+            except OutboundDeferred:
+                deferred = True
+                self.outbound_queue.defer(outbound_id)
+                raise
+            except Exception as e:
+                if self.stop_event.is_set():
+                    self.outbound_queue.release(outbound_id)
+                elif self.outbound_queue.mark_retry(outbound_id, str(e)) == "failed":
+                    logger.error(f"ارسال پاسخ thread {row['thread_id']} پس از چند تلاش کنار گذاشته شد: {e}")
+                raise
+            self.outbound_queue.mark_sent(outbound_id)
+        finally:
+            # ردیف به تعویق افتاده هنوز در صف ارسال‌کننده است
+            if not deferred:
+                with self.outbound_lock:
+                    self.outbound_submitted.discard(outbound_id)
+    
+    def deliver_outbound_step(self, outbound_id: int, row: Dict):
+        """اجرای گام بعدی ردیف claim‌شده؛ بازگشت عادی یعنی ارسال کامل شده است"""
+        thread_id = row["thread_id"]
+        batches = self.coalesce_replies(row["replies"])
+        sent_parts = row["sent_parts"]
+        
+        # ممکن است ارسال قبلی پیش از ثبت نتیجه به اینستاگرام رسیده باشد
+        if row["uncertain"] and sent_parts < len(batches):
+            if self.was_delivered(thread_id, batches[sent_parts][0], row["received_at"], self.try_api_call):
+                logger.info(f"پاسخ thread {thread_id} قبلاً تحویل شده بود")
+                sent_parts += 1
+            self.outbound_queue.record_progress(outbound_id, sent_parts)
+            raise OutboundDeferred(random.uniform(*self.human_delay_range))
+        
+        if sent_parts < len(batches):
+            text, originals = batches[sent_parts]
+            self.try_api_call(self.client.direct_send, text, thread_ids=[thread_id])
+            self.log_reply_part(thread_id, row["recipient_id"], originals)
+            self.outbound_queue.record_progress(outbound_id, sent_parts + 1)
+            # بخش بعدی یا علامتگذاری خوانده‌شده پس از تأخیر انسانی
+            raise OutboundDeferred(random.uniform(*self.human_delay_range))
+        
+        # علامتگذاری به عنوان خوانده شده؛ خطای آن باعث ارسال دوباره نمی‌شود
+        try:
+            self.try_api_call(self.client.direct_thread_mark_read, thread_id)
+        except OutboundSendError:
+            logger.warning(f"علامتگذاری thread {thread_id} به عنوان خوانده شده ناموفق بود")
+
+    def was_delivered(self, thread_id: str, text: str, since: float, api_call=None) -> bool:
+        """آیا پاسخی با همین متن پس از since از طرف حساب در thread دیده می‌شود"""
+        thread = (api_call or self.safe_api_call)(self.client.direct_thread, thread_id)
+        if thread is None:
+            raise OutboundSendError(f"بررسی تحویل پاسخ thread {thread_id} ممکن نشد")
+        own_id = str(self.client.user_id)
+        for message in getattr(thread, 'messages', None) or []:
+            if self.get_message_timestamp(message) < since:
+                break
+            if str(message.user_id) == own_id and (message.text or "") == text:
+                return True
+        return False
+
+    def log_reply_part(self, thread_id: str, user_id: str, originals: List[str]):
+        """ثبت ارسال برای هر پیام اصلی پاسخ داده‌شده در یک بخش"""
+        for original_message in originals:
             self.message_manager.log_message_sent(
-                self.user_id, original_message, thread_id, user_id
+                self.user_id, original_message, thread_id, user_id, self.get_account_id()
             )
+        logger.info(f"پاسخ به {len(originals)} پیام در thread {thread_id} ارسال شد")
+
+    def send_response(self, response: str, thread_id: str, user_id: str, original_message: str):
+        """ارسال پاسخ به پیام؛ در صورت خطا OutboundSendError"""
+        self.send_responses(thread_id, user_id, [(original_message, response)])
+    
+    def send_responses(self, thread_id: str, user_id: str, replies: List[Tuple[str, str]],
+                       sent_parts: int = 0, on_part_sent=None):
+        """ارسال پاسخ‌های یک thread با کمترین تعداد direct_send و یک علامتگذاری خوانده‌شده
+
+        ارسال از بخش sent_parts به بعد ادامه پیدا می‌کند و on_part_sent پس از
+        هر بخش (به جز آخرین) با تعداد بخش‌های ارسال‌شده فراخوانی می‌شود.
+        خطای ارسال با OutboundSendError گزارش می‌شود.
+        """
+        batches = self.coalesce_replies(replies)
+        for index in range(sent_parts, len(batches)):
+            text, originals = batches[index]
+            if self.safe_api_call(self.client.direct_send, text, thread_ids=[thread_id]) is None:
+                raise OutboundSendError(f"ارسال پاسخ به thread {thread_id} ناموفق بود")
+            self.log_reply_part(thread_id, user_id, originals)
             
-            logger.info(f"پاسخ به پیام '{original_message}' ارسال شد")
-            
-            # علامتگذاری به عنوان خوانده شده
-            try:
-                self.client.direct_thread_mark_read(thread_id)
-            except Exception as e:
-                logger.warning(f"خطا در علامتگذاری به عنوان خوانده شده: {e}")
-                
-        except Exception as e:
-            logger.error(f"خطا در ارسال پاسخ: {e}")
+            if on_part_sent is not None and index + 1 < len(batches):
+                on_part_sent(index + 1)
+        
+        # علامتگذاری به عنوان خوانده شده؛ خطای آن باعث ارسال دوباره نمی‌شود
+        if self.safe_api_call(self.client.direct_thread_mark_read, thread_id) is None:
+            logger.warning(f"علامتگذاری thread {thread_id} به عنوان خوانده شده ناموفق بود")
 
     def process_messages(self):
         """پردازش پیام‌های دریافتی به صورت هوشمند"""
         if self.two_factor_required or self.challenge_required:
             logger.info("منتظر تأیید دو مرحله‌ای/چالش امنیتی هستیم...")
-            time.sleep(5)  # کاهش زمان انتظار
+            self.pause(5)  # کاهش زمان انتظار
             return
         
         super().process_messages()
@@ -648,7 +1047,7 @@ class InstagramBot(BaseBot):
                 if status["needs_verification"]:
                     logger.info("ربات آماده دریافت کد تأیید است")
                     # انتظار برای دریافت کد تأیید
-                    time.sleep(15)  # کاهش زمان انتظار
+                    self.pause(15)  # کاهش زمان انتظار
                 else:
                     logger.error("عدم توانایی در ورود به سیستم")
                     # راه‌حل fallback یا اطلاع‌رسانی به کاربر
@@ -656,7 +1055,26 @@ class InstagramBot(BaseBot):
         except Exception as e:
             logger.error(f"خطا در اجرای ربات: {e}")
             # راه‌حل بازیابی از خطا
-            time.sleep(30)  # کاهش زمان انتظار
+            self.pause(30)  # کاهش زمان انتظار
+
+    def start_processing(self):
+        super().start_processing()
+        self.publish_status()
+    
+    def finish_processing(self):
+        super().finish_processing()
+        self.publish_status()
+    
+    def stop_bot(self):
+        """توقف ربات و نوشتن تاریخچه‌های در صف"""
+        result = super().stop_bot()
+        # پاسخ‌های ارسال‌نشده در صف پایدار می‌مانند و در اجرای بعدی ارسال می‌شوند
+        get_outbound_dispatcher().drop(self.instagram_username)
+        with self.outbound_lock:
+            self.outbound_submitted.clear()
+        self.outbound_recovered = False
+        self.message_manager.flush_history()
+        return result
 
     def safe_shutdown(self):
         """خاموش کردن ایمن ربات"""
@@ -666,4 +1084,5 @@ class InstagramBot(BaseBot):
         except Exception as e:
             logger.error(f"خطا در خاموش کردن ربات: {e}")
         finally:
-            self.stop_event.set()
\ No newline at end of file
+            self.stop_event.set()
+            self.message_manager.flush_history()
\ No newline at end of file
@@ -0,0 +1,144 @@
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# مرزهای histogram تأخیر فراخوانی‌های API (ثانیه)
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0)
+
+COUNTER_NAMES = ("calls", "errors", "rate_limited", "retries")
+
+
+class LatencyHistogram:
+    """histogram تجمعی تأخیر با مرزهای ثابت (سازگار با Prometheus)"""
+
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.total = 0
+        self.sum = 0.0
+
+    def observe(self, seconds: float):
+        for index, bound in enumerate(self.buckets):
+            if seconds <= bound:
+                self.counts[index] += 1
+                break
+        self.total += 1
+        self.sum += seconds
+
+    def cumulative(self) -> List[Tuple[str, int]]:
+        """شمارش تجمعی هر مرز به همراه +Inf"""
+        result = []
+        running = 0
+        for bound, count in zip(self.buckets, self.counts):
+            running += count
+            result.append((repr(bound), running))
+        result.append(("+Inf", self.total))
+        return result
+
+
+class ApiMetrics:
+    """شمارنده‌ها و histogram تأخیر فراخوانی‌های API به ازای (حساب، متد)"""
+
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._counters: Dict[Tuple[str, str], Dict[str, int]] = {}
+        self._latency: Dict[Tuple[str, str], LatencyHistogram] = {}
+
+    def _series(self, account: str, method: str) -> Dict[str, int]:
+        key = (account, method)
+        counters = self._counters.get(key)
+        if counters is None:
+            counters = dict.fromkeys(COUNTER_NAMES, 0)
+            self._counters[key] = counters
+            self._latency[key] = LatencyHistogram(self.buckets)
+        return counters
+
+    def observe(self, account: str, method: str, seconds: float, error: bool = False):
+        """ثبت یک فراخوانی و مدت آن"""
+        with self._lock:
+            counters = self._series(account, method)
+            counters["calls"] += 1
+            if error:
+                counters["errors"] += 1
+            self._latency[(account, method)].observe(seconds)
+
+    def increment(self, account: str, method: str, counter: str, amount: int = 1):
+        """افزایش یکی از شمارنده‌ها (مثلاً rate_limited یا retries)"""
+        with self._lock:
+            self._series(account, method)[counter] += amount
+
+    def snapshot(self, accounts: Optional[Iterable[str]] = None) -> List[Dict]:
+        """آمار فعلی به صورت لیست، در صورت نیاز فقط برای حساب‌های مشخص"""
+        wanted = set(accounts) if accounts is not None else None
+        with self._lock:
+            rows = []
+            for (account, method), counters in sorted(self._counters.items()):
+                if wanted is not None and account not in wanted:
+                    continue
+                histogram = self._latency[(account, method)]
+                rows.append({
+                    "account": account,
+                    "method": method,
+                    **counters,
+                    "latency_sum": histogram.sum,
+                    "latency_buckets": histogram.cumulative(),
+                })
+            return rows
+
+    def render_prometheus(self, rows: Optional[List[Dict]] = None) -> str:
+        """خروجی متنی با قالب Prometheus exposition (پیش‌فرض: آمار همین پردازش)"""
+        if rows is None:
+            rows = self.snapshot()
+        lines = []
+        for counter in COUNTER_NAMES:
+            name = f"instagram_api_{counter}_total"
+            lines.append(f"# TYPE {name} counter")
+            for row in rows:
+                lines.append(f"{name}{{{_labels(row)}}} {row[counter]}")
+
+        name = "instagram_api_latency_seconds"
+        lines.append(f"# TYPE {name} histogram")
+        for row in rows:
+            labels = _labels(row)
+            for bound, count in row["latency_buckets"]:
+                lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {count}')
+            lines.append(f"{name}_sum{{{labels}}} {row['latency_sum']:.6f}")
+            lines.append(f"{name}_count{{{labels}}} {row['calls']}")
+        return "\n".join(lines) + "\n"
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._latency.clear()
+
+
+def merge_rows(*row_lists: Iterable[Dict]) -> List[Dict]:
+    """جمع آمار چند پردازش (مثلاً workerهای supervisor) به ازای (حساب، متد)"""
+    merged: Dict[Tuple[str, str], Dict] = {}
+    for rows in row_lists:
+        for row in rows:
+            key = (row["account"], row["method"])
+            target = merged.get(key)
+            if target is None:
+                merged[key] = {**row, "latency_buckets": [tuple(bucket) for bucket in row["latency_buckets"]]}
+                continue
+            for counter in COUNTER_NAMES:
+                target[counter] += row[counter]
+            target["latency_sum"] += row["latency_sum"]
+            target["latency_buckets"] = [
+                (bound, count + other)
+                for (bound, count), (_, other) in zip(target["latency_buckets"], row["latency_buckets"])
+            ]
+    return [merged[key] for key in sorted(merged)]
+
+
+def escape_label(value: str) -> str:
+    """escape مقدار برچسب Prometheus"""
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(row: Dict) -> str:
+    return f'account="{escape_label(row["account"])}",method="{escape_label(row["method"])}"'
+
+
+api_metrics = ApiMetrics()
@@ -0,0 +1,264 @@
+import heapq
+import itertools
+import logging
+import os
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from .rate_limiter import rate_limiter
+
+logger = logging.getLogger(__name__)
+
+# تعداد thread‌های ارسال مشترک بین تمام ربات‌های این پردازش
+DEFAULT_OUTBOUND_WORKERS = int(os.environ.get('BOT_OUTBOUND_WORKERS', '8'))
+
+
+class OutboundSendError(Exception):
+    """ارسال پاسخ ناموفق بود و باید بعداً دوباره تلاش شود"""
+
+
+class OutboundDeferred(Exception):
+    """ادامه ارسال باید delay ثانیه بعد انجام شود (تأخیر انسانی یا محدودکننده نرخ)
+
+    worker به جای خوابیدن، کار را به ابتدای صف حساب برمی‌گرداند و سراغ حساب
+    دیگری می‌رود.
+    """
+
+    def __init__(self, delay: float):
+        super().__init__(f"ارسال {delay:.1f} ثانیه بعد ادامه پیدا می‌کند")
+        self.delay = max(0.0, delay)
+
+
+class OutboundJob:
+    """پاسخ‌های آماده ارسال یک thread
+
+    received_at زمان قدیمی‌ترین پیام مشتری است و ترتیب ارسال بین حساب‌ها
+    را تعیین می‌کند؛ cooldown فاصله انسانی پس از ارسال تا کار بعدی همان حساب است.
+    """
+
+    __slots__ = ("account", "thread_id", "user_id", "replies", "received_at",
+                 "send", "rate_keys", "cooldown", "enqueued_at")
+
+    def __init__(self, account: str, thread_id: str, user_id: str, replies: List[Tuple[str, str]],
+                 received_at: float, send: Callable[["OutboundJob"], None],
+                 rate_keys: Iterable[str] = (), cooldown: float = 0.0):
+        self.account = account
+        self.thread_id = thread_id
+        self.user_id = user_id
+        self.replies = replies
+        self.received_at = received_at
+        self.send = send
+        self.rate_keys = tuple(rate_keys)
+        self.cooldown = cooldown
+        self.enqueued_at = time.monotonic()
+
+
+class _AccountQueue:
+    """صف کارهای یک حساب؛ هر حساب در هر لحظه حداکثر یک ارسال در جریان دارد"""
+
+    __slots__ = ("jobs", "busy", "ready_at", "token")
+
+    def __init__(self):
+        self.jobs: List[Tuple[float, int, OutboundJob]] = []
+        self.busy = False
+        self.ready_at = 0.0
+        # شناسه آخرین ورودی حساب در heapها؛ ورودی‌های قدیمی‌تر نادیده گرفته می‌شوند
+        self.token = -1
+
+
+class OutboundDispatcher:
+    """ارسال‌کننده مشترک پاسخ‌ها، جدا از حلقه دریافت پیام
+
+    مسیر دریافت فقط کار را در صف می‌گذارد. workerها از بین حساب‌های آزاد،
+    حسابی را انتخاب می‌کنند که قدیمی‌ترین پیام مشتری را دارد. حسابی که
+    محدودکننده نرخش اجازه نمی‌دهد یا در فاصله cooldown است کنار گذاشته
+    می‌شود تا worker را مسدود نکند. send هر کار هم نباید در worker بخوابد:
+    برای انتظار بین بخش‌ها OutboundDeferred ایجاد می‌کند و کار تا موعدش به
+    صف حساب برمی‌گردد. پس تأخیر بررسی inbox و توان ارسال مستقل از هم
+    تنظیم می‌شوند.
+    """
+
+    def __init__(self, workers: int = DEFAULT_OUTBOUND_WORKERS, limiter=rate_limiter):
+        self.workers = max(1, workers)
+        self.limiter = limiter
+        self._lock = threading.Lock()
+        self._condition = threading.Condition(self._lock)
+        self._accounts: Dict[str, _AccountQueue] = {}
+        # (received_at, token, account) حساب‌های آماده ارسال
+        self._ready: List[Tuple[float, int, str]] = []
+        # (ready_at, token, account) حساب‌های منتظر محدودکننده یا cooldown
+        self._delayed: List[Tuple[float, int, str]] = []
+        self._seq = itertools.count()
+        self._pending = 0
+        self._in_flight = 0
+        self._stats = {"enqueued": 0, "sent": 0, "failed": 0, "dropped": 0, "deferred": 0,
+                       "max_wait_ms": 0.0}
+        self._threads: List[threading.Thread] = []
+        self._closed = False
+
+    def start(self):
+        with self._lock:
+            if self._threads:
+                return
+            self._closed = False
+            for index in range(self.workers):
+                thread = threading.Thread(target=self._run, name=f"outbound-{index}", daemon=True)
+                self._threads.append(thread)
+                thread.start()
+
+    def submit(self, job: OutboundJob):
+        """افزودن کار ارسال به صف"""
+        self.start()
+        with self._condition:
+            queue = self._accounts.get(job.account)
+            if queue is None:
+                queue = _AccountQueue()
+                self._accounts[job.account] = queue
+            seq = next(self._seq)
+            heapq.heappush(queue.jobs, (job.received_at, seq, job))
+            self._pending += 1
+            self._stats["enqueued"] += 1
+            # اگر کار جدید قدیمی‌ترین کار حساب شد، اولویت حساب به‌روز می‌شود
+            if not queue.busy and queue.jobs[0][2] is job:
+                self._schedule(job.account, queue)
+            self._condition.notify()
+
+    def _schedule(self, account: str, queue: _AccountQueue):
+        """قرار دادن حساب در heap آماده یا منتظر (فراخواننده قفل را دارد)"""
+        seq = next(self._seq)
+        queue.token = seq
+        if not queue.jobs:
+            return
+        now = time.monotonic()
+        if queue.ready_at > now:
+            heapq.heappush(self._delayed, (queue.ready_at, seq, account))
+        else:
+            heapq.heappush(self._ready, (queue.jobs[0][0], seq, account))
+
+    def _next_job(self) -> Optional[OutboundJob]:
+        """انتخاب قدیمی‌ترین کار قابل ارسال یا انتظار تا آماده شدن یکی (فراخواننده قفل را دارد)"""
+        while not self._closed:
+            now = time.monotonic()
+            while self._delayed and self._delayed[0][0] <= now:
+                _, token, account = heapq.heappop(self._delayed)
+                queue = self._accounts.get(account)
+                if queue is not None and queue.token == token and not queue.busy:
+                    queue.ready_at = 0.0
+                    self._schedule(account, queue)
+
+            while self._ready:
+                _, token, account = heapq.heappop(self._ready)
+                queue = self._accounts.get(account)
+                if queue is None or queue.token != token or queue.busy or not queue.jobs:
+                    continue
+                job = queue.jobs[0][2]
+                wait = self.limiter.delay(job.rate_keys) if job.rate_keys else 0.0
+                if wait > 0:
+                    queue.ready_at = now + wait
+                    self._schedule(account, queue)
+                    continue
+                heapq.heappop(queue.jobs)
+                queue.busy = True
+                queue.token = next(self._seq)
+                self._pending -= 1
+                self._in_flight += 1
+                return job
+
+            timeout = self._delayed[0][0] - now if self._delayed else None
+            self._condition.wait(timeout)
+        return None
+
+    def _run(self):
+        while True:
+            with self._condition:
+                job = self._next_job()
+            if job is None:
+                return
+
+            waited_ms = (time.monotonic() - job.enqueued_at) * 1000
+            result = "sent"
+            delay = job.cooldown
+            try:
+                job.send(job)
+            except OutboundDeferred as e:
+                result = "deferred"
+                delay = e.delay
+            except Exception as e:
+                result = "failed"
+                logger.error(f"خطا در ارسال پاسخ‌های thread {job.thread_id}: {e}")
+
+            with self._condition:
+                self._in_flight -= 1
+                self._stats[result] += 1
+                queue = self._accounts.get(job.account)
+                if result == "deferred":
+                    if queue is not None:
+                        # کار با همان اولویت قبلی به صف حساب برمی‌گردد
+                        heapq.heappush(queue.jobs, (job.received_at, next(self._seq), job))
+                        self._pending += 1
+                else:
+                    self._stats["max_wait_ms"] = max(self._stats["max_wait_ms"], waited_ms)
+                if queue is not None:
+                    queue.busy = False
+                    # صف حساب خالی هم نگه داشته می‌شود تا cooldown برای کار بعدی رعایت شود
+                    queue.ready_at = time.monotonic() + delay
+                    self._schedule(job.account, queue)
+                self._condition.notify_all()
+
+    def drop(self, account: str) -> int:
+        """حذف کارهای در صف یک حساب (مثلاً هنگام توقف ربات)"""
+        with self._condition:
+            queue = self._accounts.get(account)
+            if queue is None:
+                return 0
+            dropped = len(queue.jobs)
+            queue.jobs = []
+            queue.token = next(self._seq)
+            self._pending -= dropped
+            self._stats["dropped"] += dropped
+            self._condition.notify_all()
+        if dropped:
+            logger.warning(f"{dropped} ارسال در صف حساب {account} حذف شد")
+        return dropped
+
+    def join(self, timeout: Optional[float] = None) -> bool:
+        """انتظار تا خالی شدن صف و پایان ارسال‌های در جریان"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._condition:
+            while self._pending or self._in_flight:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._condition.wait(remaining)
+            return True
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["queue_depth"] = self._pending
+            stats["in_flight"] = self._in_flight
+            return stats
+
+    def shutdown(self, timeout: float = 5.0):
+        """توقف workerها؛ کارهای باقی‌مانده ارسال نمی‌شوند"""
+        with self._condition:
+            self._closed = True
+            threads = list(self._threads)
+            self._threads = []
+            self._condition.notify_all()
+        for thread in threads:
+            thread.join(timeout)
+
+
+_dispatcher: Optional[OutboundDispatcher] = None
+_dispatcher_lock = threading.Lock()
+
+
+def get_outbound_dispatcher() -> OutboundDispatcher:
+    """دریافت ارسال‌کننده مشترک پاسخ‌ها"""
+    global _dispatcher
+    with _dispatcher_lock:
+        if _dispatcher is None:
+            _dispatcher = OutboundDispatcher()
+        return _dispatcher
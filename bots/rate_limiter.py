@@ -0,0 +1,166 @@
+import asyncio
+import os
+import threading
+import time
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+# بودجه پیش‌فرض هر حساب: 60 درخواست در 5 دقیقه با امکان burst کوتاه
+ACCOUNT_RATE = float(os.environ.get('BOT_ACCOUNT_RATE', str(60 / 300)))
+ACCOUNT_BURST = int(os.environ.get('BOT_ACCOUNT_BURST', '10'))
+
+# حداقل فاصله بین دو درخواست یک حساب (ثانیه)
+ACCOUNT_MIN_INTERVAL = float(os.environ.get('BOT_ACCOUNT_MIN_INTERVAL', '1.5'))
+
+# بودجه مشترک تمام حساب‌هایی که از یک proxy خارج می‌شوند (حساب‌های بدون proxy سطل مشترک ندارند)
+EGRESS_RATE = float(os.environ.get('BOT_EGRESS_RATE', str(180 / 300)))
+EGRESS_BURST = int(os.environ.get('BOT_EGRESS_BURST', '20'))
+
+
+class TokenBucket:
+    """سطل توکن با الگوریتم GCRA
+
+    به جای نگه داشتن لیست زمان درخواست‌ها فقط «زمان رسیدن نظری» (TAT)
+    نگه داشته می‌شود، بنابراین هر درخواست O(1) است.
+    """
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.configure(rate, burst)
+        self.tat = 0.0
+
+    def configure(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.interval = 1.0 / rate
+        self.tolerance = self.interval * (self.burst - 1)
+
+    def delay(self, now: float) -> float:
+        """زمان انتظار لازم تا مجاز شدن درخواست بعدی"""
+        return max(0.0, self.tat - self.tolerance - now)
+
+    def consume(self, now: float):
+        """مصرف یک توکن"""
+        self.tat = max(self.tat, now) + self.interval
+
+    def penalize(self, now: float, seconds: float):
+        """مسدود کردن سطل برای مدت مشخص (مثلاً پس از خطای 429)"""
+        self.tat = max(self.tat, now + seconds + self.tolerance)
+
+
+class RateLimiter:
+    """مجموعه سطل‌های نام‌دار که بین تمام ربات‌های یک پردازش مشترک است
+
+    هر درخواست می‌تواند همزمان از چند سطل (مثلاً حساب و IP خروجی) توکن
+    بگیرد؛ توکن فقط وقتی مصرف می‌شود که همه سطل‌ها اجازه بدهند.
+    """
+
+    def __init__(self, clock: Callable[[], float] = time.monotonic):
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._defaults: Dict[str, Tuple[float, int]] = {}
+
+    def configure(self, name: str, rate: float, burst: int = 1):
+        """تعیین نرخ و burst یک سطل"""
+        with self._lock:
+            bucket = self._buckets.get(name)
+            if bucket:
+                bucket.configure(rate, burst)
+            else:
+                self._buckets[name] = TokenBucket(rate, burst)
+
+    def set_default(self, prefix: str, rate: float, burst: int = 1):
+        """نرخ پیش‌فرض سطل‌هایی که نامشان با prefix شروع می‌شود"""
+        with self._lock:
+            self._defaults[prefix] = (rate, burst)
+
+    def _bucket(self, name: str) -> TokenBucket:
+        bucket = self._buckets.get(name)
+        if bucket is None:
+            prefix = name.split(':', 1)[0]
+            rate, burst = self._defaults.get(prefix, (ACCOUNT_RATE, ACCOUNT_BURST))
+            bucket = TokenBucket(rate, burst)
+            self._buckets[name] = bucket
+        return bucket
+
+    def try_acquire(self, names: Iterable[str]) -> float:
+        """تلاش برای گرفتن توکن؛ صفر یعنی موفق، در غیر این صورت زمان انتظار"""
+        with self._lock:
+            now = self.clock()
+            buckets = [self._bucket(name) for name in names]
+            wait = max((bucket.delay(now) for bucket in buckets), default=0.0)
+            if wait > 0:
+                return wait
+            for bucket in buckets:
+                bucket.consume(now)
+            return 0.0
+
+    def acquire(self, names: Iterable[str], timeout: Optional[float] = None,
+                sleep: Callable[[float], object] = time.sleep) -> bool:
+        """گرفتن توکن به صورت مسدودکننده
+
+        اگر sleep مقدار truthy برگرداند (مثلاً pause ربات هنگام توقف)، انتظار قطع می‌شود.
+        """
+        names = tuple(names)
+        deadline = None if timeout is None else self.clock() + timeout
+        while True:
+            wait = self.try_acquire(names)
+            if wait <= 0:
+                return True
+            if deadline is not None:
+                remaining = deadline - self.clock()
+                if remaining <= 0:
+                    return False
+                wait = min(wait, remaining)
+            if sleep(wait):
+                return False
+
+    async def acquire_async(self, names: Iterable[str], timeout: Optional[float] = None,
+                            sleep=asyncio.sleep) -> bool:
+        """نسخه ناهمگام acquire برای استفاده در event loop
+
+        sleep یک coroutine است (مثلاً pause_async ربات)؛ نتیجه truthy آن انتظار را قطع می‌کند.
+        """
+        names = tuple(names)
+        deadline = None if timeout is None else self.clock() + timeout
+        while True:
+            wait = self.try_acquire(names)
+            if wait <= 0:
+                return True
+            if deadline is not None:
+                remaining = deadline - self.clock()
+                if remaining <= 0:
+                    return False
+                wait = min(wait, remaining)
+            if await sleep(wait):
+                return False
+
+    def penalize(self, names: Iterable[str], seconds: float):
+        """اعمال دوره سرد شدن روی سطل‌ها"""
+        with self._lock:
+            now = self.clock()
+            for name in names:
+                self._bucket(name).penalize(now, seconds)
+
+    def delay(self, names: Iterable[str]) -> float:
+        """زمان انتظار فعلی بدون مصرف توکن"""
+        with self._lock:
+            now = self.clock()
+            return max((self._bucket(name).delay(now) for name in names), default=0.0)
+
+
+def account_keys(username: str, proxy: Optional[str] = None) -> Tuple[str, ...]:
+    """نام سطل‌هایی که درخواست‌های یک حساب از آن‌ها عبور می‌کنند
+
+    سطل egress فقط برای حساب‌های دارای proxy اضافه می‌شود؛ در غیر این صورت
+    تمام حساب‌های بدون proxy یک سطل مشترک داشتند و توان کل سرور محدود می‌شد.
+    """
+    keys = (f"account:{username}", f"pace:{username}")
+    if proxy:
+        keys += (f"egress:{proxy}",)
+    return keys
+
+
+rate_limiter = RateLimiter()
+rate_limiter.set_default("account", ACCOUNT_RATE, ACCOUNT_BURST)
+rate_limiter.set_default("pace", 1.0 / ACCOUNT_MIN_INTERVAL, 1)
+rate_limiter.set_default("egress", EGRESS_RATE, EGRESS_BURST)
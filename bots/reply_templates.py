@@ -0,0 +1,226 @@
+import os
+import threading
+from collections import OrderedDict
+from datetime import datetime, time as dt_time
+from typing import Any, Callable, Dict, Iterable, Optional, Tuple, Union
+
+# ساعات کاری برای {business_hours} با قالب HH:MM-HH:MM (به وقت سرور)
+BUSINESS_HOURS = os.environ.get("BUSINESS_HOURS", "09:00-18:00")
+BUSINESS_OPEN_TEXT = "در ساعات کاری هستیم و به‌زودی پاسخ می‌دهیم"
+BUSINESS_CLOSED_TEXT = "خارج از ساعات کاری هستیم و در اولین فرصت پاسخ می‌دهیم"
+
+# حداکثر قالب‌های کامپایل‌شده و پروفایل‌های فرستنده در حافظه
+TEMPLATE_CACHE_SIZE = 4096
+PROFILE_CACHE_SIZE = 10000
+
+# قالب کامپایل‌شده: متن ثابت یا تابعی که از روی context متن نهایی را می‌سازد
+CompiledTemplate = Union[str, Callable[["RenderContext"], str]]
+
+
+def parse_business_hours(value: str) -> Tuple[dt_time, dt_time]:
+    start, end = value.split("-", 1)
+    return dt_time.fromisoformat(start.strip()), dt_time.fromisoformat(end.strip())
+
+
+class RenderContext:
+    """مقادیر placeholderها که فقط در صورت استفاده و حداکثر یک بار محاسبه می‌شوند"""
+
+    def __init__(self, profile: Optional[Dict] = None, now: Optional[datetime] = None,
+                 business_hours: str = BUSINESS_HOURS):
+        self.profile = profile or {}
+        self.now = now or datetime.now()
+        self.business_hours = business_hours
+
+    def username(self) -> str:
+        return self.profile.get("username") or ""
+
+    def full_name(self) -> str:
+        return self.profile.get("full_name") or self.username()
+
+    def date(self) -> str:
+        return self.now.strftime("%Y-%m-%d")
+
+    def time(self) -> str:
+        return self.now.strftime("%H:%M")
+
+    def is_business_hours(self) -> bool:
+        try:
+            start, end = parse_business_hours(self.business_hours)
+        except ValueError:
+            return True
+        current = self.now.time()
+        if start <= end:
+            return start <= current < end
+        # بازه‌ای که از نیمه‌شب عبور می‌کند، مثلاً 18:00-02:00
+        return current >= start or current < end
+
+    def business_hours_text(self) -> str:
+        return BUSINESS_OPEN_TEXT if self.is_business_hours() else BUSINESS_CLOSED_TEXT
+
+
+# placeholderهای پشتیبانی‌شده و تابع محاسبه هر کدام
+PLACEHOLDERS: Dict[str, Callable[[RenderContext], str]] = {
+    "username": RenderContext.username,
+    "full_name": RenderContext.full_name,
+    "date": RenderContext.date,
+    "time": RenderContext.time,
+    "business_hours": RenderContext.business_hours_text,
+}
+
+
+def compile_template(text: str) -> CompiledTemplate:
+    """کامپایل متن پاسخ به رشته ثابت یا تابع render
+
+    {name} برای placeholderهای شناخته‌شده جایگزین می‌شود و {{ و }} به آکولاد
+    ساده تبدیل می‌شوند. آکولادهای دیگر (مثلاً placeholder ناشناخته) همان‌طور
+    که هستند باقی می‌مانند تا متن‌های قدیمی تغییر نکنند.
+    """
+    parts = []
+    literal = []
+    index = 0
+    length = len(text)
+    while index < length:
+        char = text[index]
+        if char in "{}" and text.startswith(char * 2, index):
+            literal.append(char)
+            index += 2
+            continue
+        if char == "{":
+            end = text.find("}", index + 1)
+            name = text[index + 1:end] if end != -1 else None
+            resolver = PLACEHOLDERS.get(name.strip()) if name is not None else None
+            if resolver is not None:
+                if literal:
+                    parts.append("".join(literal))
+                    literal = []
+                parts.append(resolver)
+                index = end + 1
+                continue
+        literal.append(char)
+        index += 1
+    if literal:
+        parts.append("".join(literal))
+
+    if all(isinstance(part, str) for part in parts):
+        return "".join(parts)
+
+    segments = tuple(parts)
+
+    def render(context: RenderContext) -> str:
+        values = {}
+        output = []
+        for part in segments:
+            if isinstance(part, str):
+                output.append(part)
+                continue
+            value = values.get(part)
+            if value is None:
+                value = part(context)
+                values[part] = value
+            output.append(value)
+        return "".join(output)
+
+    return render
+
+
+def render_template(compiled: CompiledTemplate, context: RenderContext) -> str:
+    return compiled if isinstance(compiled, str) else compiled(context)
+
+
+class LRUCache:
+    """کش LRU ساده و thread-safe با اندازه محدود"""
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._items: "OrderedDict[Any, Any]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Any) -> Any:
+        with self._lock:
+            value = self._items.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: Any, value: Any):
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._items)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self.hits = 0
+            self.misses = 0
+
+
+class TemplateCache:
+    """قالب‌های کامپایل‌شده به ازای (شناسه پیام، نسخه پاسخ‌های کاربر)
+
+    ویرایش پیام نسخه پاسخ‌های کاربر را در reply_cache افزایش می‌دهد، پس
+    قالب قدیمی دیگر استفاده نمی‌شود و به مرور از LRU خارج می‌شود.
+    """
+
+    def __init__(self, max_size: int = TEMPLATE_CACHE_SIZE):
+        self._cache = LRUCache(max_size)
+
+    def get(self, message_id: int, version: int, content: str) -> CompiledTemplate:
+        key = (message_id, version)
+        cached = self._cache.get(key)
+        # مقایسه متن، جدولی را که در حین ویرایش پیام بارگذاری شده هم پوشش می‌دهد
+        if cached is not None and cached[0] == content:
+            return cached[1]
+        compiled = compile_template(content)
+        self._cache.put(key, (content, compiled))
+        return compiled
+
+    def clear(self):
+        self._cache.clear()
+
+
+class ProfileCache:
+    """پروفایل فرستندگان (نام کاربری و نام کامل) که از thread.users پر می‌شود
+
+    هیچ فراخوانی API برای پروفایل انجام نمی‌شود؛ اطلاعات از payload همان
+    inbox که برای خواندن پیام‌ها دریافت شده گرفته می‌شود.
+    """
+
+    def __init__(self, max_size: int = PROFILE_CACHE_SIZE):
+        self._cache = LRUCache(max_size)
+
+    def remember_users(self, users: Optional[Iterable[Any]]):
+        for user in users or ():
+            pk = getattr(user, "pk", None)
+            if pk is None:
+                continue
+            self._cache.put(str(pk), {
+                "username": getattr(user, "username", None) or "",
+                "full_name": getattr(user, "full_name", None) or "",
+            })
+
+    def get(self, user_id: Any) -> Optional[Dict]:
+        if user_id is None:
+            return None
+        return self._cache.get(str(user_id))
+
+    def __len__(self) -> int:
+        return len(self._cache)
+
+    def clear(self):
+        self._cache.clear()
+
+
+# کش‌های مشترک بین تمام ربات‌های این پردازش
+template_cache = TemplateCache()
+profile_cache = ProfileCache()
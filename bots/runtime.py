@@ -0,0 +1,186 @@
+import asyncio
+import logging
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, Optional
+
+from .base_bot import BaseBot
+from .scheduler import PollScheduler
+
+logger = logging.getLogger(__name__)
+
+# تعداد thread‌های اجرای فراخوانی‌های مسدودکننده instagrapi
+DEFAULT_EXECUTOR_WORKERS = int(os.environ.get('BOT_RUNTIME_WORKERS', '32'))
+
+# فاصله بررسی وضعیت ربات‌های منتظر تأیید دو مرحله‌ای
+VERIFICATION_POLL_INTERVAL = 5
+
+
+class BotRuntime:
+    """اجرای تعداد زیادی ربات روی یک event loop مشترک
+
+    هر ربات یک coroutine سبک است و فقط هنگام فراخوانی API یا دیتابیس یک
+    thread از executor محدود را اشغال می‌کند؛ زمان‌های انتظار بین چرخه‌ها و
+    داخل چرخه (محدودکننده نرخ، تأخیر انسانی، تلاش مجدد) با run_cycle_async
+    روی event loop سپری می‌شوند و هیچ threadی را نگه نمی‌دارند.
+    """
+
+    def __init__(self, max_workers: int = DEFAULT_EXECUTOR_WORKERS):
+        self.max_workers = max_workers
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="bot-io")
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.scheduler: Optional[PollScheduler] = None
+        self._thread: Optional[threading.Thread] = None
+        self._started = threading.Event()
+        self._lock = threading.Lock()
+        self._tasks: Dict[int, Future] = {}
+
+    def start(self):
+        """راه‌اندازی event loop در یک thread پس‌زمینه"""
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._started.clear()
+            self._thread = threading.Thread(target=self._run_loop, name="bot-runtime", daemon=True)
+            self._thread.start()
+        self._started.wait()
+        logger.info(f"Runtime ربات‌ها با {self.max_workers} thread اجرایی راه‌اندازی شد")
+
+    def _run_loop(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.loop.set_default_executor(self.executor)
+        self.scheduler = PollScheduler(self.loop)
+        self._started.set()
+        try:
+            self.loop.run_forever()
+        finally:
+            # لغو taskهای باقیمانده (ربات‌ها و حلقه زمان‌بند) پیش از بستن loop
+            pending = asyncio.all_tasks(self.loop)
+            for task in pending:
+                task.cancel()
+            if pending:
+                self.loop.run_until_complete(asyncio.gather(*pending, return_exceptions=True))
+            self.loop.close()
+
+    def submit(self, key: int, bot: BaseBot,
+               on_verification: Optional[Callable[[], None]] = None) -> Future:
+        """افزودن ربات به runtime و برگرداندن Future پایان اجرای آن"""
+        self.start()
+        future = asyncio.run_coroutine_threadsafe(
+            self._run_bot(key, bot, on_verification), self.loop
+        )
+        with self._lock:
+            self._tasks[key] = future
+        future.add_done_callback(lambda f: self._forget(key, f))
+        return future
+
+    def _forget(self, key: int, future: Future):
+        with self._lock:
+            if self._tasks.get(key) is future:
+                del self._tasks[key]
+
+    def active_count(self) -> int:
+        """تعداد ربات‌های در حال اجرا"""
+        with self._lock:
+            return len(self._tasks)
+
+    async def _call(self, func, *args):
+        """اجرای فراخوانی مسدودکننده در executor محدود"""
+        return await self.loop.run_in_executor(self.executor, func, *args)
+
+    async def _wait_turn(self, key: int, bot: BaseBot, delay: float, reason: str = "poll") -> bool:
+        """انتظار تا نوبت بعدی ربات در زمان‌بند مرکزی؛ در صورت درخواست توقف True برمی‌گرداند"""
+        if bot.stop_event.is_set():
+            return True
+        # wake که در حین اجرای چرخه رسیده باشد نوبت بعدی را فوری می‌کند
+        if bot.wake_event.is_set():
+            bot.wake_event.clear()
+            return bot.stop_event.is_set()
+        turn = self.scheduler.schedule(key, delay, reason)
+        try:
+            await turn
+        except asyncio.CancelledError:
+            if bot.stop_event.is_set():
+                return True
+            raise
+        bot.wake_event.clear()
+        return bot.stop_event.is_set()
+
+    async def _run_bot(self, key: int, bot: BaseBot,
+                       on_verification: Optional[Callable[[], None]]):
+        def notify_wake():
+            self.scheduler.wake(key)
+
+        # wake و توقف ربات هر دو نوبت آن را در زمان‌بند جلو می‌اندازند
+        bot.wake_event.add_listener(notify_wake)
+        try:
+            if not await self._call(bot.login):
+                needs_verification = getattr(bot, 'needs_verification', None)
+                if not needs_verification or not needs_verification():
+                    logger.error("عدم توانایی در ورود به سیستم")
+                    return
+
+                logger.info(f"ربات {key} منتظر تأیید دو مرحله‌ای است")
+                if on_verification:
+                    on_verification()
+
+                # تا زمان ثبت کد تأیید از داشبورد بدون اشغال thread منتظر می‌مانیم
+                while needs_verification():
+                    if await self._wait_turn(key, bot, VERIFICATION_POLL_INTERVAL, "verification"):
+                        return
+
+            if not await self._call(bot.is_logged_in):
+                return
+
+            bot.start_processing()
+            try:
+                while not bot.stop_event.is_set():
+                    delay, _ = await bot.run_cycle_async()
+                    if await self._wait_turn(key, bot, delay):
+                        break
+            finally:
+                bot.finish_processing()
+
+        except Exception as e:
+            logger.error(f"خطا در اجرای ربات {key}: {e}")
+        finally:
+            bot.wake_event.remove_listener(notify_wake)
+            self.scheduler.cancel(key)
+
+    def wake(self, key: int):
+        """بررسی فوری پیام‌های یک ربات"""
+        if self.scheduler:
+            self.scheduler.wake(key)
+
+    def timeline(self, limit: Optional[int] = None):
+        """برنامه زمانی بررسی‌های آینده تمام ربات‌ها"""
+        if not self.scheduler:
+            return []
+        return self.scheduler.timeline(limit)
+
+    def shutdown(self, timeout: float = 10.0):
+        """توقف تمام ربات‌ها و event loop"""
+        with self._lock:
+            futures = list(self._tasks.values())
+        for future in futures:
+            future.cancel()
+        if self.loop and self.loop.is_running():
+            self.loop.call_soon_threadsafe(self.loop.stop)
+        if self._thread:
+            self._thread.join(timeout=timeout)
+        self.executor.shutdown(wait=False)
+
+
+_runtime: Optional[BotRuntime] = None
+_runtime_lock = threading.Lock()
+
+
+def get_bot_runtime() -> BotRuntime:
+    """دریافت نمونه مشترک runtime ربات‌ها"""
+    global _runtime
+    with _runtime_lock:
+        if _runtime is None:
+            _runtime = BotRuntime()
+        return _runtime
@@ -0,0 +1,118 @@
+import asyncio
+import heapq
+import itertools
+import threading
+import time
+from typing import Dict, Hashable, List, Optional, Tuple
+
+
+class PollScheduler:
+    """زمان‌بند مرکزی نوبت بررسی پیام تمام ربات‌ها
+
+    زمان بررسی بعدی هر ربات در یک heap نگه داشته می‌شود و فقط یک تایمر روی
+    event loop منتظر نزدیک‌ترین موعد می‌ماند. هر ربات دقیقاً در زمان موعدش
+    بیدار می‌شود و می‌توان آن را با wake زودتر بیدار کرد.
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        self.loop = loop
+        self._heap: List[Tuple[float, int, Hashable]] = []
+        # key -> (deadline, seq, future, reason)
+        self._entries: Dict[Hashable, Tuple[float, int, asyncio.Future, str]] = {}
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+        self._changed: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        """شروع حلقه زمان‌بند؛ باید روی thread همان event loop فراخوانی شود"""
+        if self._task is None:
+            self._changed = asyncio.Event()
+            self._task = self.loop.create_task(self._run())
+
+    def schedule(self, key: Hashable, delay: float, reason: str = "poll") -> asyncio.Future:
+        """ثبت نوبت بعدی ربات؛ Future در زمان موعد کامل می‌شود"""
+        self.start()
+        deadline = time.monotonic() + max(0.0, delay)
+        future = self.loop.create_future()
+        with self._lock:
+            previous = self._entries.get(key)
+            if previous and not previous[2].done():
+                previous[2].cancel()
+            seq = next(self._seq)
+            self._entries[key] = (deadline, seq, future, reason)
+            heapq.heappush(self._heap, (deadline, seq, key))
+        self._changed.set()
+        return future
+
+    def wake(self, key: Hashable):
+        """بیدار کردن زودتر از موعد ربات (از هر threadی قابل فراخوانی است)"""
+        self.loop.call_soon_threadsafe(self._wake, key)
+
+    def _wake(self, key: Hashable):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+        if entry and not entry[2].done():
+            entry[2].set_result(True)
+
+    def cancel(self, key: Hashable):
+        """حذف نوبت ثبت‌شده ربات"""
+        with self._lock:
+            entry = self._entries.pop(key, None)
+        if entry and not entry[2].done():
+            entry[2].cancel()
+
+    def timeline(self, limit: Optional[int] = None) -> List[Dict]:
+        """برنامه زمانی بررسی‌های آینده به ترتیب موعد"""
+        now = time.monotonic()
+        wall_now = time.time()
+        with self._lock:
+            entries = sorted(
+                (deadline, key, reason) for key, (deadline, _, _, reason) in self._entries.items()
+            )
+        if limit is not None:
+            entries = entries[:limit]
+        return [
+            {
+                "key": key,
+                "reason": reason,
+                "due_in": round(max(0.0, deadline - now), 3),
+                "due_at": wall_now + max(0.0, deadline - now),
+            }
+            for deadline, key, reason in entries
+        ]
+
+    def pending_count(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+    async def _run(self):
+        while True:
+            self._changed.clear()
+            due: List[asyncio.Future] = []
+            timeout: Optional[float] = None
+            now = time.monotonic()
+
+            with self._lock:
+                while self._heap:
+                    deadline, seq, key = self._heap[0]
+                    entry = self._entries.get(key)
+                    # ورودی‌های قدیمی (زمان‌بندی مجدد یا لغو شده) به صورت تنبل حذف می‌شوند
+                    if entry is None or entry[1] != seq:
+                        heapq.heappop(self._heap)
+                        continue
+                    if deadline > now:
+                        timeout = deadline - now
+                        break
+                    heapq.heappop(self._heap)
+                    del self._entries[key]
+                    due.append(entry[2])
+
+            for future in due:
+                if not future.done():
+                    future.set_result(False)
+
+            try:
+                await asyncio.wait_for(self._changed.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
@@ -0,0 +1,122 @@
+import copy
+import logging
+import queue
+import threading
+from typing import Callable, Dict, List, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+# حداکثر رویدادهای در صف هر مشترک؛ مشترکی که عقب بماند یک snapshot کامل می‌گیرد
+SUBSCRIBER_QUEUE_SIZE = 256
+
+
+class StatusHub:
+    """مرکز اطلاع‌رسانی تغییر وضعیت ربات‌ها به تفکیک کاربر
+
+    ربات‌ها وضعیت خود را در هر گذار (شروع، نیاز به تأیید، اجرا، توقف) منتشر
+    می‌کنند و فقط وضعیتی که با آخرین وضعیت ثبت‌شده فرق داشته باشد به صف
+    مشترکین همان کاربر ارسال می‌شود. خواندن وضعیت‌ها هیچ فراخوانی روی خود
+    ربات‌ها ندارد.
+    """
+
+    def __init__(self, queue_size: int = SUBSCRIBER_QUEUE_SIZE):
+        self.queue_size = queue_size
+        self._lock = threading.Lock()
+        self._states: Dict[int, Dict] = {}
+        self._owners: Dict[int, int] = {}
+        self._subscribers: Dict[int, Set[queue.Queue]] = {}
+        # شنونده‌های تغییر (مثلاً ارسال به پردازش supervisor): (kind, account_id, user_id, state)
+        self._listeners: List[Callable[[str, int, int, Optional[Dict]], None]] = []
+
+    def add_listener(self, callback: Callable[[str, int, int, Optional[Dict]], None]):
+        """ثبت تابعی که با هر تغییر وضعیت یا حذف ربات فراخوانی می‌شود"""
+        with self._lock:
+            self._listeners.append(callback)
+
+    def publish(self, account_id: int, user_id: int, state: Dict) -> bool:
+        """ثبت وضعیت ربات؛ اگر تغییری نکرده باشد چیزی ارسال نمی‌شود"""
+        # کپی عمیق تا تغییر بعدی dictهای داخلی ربات وضعیت ثبت‌شده را عوض نکند
+        event = copy.deepcopy(dict(state, account_id=account_id))
+        with self._lock:
+            if self._states.get(account_id) == event:
+                return False
+            self._states[account_id] = event
+            self._owners[account_id] = user_id
+            subscribers = list(self._subscribers.get(user_id, ()))
+            listeners = list(self._listeners)
+        for subscriber in subscribers:
+            self._deliver(subscriber, event)
+        self._notify(listeners, "status", account_id, user_id, event)
+        return True
+
+    def remove(self, account_id: int):
+        """حذف وضعیت رباتی که اجرایش تمام شده"""
+        with self._lock:
+            state = self._states.pop(account_id, None)
+            user_id = self._owners.pop(account_id, None)
+            subscribers = list(self._subscribers.get(user_id, ())) if user_id is not None else []
+            listeners = list(self._listeners)
+        if state is None:
+            return
+        event = {"account_id": account_id, "removed": True}
+        for subscriber in subscribers:
+            self._deliver(subscriber, event)
+        self._notify(listeners, "removed", account_id, user_id, None)
+
+    def _notify(self, listeners, kind: str, account_id: int, user_id: int, state: Optional[Dict]):
+        for callback in listeners:
+            try:
+                callback(kind, account_id, user_id, state)
+            except Exception as e:
+                logger.error(f"خطا در اطلاع‌رسانی وضعیت ربات: {e}")
+
+    def _deliver(self, subscriber: queue.Queue, event: Dict):
+        try:
+            subscriber.put_nowait(event)
+        except queue.Full:
+            # صف مشترک کند را خالی می‌کنیم تا در رویداد بعدی snapshot کامل بگیرد
+            try:
+                while True:
+                    subscriber.get_nowait()
+            except queue.Empty:
+                pass
+            subscriber.put_nowait({"resync": True})
+
+    def subscribe(self, user_id: int) -> queue.Queue:
+        """ثبت مشترک جدید برای وضعیت ربات‌های یک کاربر"""
+        subscriber: queue.Queue = queue.Queue(maxsize=self.queue_size)
+        with self._lock:
+            self._subscribers.setdefault(user_id, set()).add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, user_id: int, subscriber: queue.Queue):
+        with self._lock:
+            subscribers = self._subscribers.get(user_id)
+            if subscribers:
+                subscribers.discard(subscriber)
+                if not subscribers:
+                    del self._subscribers[user_id]
+
+    def snapshot(self, user_id: int) -> Dict[int, Dict]:
+        """وضعیت فعلی تمام ربات‌های یک کاربر"""
+        with self._lock:
+            return {
+                account_id: dict(state)
+                for account_id, state in self._states.items()
+                if self._owners.get(account_id) == user_id
+            }
+
+    def get(self, account_id: int, user_id: Optional[int] = None) -> Optional[Dict]:
+        """وضعیت یک ربات؛ در صورت تعیین user_id فقط ربات‌های همان کاربر"""
+        with self._lock:
+            if user_id is not None and self._owners.get(account_id) != user_id:
+                return None
+            state = self._states.get(account_id)
+            return dict(state) if state else None
+
+    def subscriber_count(self) -> int:
+        with self._lock:
+            return sum(len(subscribers) for subscribers in self._subscribers.values())
+
+
+status_hub = StatusHub()
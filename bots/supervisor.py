@@ -0,0 +1,640 @@
+import atexit
+import itertools
+import logging
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures import wait as wait_futures
+from typing import Callable, Dict, List, Optional
+
+from .metrics import api_metrics, merge_rows
+from .outbound import get_outbound_dispatcher
+from .status_hub import status_hub
+
+logger = logging.getLogger(__name__)
+
+# تعداد پردازش‌های اجرای ربات؛ صفر یعنی اجرای ربات‌ها داخل همان پردازش وب
+DEFAULT_WORKER_PROCESSES = int(os.environ.get('BOT_WORKER_PROCESSES', str(os.cpu_count() or 1)))
+
+# فاصله ارسال heartbeat از workerها (ثانیه)
+HEARTBEAT_INTERVAL = 2.0
+
+# workerی که این مدت heartbeat نفرستد گیر کرده فرض و دوباره راه‌اندازی می‌شود
+HEARTBEAT_TIMEOUT = 60.0
+
+# حداکثر انتظار برای پاسخ دستورهای کنترلی (ثانیه)
+COMMAND_TIMEOUT = 40.0
+
+# تعداد ورودی‌های برنامه زمانی که هر worker در heartbeat می‌فرستد
+HEARTBEAT_TIMELINE_LIMIT = 200
+
+
+def _setup_worker_logging(index: int):
+    logging.basicConfig(
+        level=logging.INFO,
+        format=f'%(asctime)s - worker-{index} - %(levelname)s - %(message)s',
+        handlers=[
+            logging.FileHandler("instagram_bot.log", encoding='utf-8'),
+            logging.StreamHandler()
+        ]
+    )
+
+
+def worker_main(index: int, workers: int, commands, events):
+    """حلقه اصلی پردازش worker: اجرای BotRuntime و پاسخ به دستورهای supervisor"""
+    _setup_worker_logging(index)
+
+    from models import message_manager
+    from models.reply_table import reply_cache
+    from .instagram_bot import InstagramBot
+    from .rate_limiter import EGRESS_BURST, EGRESS_RATE, rate_limiter
+    from .runtime import BotRuntime
+
+    # بودجه هر proxy خروجی بین workerها تقسیم می‌شود چون سطل‌ها بین پردازش‌ها مشترک نیستند
+    rate_limiter.set_default("egress", EGRESS_RATE / workers, max(1, EGRESS_BURST // workers))
+
+    runtime = BotRuntime()
+    control = ThreadPoolExecutor(max_workers=4, thread_name_prefix="bot-control")
+    bots: Dict[int, object] = {}
+    tasks: Dict[int, Future] = {}
+    lock = threading.Lock()
+
+    def refresh_replies(command: Dict):
+        # تغییر یک پیام روی جدول همین پردازش اعمال می‌شود؛ تغییر گروهی کل جدول را باطل می‌کند
+        message_id = command.get("message_id")
+        if message_id is not None and command["db_path"] == message_manager.db_path:
+            message_manager.refresh_reply(command["user_id"], message_id, notify=False)
+        else:
+            reply_cache.invalidate(command["db_path"], command["user_id"], notify=False)
+
+    def emit(event: Dict):
+        event["worker"] = index
+        events.put(event)
+
+    def forward_status(kind, account_id, user_id, state):
+        emit({"type": kind, "account_id": account_id, "user_id": user_id, "state": state})
+
+    status_hub.add_listener(forward_status)
+
+    def reply(command: Dict, result):
+        if command.get("request_id") is not None:
+            emit({"type": "reply", "request_id": command["request_id"], "result": result})
+
+    def start(command: Dict):
+        account_id = command["account_id"]
+        with lock:
+            if account_id in bots:
+                return
+        bot = InstagramBot(command["username"], command["password"], command["user_id"])
+        bot.publish_status()
+        task = runtime.submit(account_id, bot)
+        with lock:
+            bots[account_id] = bot
+            tasks[account_id] = task
+
+        def on_finished(future):
+            with lock:
+                if bots.get(account_id) is bot:
+                    del bots[account_id]
+                    del tasks[account_id]
+            status_hub.remove(account_id)
+            emit({"type": "finished", "account_id": account_id})
+
+        task.add_done_callback(on_finished)
+
+    def stop(command: Dict):
+        account_id = command["account_id"]
+        with lock:
+            bot = bots.get(account_id)
+            task = tasks.get(account_id)
+        if bot is None:
+            reply(command, True)
+            return
+        result = bot.stop_bot()
+        if task is not None and not task.done():
+            wait_futures([task], timeout=command.get("timeout", 5.0))
+        reply(command, result)
+
+    def call_bot(command: Dict, method: str, *args):
+        with lock:
+            bot = bots.get(command["account_id"])
+        result = getattr(bot, method)(*args) if bot is not None else False
+        reply(command, result)
+
+    def send_heartbeat():
+        with lock:
+            running = list(bots)
+        emit({
+            "type": "heartbeat",
+            "bots": running,
+            "timeline": runtime.timeline(HEARTBEAT_TIMELINE_LIMIT),
+            "metrics": api_metrics.snapshot(),
+            "outbound": get_outbound_dispatcher().stats(),
+        })
+
+    logger.info(f"worker {index} (pid {os.getpid()}) آماده است")
+    last_heartbeat = 0.0
+    try:
+        while True:
+            try:
+                command = commands.get(timeout=HEARTBEAT_INTERVAL)
+            except queue.Empty:
+                command = None
+
+            if command is not None:
+                op = command.get("op")
+                try:
+                    if op == "shutdown":
+                        break
+                    elif op == "start":
+                        start(command)
+                    elif op == "stop":
+                        control.submit(stop, command)
+                    elif op == "wake":
+                        with lock:
+                            bot = bots.get(command["account_id"])
+                        if bot is not None:
+                            bot.wake()
+                    elif op == "request_code":
+                        control.submit(call_bot, command, "request_verification_code", command["method"])
+                    elif op == "submit_code":
+                        control.submit(call_bot, command, "submit_verification_code", command["code"])
+                    elif op == "invalidate_replies":
+                        refresh_replies(command)
+                    else:
+                        logger.warning(f"دستور ناشناخته: {op}")
+                except Exception as e:
+                    logger.error(f"خطا در اجرای دستور {op}: {e}")
+                    reply(command, False)
+
+            if time.monotonic() - last_heartbeat >= HEARTBEAT_INTERVAL:
+                send_heartbeat()
+                last_heartbeat = time.monotonic()
+    finally:
+        with lock:
+            running = list(bots.values())
+        for bot in running:
+            bot.stop_event.set()
+        for bot in running:
+            bot.stop_bot()
+        control.shutdown(wait=False)
+        runtime.shutdown()
+        logger.info(f"worker {index} متوقف شد")
+
+
+class WorkerHandle:
+    """وضعیت یک پردازش worker در supervisor"""
+
+    def __init__(self, index: int, process, commands):
+        self.index = index
+        self.process = process
+        self.commands = commands
+        self.last_heartbeat = time.monotonic()
+        self.timeline: List[Dict] = []
+        self.metrics: List[Dict] = []
+        self.outbound: Dict = {}
+        self.restarts = 0
+
+
+class RemoteBot:
+    """نماینده رباتی که در یکی از workerها اجرا می‌شود
+
+    رابط آن همان بخشی از InstagramBot است که routeها استفاده می‌کنند؛
+    وضعیت از status_hub خوانده و فرمان‌ها از طریق supervisor ارسال می‌شوند.
+    """
+
+    def __init__(self, supervisor: "BotSupervisor", account_id: int, user_id: int,
+                 instagram_username: str, instagram_password: str):
+        self.supervisor = supervisor
+        self.account_id = account_id
+        self.user_id = user_id
+        self.instagram_username = instagram_username
+        self.instagram_password = instagram_password
+
+    def get_account_id(self) -> int:
+        return self.account_id
+
+    def get_status(self) -> Dict:
+        state = status_hub.get(self.account_id)
+        if state:
+            return state
+        return {
+            "state": "starting",
+            "running": False,
+            "verification_status": {
+                "needs_verification": False,
+                "method": None,
+                "username": self.instagram_username,
+                "verification_info": None
+            }
+        }
+
+    @property
+    def running(self) -> bool:
+        return self.get_status()["running"]
+
+    def publish_status(self):
+        status_hub.publish(self.account_id, self.user_id, self.get_status())
+
+    def get_verification_status(self) -> Dict:
+        return self.get_status()["verification_status"]
+
+    def needs_verification(self) -> bool:
+        return self.get_verification_status()["needs_verification"]
+
+    def request_verification_code(self, method: str = "sms") -> bool:
+        return bool(self.supervisor.call(self.account_id, {"op": "request_code", "method": method}))
+
+    def submit_verification_code(self, code: str) -> bool:
+        return bool(self.supervisor.call(self.account_id, {"op": "submit_code", "code": code}))
+
+    def wake(self):
+        self.supervisor.send(self.account_id, {"op": "wake"})
+
+    def stop_bot(self) -> bool:
+        return self.supervisor.stop(self.account_id)
+
+
+class BotSupervisor:
+    """تقسیم حساب‌ها بین چند پردازش worker
+
+    هر worker یک BotRuntime دارد و حساب‌ها به worker کم‌بارتر سپرده می‌شوند.
+    وب فقط از طریق صف دستور با workerها صحبت می‌کند و رویدادهای وضعیت،
+    پاسخ دستورها و heartbeat از یک صف مشترک برمی‌گردند. workerی که از کار
+    بیفتد یا heartbeat نفرستد دوباره راه‌اندازی و حساب‌هایش دوباره توزیع می‌شوند.
+    """
+
+    def __init__(self, workers: int = DEFAULT_WORKER_PROCESSES):
+        self.workers = max(0, workers)
+        self._context = multiprocessing.get_context("spawn")
+        self._lock = threading.RLock()
+        self._handles: List[WorkerHandle] = []
+        self._events = None
+        self._started = False
+        self._closing = False
+        # account_id -> شماره worker
+        self._assignments: Dict[int, int] = {}
+        # account_id -> مشخصات لازم برای شروع دوباره ربات
+        self._specs: Dict[int, Dict] = {}
+        self._tasks: Dict[int, Future] = {}
+        self._verification_callbacks: Dict[int, Callable[[], None]] = {}
+        self._pending: Dict[int, Future] = {}
+        self._request_ids = itertools.count(1)
+        self.restarts = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.workers > 0
+
+    def start(self):
+        """راه‌اندازی workerها و threadهای دریافت رویداد و نظارت"""
+        with self._lock:
+            if self._started:
+                return
+            self._events = self._context.Queue()
+            self._handles = [self._spawn(index) for index in range(self.workers)]
+            self._started = True
+
+        from models.reply_table import reply_cache
+        reply_cache.add_listener(self._broadcast_invalidation)
+
+        threading.Thread(target=self._event_loop, name="supervisor-events", daemon=True).start()
+        threading.Thread(target=self._monitor_loop, name="supervisor-monitor", daemon=True).start()
+        atexit.register(self.shutdown)
+        logger.info(f"supervisor با {self.workers} پردازش worker راه‌اندازی شد")
+
+    def _spawn(self, index: int) -> WorkerHandle:
+        commands = self._context.Queue()
+        process = self._context.Process(
+            target=worker_main, args=(index, self.workers, commands, self._events),
+            name=f"bot-worker-{index}", daemon=True
+        )
+        process.start()
+        return WorkerHandle(index, process, commands)
+
+    def create_bot(self, account_id: int, user_id: int, instagram_username: str,
+                   instagram_password: str) -> RemoteBot:
+        return RemoteBot(self, account_id, user_id, instagram_username, instagram_password)
+
+    def submit(self, key: int, bot: RemoteBot,
+               on_verification: Optional[Callable[[], None]] = None) -> Future:
+        """سپردن ربات به worker کم‌بارتر؛ Future با پایان اجرای ربات کامل می‌شود"""
+        self.start()
+        future: Future = Future()
+        spec = {
+            "account_id": key,
+            "user_id": bot.user_id,
+            "username": bot.instagram_username,
+            "password": bot.instagram_password,
+        }
+        with self._lock:
+            self._specs[key] = spec
+            self._tasks[key] = future
+            if on_verification:
+                self._verification_callbacks[key] = on_verification
+            index = self._least_loaded()
+            self._assignments[key] = index
+            self._send(index, dict(spec, op="start"))
+        return future
+
+    def _least_loaded(self, exclude: Optional[int] = None) -> int:
+        loads = self._loads()
+        candidates = [index for index in range(self.workers) if index != exclude] or list(range(self.workers))
+        return min(candidates, key=lambda index: (loads[index], index))
+
+    def _loads(self) -> List[int]:
+        loads = [0] * self.workers
+        for index in self._assignments.values():
+            loads[index] += 1
+        return loads
+
+    def _send(self, index: int, command: Dict):
+        self._handles[index].commands.put(command)
+
+    def send(self, key: int, command: Dict):
+        """ارسال دستور بدون انتظار پاسخ به worker ربات"""
+        with self._lock:
+            index = self._assignments.get(key)
+            if index is None:
+                return
+            self._send(index, dict(command, account_id=key))
+
+    def _request(self, index: int, command: Dict) -> Future:
+        request_id = next(self._request_ids)
+        future: Future = Future()
+        future.worker = index
+        with self._lock:
+            self._pending[request_id] = future
+            self._send(index, dict(command, request_id=request_id))
+        return future
+
+    def call(self, key: int, command: Dict, timeout: float = COMMAND_TIMEOUT):
+        """ارسال دستور به worker ربات و انتظار برای نتیجه"""
+        with self._lock:
+            index = self._assignments.get(key)
+        if index is None:
+            return False
+        future = self._request(index, dict(command, account_id=key))
+        try:
+            return future.result(timeout=timeout)
+        except Exception as e:
+            logger.error(f"پاسخی از worker {index} دریافت نشد: {e}")
+            return False
+
+    def stop(self, key: int, timeout: float = 5.0) -> bool:
+        """توقف ربات؛ ربات از برنامه بازتوزیع هم حذف می‌شود"""
+        with self._lock:
+            self._specs.pop(key, None)
+        return bool(self.call(key, {"op": "stop", "timeout": timeout}))
+
+    def wake(self, key: int):
+        self.send(key, {"op": "wake"})
+
+    def _broadcast_invalidation(self, db_path: str, user_id: int, message_id: Optional[int]):
+        with self._lock:
+            for handle in self._handles:
+                handle.commands.put({"op": "invalidate_replies", "db_path": db_path, "user_id": user_id,
+                                     "message_id": message_id})
+
+    def _event_loop(self):
+        while True:
+            try:
+                event = self._events.get()
+            except (EOFError, OSError):
+                return
+            try:
+                self._handle_event(event)
+            except Exception as e:
+                logger.error(f"خطا در پردازش رویداد worker: {e}")
+
+    def _is_current(self, event: Dict) -> bool:
+        """رویدادهای worker قبلی ربات (پس از انتقال یا راه‌اندازی دوباره) نادیده گرفته می‌شوند"""
+        return self._assignments.get(event.get("account_id")) == event["worker"]
+
+    def _handle_event(self, event: Dict):
+        kind = event["type"]
+        if kind == "heartbeat":
+            with self._lock:
+                handle = self._handles[event["worker"]]
+                handle.last_heartbeat = time.monotonic()
+                handle.timeline = event["timeline"]
+                handle.metrics = event["metrics"]
+                handle.outbound = event.get("outbound", {})
+            return
+
+        if kind == "reply":
+            with self._lock:
+                future = self._pending.pop(event["request_id"], None)
+            if future is not None and not future.done():
+                future.set_result(event["result"])
+            return
+
+        account_id = event["account_id"]
+        with self._lock:
+            if not self._is_current(event):
+                return
+
+        if kind == "status":
+            status_hub.publish(account_id, event["user_id"], event["state"])
+            if event["state"]["verification_status"]["needs_verification"]:
+                callback = self._verification_callbacks.pop(account_id, None)
+                if callback:
+                    callback()
+        elif kind == "removed":
+            status_hub.remove(account_id)
+        elif kind == "finished":
+            with self._lock:
+                self._assignments.pop(account_id, None)
+                self._specs.pop(account_id, None)
+                self._verification_callbacks.pop(account_id, None)
+                future = self._tasks.pop(account_id, None)
+            status_hub.remove(account_id)
+            if future is not None and not future.done():
+                future.set_result(None)
+
+    def _monitor_loop(self):
+        while not self._closing:
+            time.sleep(1.0)
+            for index in range(self.workers):
+                with self._lock:
+                    if self._closing:
+                        return
+                    handle = self._handles[index]
+                    alive = handle.process.is_alive()
+                    stale = time.monotonic() - handle.last_heartbeat > HEARTBEAT_TIMEOUT
+                if not alive or stale:
+                    self._restart(index, "از کار افتاد" if not alive else "heartbeat نفرستاد")
+
+    def _restart(self, index: int, reason: str):
+        """راه‌اندازی دوباره worker و توزیع دوباره حساب‌های آن"""
+        with self._lock:
+            old = self._handles[index]
+            logger.error(f"worker {index} (pid {old.process.pid}) {reason}؛ راه‌اندازی دوباره")
+            if old.process.is_alive():
+                old.process.terminate()
+            old.process.join(timeout=5)
+
+            # پاسخ دستورهای در انتظار این worker هرگز نخواهد رسید
+            for request_id, future in list(self._pending.items()):
+                if getattr(future, "worker", None) == index:
+                    del self._pending[request_id]
+                    future.set_result(False)
+
+            handle = self._spawn(index)
+            handle.restarts = old.restarts + 1
+            self._handles[index] = handle
+            self.restarts += 1
+
+            orphaned = [key for key, worker in self._assignments.items() if worker == index]
+            for key in orphaned:
+                del self._assignments[key]
+            for key in orphaned:
+                spec = self._specs.get(key)
+                if spec is None:
+                    continue
+                target = self._least_loaded()
+                self._assignments[key] = target
+                self._send(target, dict(spec, op="start"))
+                logger.info(f"ربات {key} به worker {target} منتقل شد")
+
+        for key in orphaned:
+            if key not in self._specs:
+                self._finish(key)
+        self.rebalance()
+
+    def _finish(self, key: int):
+        with self._lock:
+            self._assignments.pop(key, None)
+            future = self._tasks.pop(key, None)
+        status_hub.remove(key)
+        if future is not None and not future.done():
+            future.set_result(None)
+
+    def rebalance(self):
+        """جابجایی ربات‌ها از worker پربارتر به کم‌بارتر تا اختلاف بار حداکثر یک باشد
+
+        ربات‌های منتظر تأیید جابجا نمی‌شوند چون اطلاعات چالش در worker فعلی است.
+        ربات ابتدا در worker قبلی متوقف و پس از پاسخ آن در worker جدید شروع می‌شود.
+        """
+        with self._lock:
+            if not self._started or self._closing:
+                return
+            moves = []
+            loads = self._loads()
+            movable = {
+                key: worker for key, worker in self._assignments.items()
+                if key in self._specs and not (status_hub.get(key) or {}).get(
+                    "verification_status", {}).get("needs_verification")
+            }
+            while True:
+                busiest = max(range(self.workers), key=lambda index: loads[index])
+                idlest = min(range(self.workers), key=lambda index: loads[index])
+                if loads[busiest] - loads[idlest] <= 1:
+                    break
+                candidates = [key for key, worker in movable.items() if worker == busiest]
+                if not candidates:
+                    break
+                key = candidates[0]
+                del movable[key]
+                loads[busiest] -= 1
+                loads[idlest] += 1
+                self._assignments[key] = idlest
+                moves.append((key, busiest, idlest))
+
+        for key, source, target in moves:
+            logger.info(f"انتقال ربات {key} از worker {source} به worker {target}")
+            stopped = self._request(source, {"op": "stop", "account_id": key})
+            stopped.add_done_callback(lambda _, key=key, target=target: self._start_moved(key, target))
+
+    def _start_moved(self, key: int, target: int):
+        with self._lock:
+            spec = self._specs.get(key)
+            if spec is None or self._assignments.get(key) != target:
+                return
+            self._send(target, dict(spec, op="start"))
+
+    def timeline(self, limit: Optional[int] = None) -> List[Dict]:
+        """برنامه زمانی بررسی‌های تمام workerها بر اساس آخرین heartbeat"""
+        with self._lock:
+            entries = [entry for handle in self._handles for entry in handle.timeline]
+        entries.sort(key=lambda entry: entry["due_at"])
+        return entries[:limit] if limit is not None else entries
+
+    def metrics_rows(self) -> List[Dict]:
+        """آمار API همین پردازش و تمام workerها"""
+        with self._lock:
+            remote = [handle.metrics for handle in self._handles]
+        return merge_rows(api_metrics.snapshot(), *remote)
+
+    def outbound_stats(self) -> Dict:
+        """آمار صف ارسال همین پردازش و تمام workerها"""
+        with self._lock:
+            remote = [handle.outbound for handle in self._handles]
+        total = get_outbound_dispatcher().stats()
+        for stats in remote:
+            for name, value in stats.items():
+                if name == "max_wait_ms":
+                    total[name] = max(total.get(name, 0.0), value)
+                else:
+                    total[name] = total.get(name, 0) + value
+        return total
+
+    def active_count(self) -> int:
+        with self._lock:
+            return len(self._assignments)
+
+    def worker_stats(self) -> List[Dict]:
+        with self._lock:
+            loads = self._loads()
+            return [
+                {
+                    "worker": handle.index,
+                    "pid": handle.process.pid,
+                    "alive": handle.process.is_alive(),
+                    "bots": loads[handle.index],
+                    "restarts": handle.restarts,
+                    "heartbeat_age": round(time.monotonic() - handle.last_heartbeat, 1),
+                }
+                for handle in self._handles
+            ]
+
+    def shutdown(self, timeout: float = 10.0):
+        """توقف تمام workerها"""
+        with self._lock:
+            if not self._started or self._closing:
+                return
+            self._closing = True
+            handles = list(self._handles)
+        for handle in handles:
+            try:
+                handle.commands.put({"op": "shutdown"})
+            except Exception:
+                pass
+        deadline = time.monotonic() + timeout
+        for handle in handles:
+            handle.process.join(timeout=max(0.1, deadline - time.monotonic()))
+            if handle.process.is_alive():
+                handle.process.terminate()
+        with self._lock:
+            tasks = list(self._tasks.values())
+            self._tasks.clear()
+            self._assignments.clear()
+        for future in tasks:
+            if not future.done():
+                future.set_result(None)
+
+
+_supervisor: Optional[BotSupervisor] = None
+_supervisor_lock = threading.Lock()
+
+
+def get_bot_supervisor() -> BotSupervisor:
+    """دریافت نمونه مشترک supervisor (با BOT_WORKER_PROCESSES=0 غیرفعال است)"""
+    global _supervisor
+    with _supervisor_lock:
+        if _supervisor is None:
+            _supervisor = BotSupervisor()
+        return _supervisor
@@ -1,10 +1,17 @@
 from .user_manager import UserManager
 from .message_manager import MessageManager
 from .bot_manager import BotManager
+from .watermark_manager import WatermarkManager
+from .session_store import SessionStore
+from .outbound_queue import OutboundQueueManager
 
 # ایجاد نمونه‌های جهانی
 user_manager = UserManager()
 message_manager = MessageManager()
 bot_manager = BotManager()
+watermark_manager = WatermarkManager()
+outbound_queue_manager = OutboundQueueManager()
 
-__all__ = ['UserManager', 'MessageManager', 'BotManager', 'user_manager', 'message_manager', 'bot_manager']
\ No newline at end of file
+__all__ = ['UserManager', 'MessageManager', 'BotManager', 'WatermarkManager', 'SessionStore',
+           'OutboundQueueManager', 'user_manager', 'message_manager', 'bot_manager',
+           'watermark_manager', 'outbound_queue_manager']
\ No newline at end of file
@@ -0,0 +1,63 @@
+import threading
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+
+class AccountRegistry:
+    """ایندکس درون‌حافظه‌ای حساب‌های اینستاگرام به ازای هر (دیتابیس، کاربر)
+
+    حساب‌های هر کاربر یک بار با یک کوئری بارگذاری و بر اساس نام کاربری
+    ایندکس می‌شوند؛ افزودن، حذف یا تغییر وضعیت حساب ایندکس کاربر را باطل می‌کند.
+    مانند reply_cache از نسخه‌بندی استفاده می‌شود تا ایندکسی که در حین
+    بارگذاری‌اش تغییری رخ داده در کش قرار نگیرد.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._indexes: Dict[Tuple[str, int], Dict[str, Dict]] = {}
+        self._versions: Dict[Tuple[str, int], int] = {}
+        # account_id -> user_id برای باطل کردن با شناسه حساب
+        self._owners: Dict[Tuple[str, int], int] = {}
+
+    def get_index(self, db_path: str, user_id: int,
+                  loader: Callable[[], Iterable[Dict]]) -> Dict[str, Dict]:
+        """دریافت ایندکس نام کاربری -> اطلاعات حساب‌های کاربر"""
+        cache_key = (db_path, user_id)
+        with self._lock:
+            index = self._indexes.get(cache_key)
+            version = self._versions.get(cache_key, 0)
+        if index is not None:
+            return index
+
+        index = {account["instagram_username"]: account for account in loader()}
+
+        with self._lock:
+            if self._versions.get(cache_key, 0) == version:
+                self._indexes[cache_key] = index
+                for account in index.values():
+                    self._owners[(db_path, account["id"])] = user_id
+        return index
+
+    def get_account(self, db_path: str, user_id: int, instagram_username: str,
+                    loader: Callable[[], Iterable[Dict]]) -> Optional[Dict]:
+        """اطلاعات یک حساب بر اساس نام کاربری"""
+        return self.get_index(db_path, user_id, loader).get(instagram_username)
+
+    def invalidate(self, db_path: str, user_id: int):
+        """باطل کردن ایندکس حساب‌های کاربر"""
+        cache_key = (db_path, user_id)
+        with self._lock:
+            self._versions[cache_key] = self._versions.get(cache_key, 0) + 1
+            index = self._indexes.pop(cache_key, None)
+            for account in (index or {}).values():
+                self._owners.pop((db_path, account["id"]), None)
+
+    def invalidate_account(self, db_path: str, account_id: int):
+        """باطل کردن ایندکس مالک یک حساب در صورت وجود در کش"""
+        with self._lock:
+            user_id = self._owners.get((db_path, account_id))
+        if user_id is not None:
+            self.invalidate(db_path, user_id)
+
+
+# ایندکس مشترک بین تمام نمونه‌های UserManager در این پردازش
+account_registry = AccountRegistry()
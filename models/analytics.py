@@ -0,0 +1,203 @@
+"""جدول‌های تجمیعی (rollup) آمار پاسخ‌ها
+
+آمار روزانه به ازای (کاربر، حساب، روز، کلید) در همان تراکنشی که نویسنده
+تاریخچه ردیف‌ها را می‌نویسد به‌روز می‌شود، پس هزینه صفحه آمار به حجم
+message_history بستگی ندارد. برای تاریخچه موجود:
+
+    python -m models.backfill_rollups --db messages.db
+"""
+import logging
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from .database import get_connection, transaction
+
+logger = logging.getLogger(__name__)
+
+# کلید ردیف‌های جمع کل هر حساب در جدول گفتگوها
+TOTAL_KEY = ""
+
+# حساب نامشخص (ردیف‌های قدیمی بدون account_id)
+UNKNOWN_ACCOUNT = 0
+
+ANALYTICS_DAYS = 30
+TOP_KEYS_LIMIT = 10
+
+
+def create_rollup_tables(cursor):
+    """ایجاد جدول‌های rollup (در migration پیام‌ها اجرا می‌شود)"""
+    # تعداد پاسخ و گفتگوی یکتا به ازای هر کلید در هر روز
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS reply_daily_stats (
+            user_id INTEGER NOT NULL,
+            account_id INTEGER NOT NULL,
+            day TEXT NOT NULL,
+            message_key TEXT NOT NULL,
+            replies INTEGER NOT NULL DEFAULT 0,
+            conversations INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, day, account_id, message_key)
+        ) WITHOUT ROWID
+    ''')
+    # جمع کل هر حساب در هر روز
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS reply_daily_totals (
+            user_id INTEGER NOT NULL,
+            account_id INTEGER NOT NULL,
+            day TEXT NOT NULL,
+            replies INTEGER NOT NULL DEFAULT 0,
+            conversations INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, day, account_id)
+        ) WITHOUT ROWID
+    ''')
+    # گفتگوهای دیده‌شده هر روز برای شمارش یکتا؛ message_key خالی یعنی جمع کل حساب
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS reply_daily_threads (
+            user_id INTEGER NOT NULL,
+            account_id INTEGER NOT NULL,
+            day TEXT NOT NULL,
+            message_key TEXT NOT NULL,
+            thread_id TEXT NOT NULL,
+            PRIMARY KEY (user_id, day, account_id, message_key, thread_id)
+        ) WITHOUT ROWID
+    ''')
+
+
+def apply_rollups(conn, rows: Iterable[Tuple]):
+    """به‌روزرسانی rollupها برای دسته‌ای از ردیف‌های تاریخچه
+
+    ردیف‌ها به قالب صف HistoryWriter هستند:
+    (user_id, message_key, thread_id, user_instagram_id, sent_at, account_id)
+    و باید در همان تراکنش درج تاریخچه فراخوانی شود.
+    """
+    replies: Counter = Counter()
+    threads: Set[Tuple] = set()
+    for user_id, message_key, thread_id, _, sent_at, account_id in rows:
+        account = account_id if account_id is not None else UNKNOWN_ACCOUNT
+        day = sent_at[:10]
+        for key in (message_key, TOTAL_KEY):
+            replies[(user_id, day, account, key)] += 1
+            threads.add((user_id, day, account, key, thread_id))
+
+    # فقط گفتگوهایی که امروز برای اولین بار دیده شده‌اند شمارنده را افزایش می‌دهند
+    new_threads: Counter = Counter()
+    for thread in threads:
+        cursor = conn.execute('''
+            INSERT OR IGNORE INTO reply_daily_threads (user_id, day, account_id, message_key, thread_id)
+            VALUES (?, ?, ?, ?, ?)
+        ''', thread)
+        if cursor.rowcount > 0:
+            new_threads[thread[:4]] += 1
+
+    stats = []
+    totals = []
+    for group, count in replies.items():
+        user_id, day, account, key = group
+        if key == TOTAL_KEY:
+            totals.append((user_id, day, account, count, new_threads[group]))
+        else:
+            stats.append((user_id, day, account, key, count, new_threads[group]))
+
+    conn.executemany('''
+        INSERT INTO reply_daily_stats (user_id, day, account_id, message_key, replies, conversations)
+        VALUES (?, ?, ?, ?, ?, ?)
+        ON CONFLICT (user_id, day, account_id, message_key) DO UPDATE SET
+            replies = replies + excluded.replies,
+            conversations = conversations + excluded.conversations
+    ''', stats)
+    conn.executemany('''
+        INSERT INTO reply_daily_totals (user_id, day, account_id, replies, conversations)
+        VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT (user_id, day, account_id) DO UPDATE SET
+            replies = replies + excluded.replies,
+            conversations = conversations + excluded.conversations
+    ''', totals)
+
+
+def backfill(db_path: str, user_id: Optional[int] = None) -> int:
+    """بازسازی کامل rollupها از message_history (برای یک کاربر یا همه)
+
+    حذف و بازسازی در یک تراکنش انجام می‌شود و نویسنده تاریخچه تا پایان آن
+    منتظر می‌ماند، پس هیچ ردیفی دو بار یا هرگز شمرده نمی‌شود.
+    """
+    where = "WHERE user_id = ?" if user_id is not None else ""
+    params: Tuple = (user_id,) if user_id is not None else ()
+    account = f"COALESCE(account_id, {UNKNOWN_ACCOUNT})"
+
+    with transaction(db_path) as conn:
+        for table in ("reply_daily_stats", "reply_daily_totals", "reply_daily_threads"):
+            conn.execute(f"DELETE FROM {table} {where}", params)
+
+        conn.execute(f'''
+            INSERT INTO reply_daily_threads (user_id, day, account_id, message_key, thread_id)
+            SELECT DISTINCT user_id, substr(sent_at, 1, 10), {account}, message_key, thread_id
+            FROM message_history {where}
+        ''', params)
+        conn.execute(f'''
+            INSERT INTO reply_daily_threads (user_id, day, account_id, message_key, thread_id)
+            SELECT DISTINCT user_id, substr(sent_at, 1, 10), {account}, '', thread_id
+            FROM message_history {where}
+        ''', params)
+        conn.execute(f'''
+            INSERT INTO reply_daily_stats (user_id, day, account_id, message_key, replies, conversations)
+            SELECT user_id, substr(sent_at, 1, 10), {account}, message_key,
+                   COUNT(*), COUNT(DISTINCT thread_id)
+            FROM message_history {where}
+            GROUP BY 1, 2, 3, 4
+        ''', params)
+        cursor = conn.execute(f'''
+            INSERT INTO reply_daily_totals (user_id, day, account_id, replies, conversations)
+            SELECT user_id, substr(sent_at, 1, 10), {account},
+                   COUNT(*), COUNT(DISTINCT thread_id)
+            FROM message_history {where}
+            GROUP BY 1, 2, 3
+        ''', params)
+        return cursor.rowcount
+
+
+def get_reply_analytics(db_path: str, user_id: int, days: int = ANALYTICS_DAYS,
+                        account_id: Optional[int] = None,
+                        top_keys: int = TOP_KEYS_LIMIT) -> Dict[str, List[Dict]]:
+    """آمار روزانه و پرکاربردترین کلیدها فقط از روی جدول‌های rollup"""
+    # sent_at به وقت UTC ثبت می‌شود
+    today = datetime.now(timezone.utc).date()
+    since = (today - timedelta(days=days - 1)).isoformat()
+    account_filter = "AND account_id = ?" if account_id is not None else ""
+    params: Tuple = (user_id, since) + ((account_id,) if account_id is not None else ())
+
+    conn = get_connection(db_path)
+    daily_rows = conn.execute(f'''
+        SELECT day, SUM(replies), SUM(conversations)
+        FROM reply_daily_totals
+        WHERE user_id = ? AND day >= ? {account_filter}
+        GROUP BY day
+        ORDER BY day
+    ''', params).fetchall()
+    key_rows = conn.execute(f'''
+        SELECT message_key, SUM(replies), SUM(conversations)
+        FROM reply_daily_stats
+        WHERE user_id = ? AND day >= ? {account_filter}
+        GROUP BY message_key
+        ORDER BY 2 DESC, message_key
+        LIMIT ?
+    ''', params + (top_keys,)).fetchall()
+
+    # روزهای بدون پاسخ هم با صفر در نمودار دیده شوند
+    by_day = {row[0]: row for row in daily_rows}
+    daily = []
+    for offset in range(days):
+        day = (today - timedelta(days=days - 1 - offset)).isoformat()
+        row = by_day.get(day)
+        daily.append({
+            "day": day,
+            "replies": row[1] if row else 0,
+            "conversations": row[2] if row else 0,
+        })
+
+    return {
+        "daily": daily,
+        "keys": [
+            {"message_key": row[0], "replies": row[1], "conversations": row[2]}
+            for row in key_rows
+        ],
+    }
@@ -0,0 +1,31 @@
+"""بازسازی جدول‌های آمار پاسخ از message_history موجود
+
+اجرا از ریشه مخزن:
+    python -m models.backfill_rollups --db messages.db [--user 2]
+"""
+import argparse
+import logging
+
+from .analytics import backfill
+from .message_manager import MessageManager
+
+logger = logging.getLogger(__name__)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="بازسازی جدول‌های آمار پاسخ از تاریخچه")
+    parser.add_argument("--db", default="messages.db", help="مسیر دیتابیس پیام‌ها")
+    parser.add_argument("--user", type=int, default=None, help="فقط برای این کاربر")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    # ساخت جدول‌ها و اجرای migrationها در صورت نیاز
+    MessageManager(args.db)
+
+    groups = backfill(args.db, args.user)
+    logger.info(f"آمار پاسخ‌ها بازسازی شد ({groups} ردیف روزانه)")
+
+
+if __name__ == "__main__":
+    main()
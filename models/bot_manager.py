@@ -2,9 +2,31 @@ import sqlite3
 import logging
 from datetime import datetime
 from typing import Dict, List, Optional
+from .database import get_connection, transaction
+from .migrations import apply_migrations
 
 logger = logging.getLogger(__name__)
 
+
+def _migrate_status_unique_index(cursor):
+    # حذف رکوردهای تکراری قدیمی قبل از ساخت ایندکس یکتا
+    cursor.execute('''
+        DELETE FROM bot_status
+        WHERE id NOT IN (SELECT MAX(id) FROM bot_status GROUP BY account_id, user_id)
+    ''')
+    cursor.execute(
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_bot_status_account_user ON bot_status (account_id, user_id)"
+    )
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_bot_status_user_updated ON bot_status (user_id, updated_at)"
+    )
+
+
+MIGRATIONS = [
+    (1, "ایندکس یکتا روی bot_status(account_id, user_id)", _migrate_status_unique_index),
+]
+
+
 class BotManager:
     """مدیریت وضعیت ربات‌ها"""
     
@@ -14,60 +36,48 @@ class BotManager:
     
     def init_db(self):
         """ایجاد پایگاه داده وضعیت ربات‌ها"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS bot_status (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                account_id INTEGER NOT NULL,
-                user_id INTEGER NOT NULL,
-                status TEXT NOT NULL DEFAULT 'stopped',
-                last_activity TIMESTAMP,
-                error_message TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
+        with transaction(self.db_path) as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS bot_status (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    account_id INTEGER NOT NULL,
+                    user_id INTEGER NOT NULL,
+                    status TEXT NOT NULL DEFAULT 'stopped',
+                    last_activity TIMESTAMP,
+                    error_message TEXT,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
         
-        conn.commit()
-        conn.close()
+        apply_migrations(self.db_path, MIGRATIONS)
     
     def update_bot_status(self, account_id: int, user_id: int, status: str, error_message: str = None):
         """به‌روزرسانی وضعیت ربات"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            # بررسی وجود رکورد
-            cursor.execute(
-                "SELECT id FROM bot_status WHERE account_id = ? AND user_id = ?",
-                (account_id, user_id)
-            )
-            
-            if cursor.fetchone():
-                # به‌روزرسانی رکورد موجود
-                cursor.execute('''
-                    UPDATE bot_status 
-                    SET status = ?, error_message = ?, updated_at = ?, last_activity = ?
-                    WHERE account_id = ? AND user_id = ?
-                ''', (status, error_message, datetime.now(), datetime.now(), account_id, user_id))
-            else:
-                # ایجاد رکورد جدید
+            with transaction(self.db_path) as conn:
+                cursor = conn.cursor()
+                
+                # یک دستور UPSERT به جای SELECT و سپس UPDATE/INSERT
+                now = datetime.now()
                 cursor.execute('''
-                    INSERT INTO bot_status (account_id, user_id, status, error_message, last_activity)
-                    VALUES (?, ?, ?, ?, ?)
-                ''', (account_id, user_id, status, error_message, datetime.now()))
-            
-            conn.commit()
-            conn.close()
+                    INSERT INTO bot_status (account_id, user_id, status, error_message, last_activity, updated_at)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                    ON CONFLICT (account_id, user_id) DO UPDATE SET
+                        status = excluded.status,
+                        error_message = excluded.error_message,
+                        last_activity = excluded.last_activity,
+                        updated_at = excluded.updated_at
+                ''', (account_id, user_id, status, error_message, now, now))
         except Exception as e:
             logger.error(f"خطا در به‌روزرسانی وضعیت ربات: {e}")
     
     def get_bot_status(self, account_id: int, user_id: int) -> Dict:
         """دریافت وضعیت ربات"""
         try:
-            conn = sqlite3.connect(self.db_path)
+            conn = get_connection(self.db_path)
             cursor = conn.cursor()
             
             cursor.execute('''
@@ -77,7 +87,6 @@ class BotManager:
             ''', (account_id, user_id))
             
             status = cursor.fetchone()
-            conn.close()
             
             if status:
                 return {
@@ -104,7 +113,7 @@ class BotManager:
     def get_all_bot_statuses(self, user_id: int) -> List[Dict]:
         """دریافت وضعیت تمام ربات‌های کاربر"""
         try:
-            conn = sqlite3.connect(self.db_path)
+            conn = get_connection(self.db_path)
             cursor = conn.cursor()
             
             cursor.execute('''
@@ -125,7 +134,6 @@ class BotManager:
                     "last_activity": row[4]
                 })
             
-            conn.close()
             return statuses
         except Exception as e:
             logger.error(f"خطا در دریافت وضعیت ربات‌ها: {e}")
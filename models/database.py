@@ -0,0 +1,76 @@
+import sqlite3
+import threading
+import logging
+from contextlib import contextmanager
+from typing import Dict, Iterator
+
+logger = logging.getLogger(__name__)
+
+# زمان انتظار برای آزاد شدن قفل نوشتن به جای خطای database is locked
+BUSY_TIMEOUT_MS = 5000
+
+# تعداد statement‌های آماده که هر اتصال نگه می‌دارد
+STATEMENT_CACHE_SIZE = 256
+
+_local = threading.local()
+
+
+def _open_connection(db_path: str) -> sqlite3.Connection:
+    """باز کردن اتصال جدید با تنظیمات WAL"""
+    conn = sqlite3.connect(
+        db_path,
+        timeout=BUSY_TIMEOUT_MS / 1000,
+        cached_statements=STATEMENT_CACHE_SIZE,
+    )
+    conn.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}")
+    # WAL اجازه می‌دهد خواندن‌ها همزمان با یک نویسنده ادامه پیدا کنند
+    conn.execute("PRAGMA journal_mode = WAL")
+    # در حالت WAL، NORMAL فقط در checkpoint عمل fsync انجام می‌دهد
+    conn.execute("PRAGMA synchronous = NORMAL")
+    conn.execute("PRAGMA temp_store = MEMORY")
+    return conn
+
+
+def _connections() -> Dict[str, sqlite3.Connection]:
+    connections = getattr(_local, 'connections', None)
+    if connections is None:
+        connections = {}
+        _local.connections = connections
+    return connections
+
+
+def get_connection(db_path: str) -> sqlite3.Connection:
+    """دریافت اتصال پایدار thread فعلی به دیتابیس
+
+    اتصال‌ها به ازای هر thread نگه داشته می‌شوند و با پایان thread بسته می‌شوند،
+    بنابراین statement‌های آماده‌شده بین فراخوانی‌ها دوباره استفاده می‌شوند.
+    """
+    connections = _connections()
+    conn = connections.get(db_path)
+    if conn is None:
+        conn = _open_connection(db_path)
+        connections[db_path] = conn
+    return conn
+
+
+@contextmanager
+def transaction(db_path: str) -> Iterator[sqlite3.Connection]:
+    """اجرای دستورات در یک تراکنش با commit یا rollback خودکار"""
+    conn = get_connection(db_path)
+    try:
+        yield conn
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+
+
+def close_connections():
+    """بستن تمام اتصال‌های thread فعلی"""
+    connections = _connections()
+    for db_path, conn in list(connections.items()):
+        try:
+            conn.close()
+        except Exception as e:
+            logger.error(f"خطا در بستن اتصال {db_path}: {e}")
+    connections.clear()
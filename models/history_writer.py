@@ -0,0 +1,205 @@
+import atexit
+import logging
+import queue
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+from .analytics import apply_rollups
+from .database import transaction
+
+logger = logging.getLogger(__name__)
+
+# حداکثر تأخیر بین دریافت یک ردیف و نوشتن آن در دیتابیس (ثانیه)
+DEFAULT_FLUSH_INTERVAL = 0.25
+
+# حداکثر تعداد ردیف در هر تراکنش
+DEFAULT_BATCH_SIZE = 500
+
+# حداکثر طول صف قبل از مسدود شدن فراخواننده
+DEFAULT_MAX_QUEUE = 50000
+
+# تلاش مجدد دسته ناموفق (مثلاً database is locked) با فاصله نمایی تا سقف تعداد تلاش
+DEFAULT_MAX_ATTEMPTS = 5
+RETRY_BASE_SECONDS = 0.5
+RETRY_MAX_SECONDS = 5.0
+
+
+class HistoryWriter:
+    """نوشتن دسته‌ای تاریخچه ارسال پیام در پس‌زمینه
+
+    ردیف‌ها در صف قرار می‌گیرند و یک thread جداگانه آن‌ها را هر
+    flush_interval ثانیه یا با رسیدن به batch_size ردیف در یک تراکنش
+    می‌نویسد، بنابراین هزینه fsync بین تمام پاسخ‌ها تقسیم می‌شود.
+    دسته ناموفق کنار گذاشته نمی‌شود: ردیف‌ها در ابتدای دسته بعدی می‌مانند و
+    با فاصله نمایی دوباره نوشته می‌شوند؛ فقط پس از max_attempts تلاش ناموفق
+    در failed_rows شمرده و رها می‌شوند.
+    """
+
+    def __init__(self, db_path: str,
+                 flush_interval: float = DEFAULT_FLUSH_INTERVAL,
+                 batch_size: int = DEFAULT_BATCH_SIZE,
+                 max_queue: int = DEFAULT_MAX_QUEUE,
+                 max_attempts: int = DEFAULT_MAX_ATTEMPTS):
+        self.db_path = db_path
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.max_attempts = max(1, max_attempts)
+        self._queue: "queue.Queue" = queue.Queue(maxsize=max_queue)
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            "rows_written": 0,
+            "flushes": 0,
+            "failed_rows": 0,
+            "retries": 0,
+            "last_flush_ms": 0.0,
+            "max_flush_ms": 0.0,
+            "total_flush_ms": 0.0,
+        }
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="history-writer", daemon=True)
+        self._thread.start()
+
+    def enqueue(self, user_id: int, message_key: str, thread_id: str, user_instagram_id: str,
+                account_id: Optional[int] = None):
+        """افزودن یک ردیف تاریخچه به صف نوشتن"""
+        # زمان ارسال همان لحظه ثبت می‌شود نه لحظه نوشتن دسته
+        sent_at = datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+        self._queue.put((user_id, message_key, thread_id, user_instagram_id, sent_at, account_id))
+
+    def flush(self, timeout: float = 5.0) -> bool:
+        """صبر تا نوشته شدن تمام ردیف‌هایی که تا این لحظه در صف قرار گرفته‌اند"""
+        if self._closed or not self._thread.is_alive():
+            return self._queue.empty()
+        done = threading.Event()
+        self._queue.put(done)
+        return done.wait(timeout)
+
+    def stats(self) -> Dict[str, float]:
+        """آمار صف و تأخیر نوشتن"""
+        with self._stats_lock:
+            stats = dict(self._stats)
+        flushes = stats.pop("total_flush_ms")
+        stats["avg_flush_ms"] = flushes / stats["flushes"] if stats["flushes"] else 0.0
+        stats["queue_depth"] = self._queue.qsize()
+        return stats
+
+    def close(self, timeout: float = 5.0):
+        """نوشتن ردیف‌های باقی‌مانده و توقف thread"""
+        if self._closed:
+            return
+        self.flush(timeout)
+        self._closed = True
+        self._queue.put(None)
+        self._thread.join(timeout)
+
+    def _retry_delay(self, attempts: int) -> float:
+        return min(RETRY_BASE_SECONDS * (2 ** max(attempts - 1, 0)), RETRY_MAX_SECONDS)
+
+    def _run(self):
+        batch: List[Tuple] = []
+        waiters: List[threading.Event] = []
+        deadline: Optional[float] = None
+        # تعداد تلاش‌های ناموفق دسته فعلی؛ تا موعد تلاش بعدی چیزی نوشته نمی‌شود
+        attempts = 0
+
+        while True:
+            timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = False
+
+            if item is None:
+                # هنگام توقف، تلاش‌های باقی‌مانده همین‌جا با انتظار انجام می‌شوند
+                while batch and not self._write(batch):
+                    attempts += 1
+                    if attempts >= self.max_attempts:
+                        self._drop(batch)
+                        break
+                    time.sleep(self._retry_delay(attempts))
+                for waiter in waiters:
+                    waiter.set()
+                return
+
+            if isinstance(item, threading.Event):
+                waiters.append(item)
+            elif item is not False:
+                batch.append(item)
+                if deadline is None:
+                    deadline = time.monotonic() + self.flush_interval
+
+            due = deadline is not None and time.monotonic() >= deadline
+            if attempts and not due:
+                continue
+            if waiters or len(batch) >= self.batch_size or due:
+                if batch and not self._write(batch):
+                    attempts += 1
+                    if attempts < self.max_attempts:
+                        deadline = time.monotonic() + self._retry_delay(attempts)
+                        with self._stats_lock:
+                            self._stats["retries"] += 1
+                        continue
+                    self._drop(batch)
+                batch = []
+                deadline = None
+                attempts = 0
+                for waiter in waiters:
+                    waiter.set()
+                waiters = []
+
+    def _drop(self, batch: List[Tuple]):
+        logger.error(f"{len(batch)} ردیف تاریخچه پس از {self.max_attempts} تلاش نوشته نشد")
+        with self._stats_lock:
+            self._stats["failed_rows"] += len(batch)
+
+    def _write(self, batch: List[Tuple]) -> bool:
+        """نوشتن دسته در یک تراکنش؛ False در صورت خطا (ردیف‌ها نزد فراخواننده می‌مانند)"""
+        if not batch:
+            return True
+        started = time.perf_counter()
+        try:
+            with transaction(self.db_path) as conn:
+                conn.executemany('''
+                    INSERT INTO message_history
+                        (user_id, message_key, thread_id, user_instagram_id, sent_at, account_id)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                ''', batch)
+                # آمار روزانه در همان تراکنش به‌روز می‌شود تا با تاریخچه یکی بماند
+                apply_rollups(conn, batch)
+        except Exception as e:
+            logger.error(f"خطا در نوشتن دسته‌ای تاریخچه ({len(batch)} ردیف): {e}")
+            return False
+
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        with self._stats_lock:
+            self._stats["rows_written"] += len(batch)
+            self._stats["flushes"] += 1
+            self._stats["last_flush_ms"] = elapsed_ms
+            self._stats["total_flush_ms"] += elapsed_ms
+            self._stats["max_flush_ms"] = max(self._stats["max_flush_ms"], elapsed_ms)
+        return True
+
+
+_writers: Dict[str, HistoryWriter] = {}
+_writers_lock = threading.Lock()
+
+
+def get_history_writer(db_path: str) -> HistoryWriter:
+    """دریافت نویسنده مشترک تاریخچه برای یک دیتابیس"""
+    with _writers_lock:
+        writer = _writers.get(db_path)
+        if writer is None:
+            writer = HistoryWriter(db_path)
+            _writers[db_path] = writer
+        return writer
+
+
+@atexit.register
+def close_history_writers():
+    """نوشتن تمام صف‌ها هنگام خروج از برنامه"""
+    with _writers_lock:
+        writers = list(_writers.values())
+    for writer in writers:
+        writer.close()
@@ -0,0 +1,157 @@
+from typing import Dict, Generic, List, Optional, Set, Tuple, TypeVar
+
+T = TypeVar("T")
+
+# حالت‌های تطبیق کلیدهای متنی به ترتیب دقت؛ در اولویت برابر حالت دقیق‌تر برنده است
+MATCH_MODES = ("exact", "prefix", "word", "contains")
+MATCH_MODE_LABELS = {
+    "exact": "دقیقاً برابر",
+    "prefix": "شروع پیام",
+    "word": "کلمه کامل",
+    "contains": "هر جای پیام",
+}
+DEFAULT_MATCH_MODE = "exact"
+_MODE_RANK = {mode: rank for rank, mode in enumerate(MATCH_MODES)}
+
+
+def _is_word_char(char: str) -> bool:
+    return char.isalnum() or char == "_"
+
+
+class KeywordMatcher(Generic[T]):
+    """تطبیق‌دهنده کلیدواژه‌ها بر پایه Aho-Corasick
+
+    تمام کلیدها یک بار در یک trie با پیوندهای شکست کامپایل می‌شوند و هر
+    پیام در یک پیمایش خطی (نسبت به طول پیام و تعداد تطبیق‌ها) بررسی می‌شود،
+    مستقل از اینکه کاربر چند کلید تعریف کرده باشد. متن پیام و کلیدها باید
+    از قبل نرمال شده باشند.
+    """
+
+    def __init__(self):
+        # هر state: انتقال‌ها، پیوند شکست، الگوهای پایان‌یافته و نزدیک‌ترین state خروجی در زنجیره شکست
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._outputs: List[List[int]] = [[]]
+        self._output_link: List[int] = [-1]
+        # الگوها: (طول، حالت، اولویت، payload)
+        self._patterns: List[Optional[Tuple[int, str, int, T]]] = []
+        self._count = 0
+        # stateهایی که در آخرین build خروجی داشتند و output_link به آن‌ها اشاره می‌کند
+        self._linked: Set[int] = set()
+        self._built = True
+
+    def __len__(self) -> int:
+        return self._count
+
+    def add(self, keyword: str, payload: T, mode: str = DEFAULT_MATCH_MODE, priority: int = 0):
+        """افزودن کلیدواژه؛ اگر state تازه‌ای لازم شود build در تطبیق بعدی دوباره اجرا می‌شود"""
+        if not keyword:
+            return
+        if mode not in _MODE_RANK:
+            raise ValueError(f"حالت تطبیق نامعتبر: {mode}")
+
+        state = 0
+        created = False
+        for char in keyword:
+            next_state = self._goto[state].get(char)
+            if next_state is None:
+                created = True
+                next_state = len(self._goto)
+                self._goto[state][char] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._outputs.append([])
+                self._output_link.append(-1)
+            state = next_state
+        self._outputs[state].append(len(self._patterns))
+        self._patterns.append((len(keyword), mode, priority, payload))
+        self._count += 1
+        # state موجودی که پیوندها از قبل به آن می‌رسند (مثلاً ویرایش همان کلید) build لازم ندارد
+        if created or state not in self._linked:
+            self._built = False
+
+    def remove(self, keyword: str, payload: T) -> bool:
+        """حذف کلیدواژه با payload مشخص
+
+        stateهای trie و پیوندهای شکست دست نمی‌خورند و فقط خروجی الگو حذف
+        می‌شود؛ output_link به state بی‌خروجی فقط یک گام اضافه در تطبیق است،
+        پس build لازم نیست و افزودن دوباره همان کلید هم state جدیدی نمی‌سازد.
+        """
+        state = 0
+        for char in keyword:
+            state = self._goto[state].get(char)
+            if state is None:
+                return False
+        outputs = self._outputs[state]
+        for index, pattern_id in enumerate(outputs):
+            if self._patterns[pattern_id][3] == payload:
+                del outputs[index]
+                self._patterns[pattern_id] = None
+                self._count -= 1
+                return True
+        return False
+
+    def build(self):
+        """محاسبه پیوندهای شکست با پیمایش سطح به سطح trie"""
+        queue = list(self._goto[0].values())
+        for state in queue:
+            self._fail[state] = 0
+            self._output_link[state] = -1
+        head = 0
+        while head < len(queue):
+            state = queue[head]
+            head += 1
+            for char, child in self._goto[state].items():
+                fallback = self._fail[state]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                target = self._goto[fallback].get(char, 0)
+                self._fail[child] = target if target != child else 0
+                failed = self._fail[child]
+                self._output_link[child] = failed if self._outputs[failed] else self._output_link[failed]
+                queue.append(child)
+        self._linked = {state for state, outputs in enumerate(self._outputs) if outputs}
+        self._built = True
+
+    def _is_valid(self, mode: str, text: str, start: int, end: int) -> bool:
+        if mode == "contains":
+            return True
+        if mode == "exact":
+            return start == 0 and end == len(text)
+        if mode == "prefix":
+            return start == 0
+        # word: کلید باید از هر دو طرف به مرز کلمه برسد
+        if start > 0 and _is_word_char(text[start - 1]):
+            return False
+        return end == len(text) or not _is_word_char(text[end])
+
+    def match_all(self, text: str) -> List[T]:
+        """تمام payloadهای منطبق به ترتیب اولویت، دقت حالت، طول کلید و محل وقوع"""
+        if not self._built:
+            self.build()
+
+        best: Dict[int, Tuple] = {}
+        goto, fail, outputs, output_link = self._goto, self._fail, self._outputs, self._output_link
+        state = 0
+        for index, char in enumerate(text):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+
+            node = state if outputs[state] else output_link[state]
+            while node > 0:
+                for pattern_id in outputs[node]:
+                    if pattern_id in best:
+                        continue
+                    length, mode, priority, _ = self._patterns[pattern_id]
+                    start = index - length + 1
+                    if self._is_valid(mode, text, start, index + 1):
+                        best[pattern_id] = (-priority, _MODE_RANK[mode], -length, start, pattern_id)
+                node = output_link[node]
+
+        return [self._patterns[rank[-1]][3] for rank in sorted(best.values())]
+
+    def match(self, text: str) -> Optional[T]:
+        """بهترین payload منطبق یا None"""
+        matches = self.match_all(text)
+        return matches[0] if matches else None
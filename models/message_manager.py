@@ -1,10 +1,186 @@
+import base64
+import json
 import sqlite3
 import logging
 from datetime import date, datetime
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Tuple
+from .analytics import create_rollup_tables, get_reply_analytics
+from .database import get_connection, transaction
+from .history_writer import get_history_writer
+from .migrations import apply_migrations
+from .keyword_matcher import DEFAULT_MATCH_MODE
+from .reply_table import reply_cache
 
 logger = logging.getLogger(__name__)
 
+# نشانه‌های ابتدا و انتهای بخش منطبق در snippet نتایج جستجو (در قالب به <mark> تبدیل می‌شوند)
+SNIPPET_OPEN = "\x02"
+SNIPPET_CLOSE = "\x03"
+SNIPPET_TOKENS = 12
+SEARCH_LIMIT = 100
+
+# ستون‌های پیام برای ساخت جدول پاسخ؛ created_at ترتیب ردیف‌های هم‌کلید را تعیین می‌کند
+REPLY_COLUMNS = "id, key, content, start_date, end_date, key_type, match_mode, priority, created_at"
+
+# اندازه پیش‌فرض و حداکثر صفحه تاریخچه
+HISTORY_PAGE_SIZE = 50
+HISTORY_MAX_PAGE_SIZE = 200
+
+
+def _migrate_history_indexes(cursor):
+    # ایندکس پوششی برای get_message_history: فیلتر کاربر و مرتب‌سازی بر اساس زمان بدون مراجعه به جدول
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_history_user_sent
+        ON message_history (user_id, sent_at, message_key, thread_id, user_instagram_id)
+    ''')
+    # بارگذاری جدول پاسخ‌های فعال کاربر به ترتیب زمان ایجاد
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_messages_user_active
+        ON messages (user_id, is_active, created_at)
+    ''')
+
+
+def _migrate_match_modes(cursor):
+    # حالت تطبیق و اولویت کلیدهای متنی
+    cursor.execute("ALTER TABLE messages ADD COLUMN match_mode TEXT DEFAULT 'exact'")
+    cursor.execute("ALTER TABLE messages ADD COLUMN priority INTEGER DEFAULT 0")
+    # کلیدهای متنی موجود به صورت کلمه کامل تطبیق داده می‌شوند تا «سلام خوبی؟» هم به «سلام» برسد
+    cursor.execute("UPDATE messages SET match_mode = 'word' WHERE key_type = 'text'")
+
+
+def _migrate_messages_fts(cursor):
+    # ایندکس متن کامل روی کلید و محتوای پیام‌ها (جدول external-content روی messages)
+    try:
+        cursor.execute('''
+            CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(
+                key, content,
+                content='messages', content_rowid='id',
+                tokenize='unicode61 remove_diacritics 2'
+            )
+        ''')
+    except sqlite3.OperationalError as e:
+        logger.warning(f"FTS5 در این نسخه SQLite در دسترس نیست؛ جستجو با LIKE انجام می‌شود: {e}")
+        return
+    # همگام نگه داشتن ایندکس با تریگرها
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS messages_fts_insert AFTER INSERT ON messages BEGIN
+            INSERT INTO messages_fts(rowid, key, content) VALUES (new.id, new.key, new.content);
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS messages_fts_delete AFTER DELETE ON messages BEGIN
+            INSERT INTO messages_fts(messages_fts, rowid, key, content)
+            VALUES ('delete', old.id, old.key, old.content);
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS messages_fts_update AFTER UPDATE OF key, content ON messages BEGIN
+            INSERT INTO messages_fts(messages_fts, rowid, key, content)
+            VALUES ('delete', old.id, old.key, old.content);
+            INSERT INTO messages_fts(rowid, key, content) VALUES (new.id, new.key, new.content);
+        END
+    ''')
+    # ساخت ایندکس برای پیام‌های موجود
+    cursor.execute("INSERT INTO messages_fts(messages_fts) VALUES ('rebuild')")
+
+
+def _migrate_history_keyset(cursor):
+    # حساب ارسال‌کننده برای فیلتر تاریخچه؛ ردیف‌های قدیمی NULL می‌مانند
+    cursor.execute("ALTER TABLE message_history ADD COLUMN account_id INTEGER")
+    # ایندکس‌های صفحه‌بندی keyset: هر فیلتر به ترتیب (sent_at, id) روی ایندکس خودش پیمایش می‌شود
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_history_user_keyset
+        ON message_history (user_id, sent_at, id)
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_history_account_keyset
+        ON message_history (user_id, account_id, sent_at, id)
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_history_thread_keyset
+        ON message_history (user_id, thread_id, sent_at, id)
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_history_key_keyset
+        ON message_history (user_id, message_key, sent_at, id)
+    ''')
+    _drop_history_user_sent(cursor)
+
+
+def _drop_history_user_sent(cursor):
+    # idx_history_user_keyset جای ایندکس migration 1 را می‌گیرد؛ نگه داشتن آن فقط هزینه درج دارد
+    cursor.execute("DROP INDEX IF EXISTS idx_history_user_sent")
+
+
+def _migrate_reply_rollups(cursor):
+    # جدول‌های آمار روزانه؛ تاریخچه موجود با python -m models.backfill_rollups وارد می‌شود
+    create_rollup_tables(cursor)
+
+
+def build_fts_query(search_term: str) -> str:
+    """تبدیل عبارت جستجو به کوئری FTS5؛ هر کلمه به صورت پیشوندی (term*) جستجو می‌شود"""
+    tokens = (search_term or "").split()
+    return " ".join('"' + token.replace('"', '""') + '"*' for token in tokens)
+
+
+def encode_history_cursor(sent_at: str, history_id: int) -> str:
+    """ساخت cursor صفحه بعد از آخرین ردیف صفحه فعلی"""
+    raw = json.dumps([sent_at, history_id], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_history_cursor(cursor: str) -> Tuple[str, int]:
+    """خواندن cursor؛ در صورت نامعتبر بودن ValueError"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        sent_at, history_id = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        return str(sent_at), int(history_id)
+    except Exception:
+        raise ValueError("cursor نامعتبر است")
+
+
+def build_history_page_query(user_id: int, limit: int, cursor: Optional[str] = None,
+                             account_id: Optional[int] = None, thread_id: Optional[str] = None,
+                             message_key: Optional[str] = None) -> Tuple[str, List]:
+    """کوئری keyset یک صفحه تاریخچه و پارامترهای آن (limit + 1 ردیف برای تشخیص صفحه بعد)"""
+    conditions = ["mh.user_id = ?"]
+    params: List = [user_id]
+    if account_id is not None:
+        conditions.append("mh.account_id = ?")
+        params.append(account_id)
+    if thread_id:
+        conditions.append("mh.thread_id = ?")
+        params.append(thread_id)
+    if message_key:
+        conditions.append("mh.message_key = ?")
+        params.append(message_key)
+    if cursor:
+        conditions.append("(mh.sent_at, mh.id) < (?, ?)")
+        params.extend(decode_history_cursor(cursor))
+    # یک ردیف اضافه برای تشخیص وجود صفحه بعد
+    params.append(limit + 1)
+    query = f'''
+        SELECT mh.id, mh.message_key, mh.thread_id, mh.user_instagram_id, mh.sent_at,
+               mh.account_id, m.content, m.key_type
+        FROM message_history mh
+        LEFT JOIN messages m ON mh.message_key = m.key AND mh.user_id = m.user_id
+        WHERE {" AND ".join(conditions)}
+        ORDER BY mh.sent_at DESC, mh.id DESC
+        LIMIT ?
+    '''
+    return query, params
+
+
+MIGRATIONS = [
+    (1, "ایندکس‌های تاریخچه و جدول پاسخ", _migrate_history_indexes),
+    (2, "حالت تطبیق و اولویت کلیدهای متنی", _migrate_match_modes),
+    (3, "ایندکس متن کامل پیام‌ها", _migrate_messages_fts),
+    (4, "حساب ارسال‌کننده و ایندکس‌های صفحه‌بندی تاریخچه", _migrate_history_keyset),
+    (5, "جدول‌های آمار روزانه پاسخ‌ها", _migrate_reply_rollups),
+    (6, "حذف ایندکس بلااستفاده idx_history_user_sent", _drop_history_user_sent),
+]
+
+
 class MessageManager:
     """مدیریت پیام‌های پاسخ"""
     
@@ -14,46 +190,45 @@ class MessageManager:
     
     def init_db(self):
         """ایجاد پایگاه داده برای ذخیره پیام‌ها"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        # ایجاد جدول messages اگر وجود ندارد
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS messages (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER NOT NULL,
-                key TEXT NOT NULL,
-                content TEXT NOT NULL,
-                key_type TEXT DEFAULT 'number',  -- اضافه کردن فیلد نوع کلید
-                start_date DATE,
-                end_date DATE,
-                is_active BOOLEAN DEFAULT TRUE,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                UNIQUE(user_id, key)  -- اطمینان از یکتایی کلید برای هر کاربر
-            )
-        ''')
-        
-        # ایجاد جدول message_history اگر وجود ندارد
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS message_history (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER NOT NULL,
-                message_key TEXT NOT NULL,
-                thread_id TEXT NOT NULL,
-                user_instagram_id TEXT NOT NULL,
-                sent_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        
-        # اضافه کردن فیلد key_type اگر وجود ندارد
-        try:
-            cursor.execute("ALTER TABLE messages ADD COLUMN key_type TEXT DEFAULT 'number'")
-        except sqlite3.OperationalError:
-            # فیلد قبلاً اضافه شده است
-            pass
+        with transaction(self.db_path) as conn:
+            cursor = conn.cursor()
+            
+            # ایجاد جدول messages اگر وجود ندارد
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS messages (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    user_id INTEGER NOT NULL,
+                    key TEXT NOT NULL,
+                    content TEXT NOT NULL,
+                    key_type TEXT DEFAULT 'number',  -- اضافه کردن فیلد نوع کلید
+                    start_date DATE,
+                    end_date DATE,
+                    is_active BOOLEAN DEFAULT TRUE,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    UNIQUE(user_id, key)  -- اطمینان از یکتایی کلید برای هر کاربر
+                )
+            ''')
+            
+            # ایجاد جدول message_history اگر وجود ندارد
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS message_history (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    user_id INTEGER NOT NULL,
+                    message_key TEXT NOT NULL,
+                    thread_id TEXT NOT NULL,
+                    user_instagram_id TEXT NOT NULL,
+                    sent_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+            
+            # اضافه کردن فیلد key_type اگر وجود ندارد
+            try:
+                cursor.execute("ALTER TABLE messages ADD COLUMN key_type TEXT DEFAULT 'number'")
+            except sqlite3.OperationalError:
+                # فیلد قبلاً اضافه شده است
+                pass
         
-        conn.commit()
-        conn.close()
+        apply_migrations(self.db_path, MIGRATIONS)
     
     def add_default_messages(self, user_id: int):
         """افزودن پیام‌های پیش‌فرض برای کاربر"""
@@ -88,53 +263,90 @@ class MessageManager:
             }
         }
         
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        for key, data in default_messages.items():
-            cursor.execute(
-                "SELECT id FROM messages WHERE user_id = ? AND key = ?", 
-                (user_id, key)
-            )
-            if not cursor.fetchone():
+        with transaction(self.db_path) as conn:
+            cursor = conn.cursor()
+            
+            for key, data in default_messages.items():
                 cursor.execute(
-                    "INSERT INTO messages (user_id, key, content, key_type) VALUES (?, ?, ?, ?)",
-                    (user_id, key, data["content"], data["type"])
+                    "SELECT id FROM messages WHERE user_id = ? AND key = ?", 
+                    (user_id, key)
                 )
-        
-        conn.commit()
-        conn.close()
+                if not cursor.fetchone():
+                    cursor.execute(
+                        "INSERT INTO messages (user_id, key, content, key_type, match_mode) VALUES (?, ?, ?, ?, ?)",
+                        (user_id, key, data["content"], data["type"],
+                         "word" if data["type"] == "text" else DEFAULT_MATCH_MODE)
+                    )
+        self.invalidate_replies(user_id)
     
     def get_message(self, user_id: int, key: str) -> str:
-        """دریافت پیام بر اساس کلید و تاریخ - فقط کلیدهای دقیق"""
-        today = date.today()
+        """دریافت پیام بر اساس کلید و تاریخ
 
-        conn = sqlite3.connect(self.db_path)
+        کلیدهای عددی فقط با برابری کامل و کلیدهای متنی بر اساس حالت تطبیق‌شان پیدا می‌شوند.
+        """
+        table = reply_cache.get_table(
+            self.db_path, user_id, lambda: self._load_reply_rows(user_id)
+        )
+        return table.lookup(key)
+    
+    def get_reply(self, user_id: int, key: str) -> Optional[Tuple[int, int, str]]:
+        """دریافت (شناسه پیام، نسخه پاسخ‌های کاربر، متن) برای کامپایل و کش قالب پاسخ"""
+        table = reply_cache.get_table(
+            self.db_path, user_id, lambda: self._load_reply_rows(user_id)
+        )
+        reply = table.lookup_reply(key)
+        if reply is None:
+            return None
+        message_id, content = reply
+        return message_id, table.version, content
+    
+    def _load_reply_rows(self, user_id: int) -> List[tuple]:
+        """بارگذاری پیام‌های فعال کاربر برای ساخت جدول پاسخ"""
+        conn = get_connection(self.db_path)
         cursor = conn.cursor()
-
-        # فقط کلیدهای دقیق را جستجو کنیم
-        cursor.execute('''
-            SELECT content FROM messages 
-            WHERE user_id = ? AND key = ? AND is_active = TRUE
-            AND (start_date IS NULL OR start_date <= ?)
-            AND (end_date IS NULL OR end_date >= ?)
-            ORDER BY created_at DESC
-            LIMIT 1
-        ''', (user_id, key, today, today))
-
-        result = cursor.fetchone()
-        conn.close()
-
-        if result:
-            return result[0]
+        
+        cursor.execute(f'''
+            SELECT {REPLY_COLUMNS}
+            FROM messages 
+            WHERE user_id = ? AND is_active = TRUE
+            ORDER BY created_at DESC, id DESC
+        ''', (user_id,))
+        
+        rows = cursor.fetchall()
+        return rows
+    
+    def _load_reply_row(self, user_id: int, message_id: int) -> Optional[tuple]:
+        """بارگذاری یک پیام فعال برای اعمال تغییرش روی جدول پاسخ"""
+        conn = get_connection(self.db_path)
+        cursor = conn.cursor()
+        
+        cursor.execute(f'''
+            SELECT {REPLY_COLUMNS}
+            FROM messages 
+            WHERE id = ? AND user_id = ? AND is_active = TRUE
+        ''', (message_id, user_id))
+        
+        return cursor.fetchone()
+    
+    def invalidate_replies(self, user_id: int):
+        """باطل کردن جدول پاسخ کش‌شده کاربر"""
+        reply_cache.invalidate(self.db_path, user_id)
+    
+    def refresh_reply(self, user_id: int, message_id: int, notify: bool = True):
+        """اعمال تغییر یک پیام روی جدول پاسخ کش‌شده بدون ساخت دوباره کل جدول"""
+        reply_cache.apply(
+            self.db_path, user_id, message_id,
+            lambda: self._load_reply_row(user_id, message_id), notify=notify
+        )
     
     def get_all_messages(self, user_id: int) -> List[Dict]:
         """دریافت تمام پیام‌های کاربر"""
-        conn = sqlite3.connect(self.db_path)
+        conn = get_connection(self.db_path)
         cursor = conn.cursor()
         
         cursor.execute('''
-            SELECT id, key, content, key_type, start_date, end_date, is_active, created_at 
+            SELECT id, key, content, key_type, start_date, end_date, is_active, created_at,
+                   match_mode, priority
             FROM messages 
             WHERE user_id = ?
             ORDER BY key_type, key
@@ -150,30 +362,33 @@ class MessageManager:
                 "start_date": row[4],
                 "end_date": row[5],
                 "is_active": bool(row[6]),
-                "created_at": row[7]
+                "created_at": row[7],
+                "match_mode": row[8] or DEFAULT_MATCH_MODE,
+                "priority": row[9] or 0
             })
         
-        conn.close()
         return messages
     
     def update_message(self, message_id: int, user_id: int, key: str, content: str, 
                       key_type: str = "number",
                       start_date: Optional[str] = None, 
                       end_date: Optional[str] = None,
-                      is_active: bool = True) -> bool:
+                      is_active: bool = True,
+                      match_mode: str = DEFAULT_MATCH_MODE,
+                      priority: int = 0) -> bool:
         """به‌روزرسانی پیام"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            cursor.execute('''
-                UPDATE messages 
-                SET key = ?, content = ?, key_type = ?, start_date = ?, end_date = ?, is_active = ?
-                WHERE id = ? AND user_id = ?
-            ''', (key, content, key_type, start_date, end_date, is_active, message_id, user_id))
-            
-            conn.commit()
-            conn.close()
+            with transaction(self.db_path) as conn:
+                cursor = conn.cursor()
+                
+                cursor.execute('''
+                    UPDATE messages 
+                    SET key = ?, content = ?, key_type = ?, start_date = ?, end_date = ?, is_active = ?,
+                        match_mode = ?, priority = ?
+                    WHERE id = ? AND user_id = ?
+                ''', (key, content, key_type, start_date, end_date, is_active,
+                      match_mode, priority, message_id, user_id))
+            self.refresh_reply(user_id, message_id)
             return cursor.rowcount > 0
         except sqlite3.IntegrityError:
             logger.error(f"کلید '{key}' از قبل برای این کاربر وجود دارد")
@@ -185,19 +400,20 @@ class MessageManager:
     def add_message(self, user_id: int, key: str, content: str, 
                    key_type: str = "number",
                    start_date: Optional[str] = None, 
-                   end_date: Optional[str] = None) -> bool:
+                   end_date: Optional[str] = None,
+                   match_mode: str = DEFAULT_MATCH_MODE,
+                   priority: int = 0) -> bool:
         """افزودن پیام جدید"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            cursor.execute('''
-                INSERT INTO messages (user_id, key, content, key_type, start_date, end_date)
-                VALUES (?, ?, ?, ?, ?, ?)
-            ''', (user_id, key, content, key_type, start_date, end_date))
-            
-            conn.commit()
-            conn.close()
+            with transaction(self.db_path) as conn:
+                cursor = conn.cursor()
+                
+                cursor.execute('''
+                    INSERT INTO messages (user_id, key, content, key_type, start_date, end_date,
+                                          match_mode, priority)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ''', (user_id, key, content, key_type, start_date, end_date, match_mode, priority))
+            self.refresh_reply(user_id, cursor.lastrowid)
             return True
         except sqlite3.IntegrityError:
             logger.error(f"کلید '{key}' از قبل برای این کاربر وجود دارد")
@@ -209,74 +425,153 @@ class MessageManager:
     def delete_message(self, message_id: int, user_id: int) -> bool:
         """حذف پیام"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            cursor.execute(
-                "DELETE FROM messages WHERE id = ? AND user_id = ?",
-                (message_id, user_id)
-            )
-            
-            conn.commit()
-            conn.close()
+            with transaction(self.db_path) as conn:
+                cursor = conn.cursor()
+                
+                cursor.execute(
+                    "DELETE FROM messages WHERE id = ? AND user_id = ?",
+                    (message_id, user_id)
+                )
+            self.refresh_reply(user_id, message_id)
             return cursor.rowcount > 0
         except Exception as e:
             logger.error(f"خطا در حذف پیام: {e}")
             return False
     
-    def log_message_sent(self, user_id: int, message_key: str, thread_id: str, user_instagram_id: str):
-        """ثبت تاریخچه ارسال پیام"""
+    def log_message_sent(self, user_id: int, message_key: str, thread_id: str, user_instagram_id: str,
+                         account_id: Optional[int] = None):
+        """ثبت تاریخچه ارسال پیام
+        
+        ردیف در صف نویسنده پس‌زمینه قرار می‌گیرد و همراه ردیف‌های دیگر در یک تراکنش نوشته می‌شود.
+        """
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            cursor.execute('''
-                INSERT INTO message_history (user_id, message_key, thread_id, user_instagram_id)
-                VALUES (?, ?, ?, ?)
-            ''', (user_id, message_key, thread_id, user_instagram_id))
-            
-            conn.commit()
-            conn.close()
+            get_history_writer(self.db_path).enqueue(
+                user_id, message_key, thread_id, user_instagram_id, account_id
+            )
         except Exception as e:
             logger.error(f"خطا در ثبت تاریخچه پیام: {e}")
     
+    def flush_history(self, timeout: float = 5.0) -> bool:
+        """نوشتن فوری تاریخچه‌های در صف"""
+        try:
+            return get_history_writer(self.db_path).flush(timeout)
+        except Exception as e:
+            logger.error(f"خطا در نوشتن صف تاریخچه: {e}")
+            return False
+    
+    def history_writer_stats(self) -> Dict:
+        """آمار صف نوشتن تاریخچه"""
+        return get_history_writer(self.db_path).stats()
+    
+    def get_reply_analytics(self, user_id: int, days: int = 30,
+                            account_id: Optional[int] = None) -> Dict:
+        """آمار روزانه پاسخ‌ها و پرکاربردترین کلیدها از جدول‌های rollup"""
+        try:
+            return get_reply_analytics(self.db_path, user_id, days, account_id)
+        except Exception as e:
+            logger.error(f"خطا در دریافت آمار پاسخ‌ها: {e}")
+            return {"daily": [], "keys": []}
+    
     def get_message_history(self, user_id: int, limit: int = 50) -> List[Dict]:
-        """دریافت تاریخچه پیام‌های ارسال شده"""
+        """دریافت تاریخچه پیام‌های ارسال شده (جدیدترین‌ها)"""
+        try:
+            return self.get_message_history_page(user_id, limit)["items"]
+        except Exception as e:
+            logger.error(f"خطا در دریافت تاریخچه پیام: {e}")
+            return []
+    
+    def get_message_history_page(self, user_id: int, limit: int = HISTORY_PAGE_SIZE,
+                                 cursor: Optional[str] = None,
+                                 account_id: Optional[int] = None,
+                                 thread_id: Optional[str] = None,
+                                 message_key: Optional[str] = None) -> Dict:
+        """یک صفحه از تاریخچه با صفحه‌بندی keyset روی (sent_at, id)
+
+        cursor مقدار next_cursor صفحه قبلی است؛ هزینه هر صفحه مستقل از عمق آن
+        است چون کوئری مستقیماً از ایندکس از همان نقطه ادامه می‌دهد.
+        در صورت cursor نامعتبر ValueError ایجاد می‌شود.
+        """
+        limit = max(1, min(int(limit), HISTORY_MAX_PAGE_SIZE))
+        query, params = build_history_page_query(user_id, limit, cursor, account_id, thread_id, message_key)
+        
+        conn = get_connection(self.db_path)
+        rows = conn.execute(query, params).fetchall()
+        
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        history = []
+        for row in rows:
+            history.append({
+                "id": row[0],
+                "message_key": row[1],
+                "thread_id": row[2],
+                "user_instagram_id": row[3],
+                "sent_at": row[4],
+                "account_id": row[5],
+                "content_preview": row[6][:100] + "..." if row[6] and len(row[6]) > 100 else row[6] if row[6] else "",
+                "key_type": row[7] or "unknown"
+            })
+        
+        next_cursor = encode_history_cursor(rows[-1][4], rows[-1][0]) if has_more else None
+        return {"items": history, "next_cursor": next_cursor}
+    
+    def search_messages(self, user_id: int, search_term: str, key_type: Optional[str] = None,
+                        limit: int = SEARCH_LIMIT) -> List[Dict]:
+        """جستجو در پیام‌های کاربر
+
+        از ایندکس FTS5 با رتبه‌بندی bm25 و جستجوی پیشوندی استفاده می‌شود؛ هر
+        نتیجه یک snippet دارد که بخش‌های منطبق آن بین SNIPPET_OPEN و
+        SNIPPET_CLOSE قرار گرفته‌اند. اگر FTS5 در دسترس نباشد به LIKE برمی‌گردد.
+        """
+        query = build_fts_query(search_term)
+        if not query:
+            return []
         try:
-            conn = sqlite3.connect(self.db_path)
+            conn = get_connection(self.db_path)
             cursor = conn.cursor()
             
-            cursor.execute('''
-                SELECT mh.id, mh.message_key, mh.thread_id, mh.user_instagram_id, mh.sent_at, m.content, m.key_type
-                FROM message_history mh
-                LEFT JOIN messages m ON mh.message_key = m.key AND mh.user_id = m.user_id
-                WHERE mh.user_id = ?
-                ORDER BY mh.sent_at DESC
+            params = [SNIPPET_OPEN, SNIPPET_CLOSE, query, user_id]
+            type_filter = ""
+            if key_type:
+                type_filter = "AND m.key_type = ?"
+                params.append(key_type)
+            params.append(limit)
+            
+            # وزن کلید بیشتر از محتواست تا پیامی که کلیدش منطبق است بالاتر بیاید
+            cursor.execute(f'''
+                SELECT m.id, m.key, m.content, m.key_type, m.is_active,
+                       snippet(messages_fts, 1, ?, ?, '…', {SNIPPET_TOKENS})
+                FROM messages_fts
+                JOIN messages m ON m.id = messages_fts.rowid
+                WHERE messages_fts MATCH ? AND m.user_id = ? {type_filter}
+                ORDER BY bm25(messages_fts, 5.0, 1.0)
                 LIMIT ?
-            ''', (user_id, limit))
+            ''', params)
             
-            history = []
+            results = []
             for row in cursor.fetchall():
-                history.append({
+                results.append({
                     "id": row[0],
-                    "message_key": row[1],
-                    "thread_id": row[2],
-                    "user_instagram_id": row[3],
-                    "sent_at": row[4],
-                    "content_preview": row[5][:100] + "..." if row[5] and len(row[5]) > 100 else row[5] if row[5] else "",
-                    "key_type": row[6] or "unknown"
+                    "key": row[1],
+                    "content": row[2],
+                    "key_type": row[3],
+                    "is_active": bool(row[4]),
+                    "snippet": row[5]
                 })
             
-            conn.close()
-            return history
+            return results
+        except sqlite3.OperationalError as e:
+            logger.warning(f"جستجوی FTS ممکن نشد، استفاده از LIKE: {e}")
+            return self._search_messages_like(user_id, search_term, key_type, limit)
         except Exception as e:
-            logger.error(f"خطا در دریافت تاریخچه پیام: {e}")
+            logger.error(f"خطا در جستجوی پیام‌ها: {e}")
             return []
     
-    def search_messages(self, user_id: int, search_term: str, key_type: Optional[str] = None) -> List[Dict]:
-        """جستجو در پیام‌های کاربر"""
+    def _search_messages_like(self, user_id: int, search_term: str, key_type: Optional[str],
+                              limit: int) -> List[Dict]:
+        """جستجوی ساده با LIKE برای وقتی که ایندکس FTS5 وجود ندارد"""
         try:
-            conn = sqlite3.connect(self.db_path)
+            conn = get_connection(self.db_path)
             cursor = conn.cursor()
             
             if key_type:
@@ -286,7 +581,8 @@ class MessageManager:
                     WHERE user_id = ? AND key_type = ? 
                     AND (key LIKE ? OR content LIKE ?)
                     ORDER BY key
-                ''', (user_id, key_type, f'%{search_term}%', f'%{search_term}%'))
+                    LIMIT ?
+                ''', (user_id, key_type, f'%{search_term}%', f'%{search_term}%', limit))
             else:
                 cursor.execute('''
                     SELECT id, key, content, key_type, is_active 
@@ -294,7 +590,8 @@ class MessageManager:
                     WHERE user_id = ? 
                     AND (key LIKE ? OR content LIKE ?)
                     ORDER BY key_type, key
-                ''', (user_id, f'%{search_term}%', f'%{search_term}%'))
+                    LIMIT ?
+                ''', (user_id, f'%{search_term}%', f'%{search_term}%', limit))
             
             results = []
             for row in cursor.fetchall():
@@ -303,10 +600,10 @@ class MessageManager:
                     "key": row[1],
                     "content": row[2],
                     "key_type": row[3],
-                    "is_active": bool(row[4])
+                    "is_active": bool(row[4]),
+                    "snippet": row[2][:SNIPPET_TOKENS * 8]
                 })
             
-            conn.close()
             return results
         except Exception as e:
             logger.error(f"خطا در جستجوی پیام‌ها: {e}")
@@ -315,17 +612,17 @@ class MessageManager:
     def get_message_by_id(self, message_id: int, user_id: int) -> Optional[Dict]:
         """دریافت پیام بر اساس ID"""
         try:
-            conn = sqlite3.connect(self.db_path)
+            conn = get_connection(self.db_path)
             cursor = conn.cursor()
             
             cursor.execute('''
-                SELECT id, key, content, key_type, start_date, end_date, is_active, created_at 
+                SELECT id, key, content, key_type, start_date, end_date, is_active, created_at,
+                       match_mode, priority
                 FROM messages 
                 WHERE id = ? AND user_id = ?
             ''', (message_id, user_id))
             
             row = cursor.fetchone()
-            conn.close()
             
             if row:
                 return {
@@ -336,7 +633,9 @@ class MessageManager:
                     "start_date": row[4],
                     "end_date": row[5],
                     "is_active": bool(row[6]),
-                    "created_at": row[7]
+                    "created_at": row[7],
+                    "match_mode": row[8] or DEFAULT_MATCH_MODE,
+                    "priority": row[9] or 0
                 }
             return None
         except Exception as e:
@@ -0,0 +1,38 @@
+import logging
+from typing import Callable, List, Tuple
+
+from .database import transaction
+
+logger = logging.getLogger(__name__)
+
+# هر migration شامل شماره نسخه، توضیح و تابعی است که روی cursor اجرا می‌شود
+Migration = Tuple[int, str, Callable]
+
+
+def get_schema_version(conn) -> int:
+    """خواندن نسخه schema از PRAGMA user_version"""
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def apply_migrations(db_path: str, migrations: List[Migration]) -> int:
+    """اجرای migration‌های اعمال‌نشده به ترتیب نسخه
+
+    هر migration در تراکنش خودش اجرا می‌شود و user_version دیتابیس در همان
+    تراکنش به‌روز می‌شود، پس اجرای دوباره init_db هیچ کاری انجام نمی‌دهد.
+    sqlite3 پیش از دستورات DDL خودش تراکنشی باز نمی‌کند، پس BEGIN صریح لازم
+    است تا migration نیمه‌کاره (مثلاً ALTER اول بدون دومی) باقی نماند.
+    """
+    with transaction(db_path) as conn:
+        current = get_schema_version(conn)
+
+    for version, description, migrate in sorted(migrations, key=lambda m: m[0]):
+        if version <= current:
+            continue
+        logger.info(f"اجرای migration {version} روی {db_path}: {description}")
+        with transaction(db_path) as conn:
+            conn.execute("BEGIN")
+            migrate(conn.cursor())
+            conn.execute(f"PRAGMA user_version = {int(version)}")
+        current = version
+
+    return current
@@ -0,0 +1,281 @@
+import hashlib
+import json
+import logging
+import os
+import time
+from typing import Dict, List, Optional, Tuple
+from .database import get_connection, transaction
+from .watermark_manager import WatermarkManager, write_watermark
+
+logger = logging.getLogger(__name__)
+
+# وضعیت‌های پیام در صف ارسال
+OUTBOUND_PENDING = "pending"
+OUTBOUND_SENDING = "sending"
+OUTBOUND_SENT = "sent"
+OUTBOUND_FAILED = "failed"
+OUTBOUND_STATES = (OUTBOUND_PENDING, OUTBOUND_SENDING, OUTBOUND_SENT, OUTBOUND_FAILED)
+
+# تلاش مجدد با فاصله نمایی: RETRY_BASE_SECONDS * 2^(تلاش-1) تا سقف RETRY_MAX_SECONDS
+OUTBOUND_MAX_ATTEMPTS = int(os.environ.get('BOT_OUTBOUND_MAX_ATTEMPTS', '6'))
+RETRY_BASE_SECONDS = 30
+RETRY_MAX_SECONDS = 3600
+
+# ردیف‌های ارسال‌شده تا این مدت برای جلوگیری از پاسخ تکراری نگه داشته می‌شوند
+SENT_RETENTION_SECONDS = 7 * 86400
+
+
+def make_idempotency_key(account_id: int, thread_id: str, item_id: str) -> str:
+    """کلید یکتای پاسخ به پیام‌های یک thread تا پیام item_id"""
+    raw = f"{account_id}:{thread_id}:{item_id}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def retry_delay(attempts: int) -> float:
+    return min(RETRY_BASE_SECONDS * (2 ** max(attempts - 1, 0)), RETRY_MAX_SECONDS)
+
+
+class OutboundQueueManager:
+    """صف پایدار پاسخ‌های در انتظار ارسال
+
+    هر ردیف پاسخ‌های یک thread تا یک پیام مشخص است و با کلید یکتا
+    (حساب، thread، پیام) ثبت می‌شود، پس بررسی دوباره همان پیام‌ها ردیف
+    تکراری نمی‌سازد. ردیف‌هایی که هنگام crash در وضعیت sending مانده‌اند
+    با recover به pending برمی‌گردند و uncertain علامت می‌خورند تا پیش از
+    ارسال دوباره، تحویل قبلی آن‌ها بررسی شود.
+    """
+
+    def __init__(self, db_path="bot_status.db"):
+        self.db_path = db_path
+        self.init_db()
+
+    def init_db(self):
+        """ایجاد جدول صف ارسال (جدول watermark‌ها هم در همین دیتابیس ساخته می‌شود)"""
+        WatermarkManager(self.db_path)
+        with transaction(self.db_path) as conn:
+            cursor = conn.cursor()
+
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS outbound_messages (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    account_id INTEGER NOT NULL,
+                    thread_id TEXT NOT NULL,
+                    recipient_id TEXT,
+                    idempotency_key TEXT NOT NULL UNIQUE,
+                    replies TEXT NOT NULL,
+                    state TEXT NOT NULL DEFAULT 'pending',
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    sent_parts INTEGER NOT NULL DEFAULT 0,
+                    uncertain INTEGER NOT NULL DEFAULT 0,
+                    received_at REAL NOT NULL,
+                    next_attempt_at REAL NOT NULL,
+                    last_error TEXT,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+            ''')
+            # ردیف‌های سررسیده هر حساب به ترتیب قدیمی‌ترین پیام مشتری
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_outbound_due
+                ON outbound_messages(account_id, state, next_attempt_at)
+            ''')
+
+    def _row_to_dict(self, row) -> Dict:
+        return {
+            "id": row[0],
+            "account_id": row[1],
+            "thread_id": row[2],
+            "recipient_id": row[3],
+            "replies": [tuple(reply) for reply in json.loads(row[4])],
+            "state": row[5],
+            "attempts": row[6],
+            "sent_parts": row[7],
+            "uncertain": bool(row[8]),
+            "received_at": row[9],
+            "next_attempt_at": row[10],
+            "last_error": row[11],
+        }
+
+    _COLUMNS = '''id, account_id, thread_id, recipient_id, replies, state, attempts,
+                  sent_parts, uncertain, received_at, next_attempt_at, last_error'''
+
+    def enqueue(self, account_id: int, thread_id: str, recipient_id: str, item_id: str,
+                replies: List[Tuple[str, str]], received_at: float,
+                watermark: Optional[Tuple[str, float]] = None) -> Optional[int]:
+        """ثبت پاسخ‌های یک thread؛ برای کلید تکراری شناسه ردیف موجود برگردانده می‌شود
+
+        watermark (شناسه و زمان جدیدترین پیام) در همان تراکنش جلو می‌رود، پس
+        crash یا خطا بین ثبت پاسخ و watermark ممکن نیست و پیام‌های پاسخ‌داده‌شده
+        با کلید تازه دوباره جمع نمی‌شوند.
+        """
+        key = make_idempotency_key(account_id, thread_id, item_id)
+        now = time.time()
+        try:
+            with transaction(self.db_path) as conn:
+                cursor = conn.cursor()
+
+                cursor.execute('''
+                    INSERT OR IGNORE INTO outbound_messages
+                        (account_id, thread_id, recipient_id, idempotency_key, replies,
+                         received_at, next_attempt_at, created_at, updated_at)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ''', (account_id, thread_id, str(recipient_id), key,
+                      json.dumps(replies, ensure_ascii=False), received_at, now, now, now))
+                if cursor.rowcount:
+                    outbound_id = cursor.lastrowid
+                else:
+                    cursor.execute("SELECT id FROM outbound_messages WHERE idempotency_key = ?", (key,))
+                    row = cursor.fetchone()
+                    outbound_id = row[0] if row else None
+
+                if outbound_id is not None and watermark is not None:
+                    write_watermark(cursor, account_id, thread_id, watermark[0], watermark[1])
+                return outbound_id
+        except Exception as e:
+            logger.error(f"خطا در ثبت پاسخ در صف ارسال: {e}")
+            return None
+
+    def claim(self, outbound_id: int) -> Optional[Dict]:
+        """گرفتن ردیف سررسیده برای ارسال (pending → sending)؛ در غیر این صورت None"""
+        now = time.time()
+        try:
+            with transaction(self.db_path) as conn:
+                cursor = conn.cursor()
+
+                cursor.execute('''
+                    UPDATE outbound_messages
+                    SET state = 'sending', updated_at = ?
+                    WHERE id = ? AND state = 'pending' AND next_attempt_at <= ?
+                ''', (now, outbound_id, now))
+                if not cursor.rowcount:
+                    return None
+
+                cursor.execute(f"SELECT {self._COLUMNS} FROM outbound_messages WHERE id = ?", (outbound_id,))
+                row = cursor.fetchone()
+                return self._row_to_dict(row) if row else None
+        except Exception as e:
+            logger.error(f"خطا در گرفتن پیام از صف ارسال: {e}")
+            return None
+
+    def record_progress(self, outbound_id: int, sent_parts: int):
+        """ثبت تعداد بخش‌های ارسال‌شده تا تلاش مجدد از همان‌جا ادامه پیدا کند"""
+        with transaction(self.db_path) as conn:
+            conn.execute('''
+                UPDATE outbound_messages SET sent_parts = ?, uncertain = 0, updated_at = ?
+                WHERE id = ?
+            ''', (sent_parts, time.time(), outbound_id))
+
+    def mark_sent(self, outbound_id: int):
+        with transaction(self.db_path) as conn:
+            conn.execute('''
+                UPDATE outbound_messages
+                SET state = 'sent', uncertain = 0, last_error = NULL, updated_at = ?
+                WHERE id = ?
+            ''', (time.time(), outbound_id))
+
+    def defer(self, outbound_id: int):
+        """برگرداندن ردیف در حال ارسال به pending بدون شمردن تلاش تا ادامه آن دوباره claim شود"""
+        now = time.time()
+        with transaction(self.db_path) as conn:
+            conn.execute('''
+                UPDATE outbound_messages SET state = 'pending', next_attempt_at = ?, updated_at = ?
+                WHERE id = ? AND state = 'sending'
+            ''', (now, now, outbound_id))
+
+    def mark_retry(self, outbound_id: int, error: str) -> str:
+        """ثبت خطای ارسال و زمان‌بندی تلاش بعدی؛ پس از آخرین تلاش وضعیت failed می‌شود
+
+        ممکن است پیام پیش از خطا به اینستاگرام رسیده باشد، پس ردیف uncertain
+        علامت می‌خورد.
+        """
+        now = time.time()
+        with transaction(self.db_path) as conn:
+            cursor = conn.cursor()
+
+            cursor.execute("SELECT attempts FROM outbound_messages WHERE id = ?", (outbound_id,))
+            row = cursor.fetchone()
+            attempts = (row[0] if row else 0) + 1
+            state = OUTBOUND_FAILED if attempts >= OUTBOUND_MAX_ATTEMPTS else OUTBOUND_PENDING
+
+            cursor.execute('''
+                UPDATE outbound_messages
+                SET state = ?, attempts = ?, uncertain = 1, last_error = ?,
+                    next_attempt_at = ?, updated_at = ?
+                WHERE id = ?
+            ''', (state, attempts, error[:500], now + retry_delay(attempts), now, outbound_id))
+        return state
+
+    def release(self, outbound_id: int):
+        """برگرداندن ردیف به pending بدون شمردن تلاش (مثلاً هنگام توقف ربات)"""
+        with transaction(self.db_path) as conn:
+            conn.execute('''
+                UPDATE outbound_messages SET state = 'pending', uncertain = 1, updated_at = ?
+                WHERE id = ? AND state = 'sending'
+            ''', (time.time(), outbound_id))
+
+    def recover(self, account_id: int) -> int:
+        """بازگرداندن ارسال‌های نیمه‌تمام حساب پس از راه‌اندازی و حذف ردیف‌های قدیمی ارسال‌شده"""
+        now = time.time()
+        try:
+            with transaction(self.db_path) as conn:
+                cursor = conn.cursor()
+
+                cursor.execute('''
+                    UPDATE outbound_messages
+                    SET state = 'pending', uncertain = 1, next_attempt_at = ?, updated_at = ?
+                    WHERE account_id = ? AND state = 'sending'
+                ''', (now, now, account_id))
+                recovered = cursor.rowcount
+
+                cursor.execute('''
+                    DELETE FROM outbound_messages
+                    WHERE account_id = ? AND state = 'sent' AND updated_at < ?
+                ''', (account_id, now - SENT_RETENTION_SECONDS))
+            if recovered:
+                logger.info(f"{recovered} ارسال نیمه‌تمام برای حساب {account_id} بازیابی شد")
+            return recovered
+        except Exception as e:
+            logger.error(f"خطا در بازیابی صف ارسال: {e}")
+            return 0
+
+    def get_due(self, account_id: int, limit: int = 100) -> List[Dict]:
+        """ردیف‌های pending سررسیده حساب به ترتیب قدیمی‌ترین پیام مشتری"""
+        try:
+            conn = get_connection(self.db_path)
+            cursor = conn.cursor()
+
+            cursor.execute(f'''
+                SELECT {self._COLUMNS}
+                FROM outbound_messages
+                WHERE account_id = ? AND state = 'pending' AND next_attempt_at <= ?
+                ORDER BY received_at
+                LIMIT ?
+            ''', (account_id, time.time(), limit))
+
+            return [self._row_to_dict(row) for row in cursor.fetchall()]
+        except Exception as e:
+            logger.error(f"خطا در دریافت صف ارسال: {e}")
+            return []
+
+    def count_by_state(self) -> Dict[str, int]:
+        """تعداد ردیف‌های صف به تفکیک وضعیت"""
+        counts = {state: 0 for state in OUTBOUND_STATES}
+        try:
+            conn = get_connection(self.db_path)
+            cursor = conn.cursor()
+
+            cursor.execute("SELECT state, COUNT(*) FROM outbound_messages GROUP BY state")
+            counts.update(dict(cursor.fetchall()))
+        except Exception as e:
+            logger.error(f"خطا در شمارش صف ارسال: {e}")
+        return counts
+
+    def delete_account_messages(self, account_id: int) -> bool:
+        """حذف صف ارسال یک حساب"""
+        try:
+            with transaction(self.db_path) as conn:
+                conn.execute("DELETE FROM outbound_messages WHERE account_id = ?", (account_id,))
+            return True
+        except Exception as e:
+            logger.error(f"خطا در حذف صف ارسال: {e}")
+            return False
@@ -0,0 +1,224 @@
+import threading
+from datetime import date
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from .keyword_matcher import DEFAULT_MATCH_MODE, KeywordMatcher
+
+# یکسان‌سازی حروف عربی و فارسی تا «علي» و «علی» یک کلید حساب شوند
+_CHAR_MAP = str.maketrans({
+    'ي': 'ی',
+    'ى': 'ی',
+    'ك': 'ک',
+    '‌': ' ',  # نیم‌فاصله
+})
+
+
+def normalize_key(text: str) -> str:
+    """نرمال‌سازی کلید پیام برای جستجوی دیکشنری"""
+    if not text:
+        return ""
+    return ' '.join(text.translate(_CHAR_MAP).split()).lower()
+
+
+class ReplyTable:
+    """جدول پاسخ‌های یک کاربر که یک بار از دیتابیس ساخته می‌شود
+
+    ردیف‌ها بر اساس کلید نرمال‌شده hash می‌شوند و بازه تاریخ هر پاسخ برای
+    روز جاری از قبل حل می‌شود تا جستجو فقط یک دسترسی به دیکشنری باشد.
+    کلیدهای متنی علاوه بر آن در یک KeywordMatcher کامپایل می‌شوند تا پیامی
+    که کلید را در خود دارد (مثلاً «سلام خوبی؟») هم پاسخ بگیرد.
+
+    افزودن، ویرایش یا حذف یک پیام با apply فقط کلیدهای همان پیام را در
+    دیکشنری و matcher عوض می‌کند؛ پیوندهای شکست در اولین تطبیق بعدی
+    دوباره محاسبه می‌شوند.
+    """
+
+    def __init__(self, version: int, rows: Iterable[Tuple]):
+        self.version = version
+        self._lock = threading.Lock()
+        # key -> [(start_date, end_date, message_id, content)] به ترتیب جدیدترین
+        self.entries: Dict[str, List[Tuple[Optional[str], Optional[str], int, str]]] = {}
+        self.matcher: KeywordMatcher[str] = KeywordMatcher()
+        # key -> ردیف‌های دیتابیس به ترتیب جدیدترین، و message_id -> key
+        self._rows: Dict[str, List[Tuple]] = {}
+        self._keys: Dict[int, str] = {}
+        self._resolved_day: Optional[str] = None
+        self._resolved: Dict[str, Tuple[int, str]] = {}
+        for row in rows:
+            normalized = normalize_key(row[1])
+            self._rows.setdefault(normalized, []).append(row)
+            self._keys[row[0]] = normalized
+        for normalized in self._rows:
+            self._refresh_key(normalized, compiled=False)
+        self.matcher.build()
+
+    def _refresh_key(self, normalized: str, compiled: bool = True):
+        """ساخت دوباره ورودی دیکشنری و الگوی matcher یک کلید از ردیف‌هایش"""
+        if compiled and normalized in self.entries:
+            self.matcher.remove(normalized, normalized)
+        rows = self._rows.get(normalized)
+        if not rows:
+            self._rows.pop(normalized, None)
+            self.entries.pop(normalized, None)
+            self._resolved.pop(normalized, None)
+            return
+
+        _, _, _, _, _, key_type, match_mode, priority = rows[0][:8]
+        if key_type == "text":
+            # حالت و اولویت از جدیدترین ردیف هر کلید گرفته می‌شود
+            self.matcher.add(normalized, normalized, match_mode or DEFAULT_MATCH_MODE, priority or 0)
+        self.entries[normalized] = [
+            (start_date or None, end_date or None, message_id, content)
+            for message_id, _, content, start_date, end_date in (row[:5] for row in rows)
+        ]
+        if self._resolved_day is not None:
+            self._resolve_key(normalized, self._resolved_day)
+
+    def _resolve_key(self, key: str, day: str):
+        """پاسخ معتبر یک کلید در روز مشخص"""
+        for start_date, end_date, message_id, content in self.entries.get(key, ()):
+            if start_date and start_date > day:
+                continue
+            if end_date and end_date < day:
+                continue
+            self._resolved[key] = (message_id, content)
+            return
+        self._resolved.pop(key, None)
+
+    def _resolve(self, day: str):
+        """ساخت دیکشنری کلید به پاسخ معتبر برای یک روز مشخص"""
+        self._resolved = {}
+        for key in self.entries:
+            self._resolve_key(key, day)
+        self._resolved_day = day
+
+    def apply(self, version: int, message_id: int, row: Optional[Tuple]):
+        """اعمال تغییر یک پیام؛ row=None یعنی پیام حذف یا غیرفعال شده است
+
+        row همان ستون‌های بارگذاری جدول است و created_at در انتهای آن ترتیب
+        ردیف‌های هم‌کلید را تعیین می‌کند.
+        """
+        with self._lock:
+            previous = self._keys.pop(message_id, None)
+            if previous is not None:
+                self._rows[previous] = [item for item in self._rows[previous] if item[0] != message_id]
+                self._refresh_key(previous)
+            if row is not None:
+                normalized = normalize_key(row[1])
+                rows = self._rows.setdefault(normalized, [])
+                order = (row[8] or "", row[0])
+                index = 0
+                while index < len(rows) and (rows[index][8] or "", rows[index][0]) > order:
+                    index += 1
+                rows.insert(index, row)
+                self._keys[message_id] = normalized
+                self._refresh_key(normalized)
+            self.version = version
+
+    def lookup_reply(self, key: str, today: Optional[date] = None) -> Optional[Tuple[int, str]]:
+        """پیدا کردن (شناسه پیام، پاسخ) معتبر برای کلید یا پیامی که کلید متنی را در خود دارد
+
+        برابری کامل پیام با یک کلید همیشه مقدم است؛ در غیر این صورت کلیدهای
+        متنی منطبق به ترتیب اولویت بررسی می‌شوند.
+        """
+        day = (today or date.today()).isoformat()
+        normalized = normalize_key(key)
+        with self._lock:
+            if day != self._resolved_day:
+                self._resolve(day)
+            reply = self._resolved.get(normalized)
+            if reply is not None:
+                return reply
+            for matched in self.matcher.match_all(normalized):
+                reply = self._resolved.get(matched)
+                if reply is not None:
+                    return reply
+        return None
+
+    def lookup(self, key: str, today: Optional[date] = None) -> Optional[str]:
+        """پیدا کردن متن پاسخ معتبر برای کلید"""
+        reply = self.lookup_reply(key, today)
+        return reply[1] if reply else None
+
+
+class ReplyCache:
+    """کش مشترک جدول‌های پاسخ به ازای هر (دیتابیس، کاربر) با نسخه‌بندی
+
+    هر تغییر در پیام‌های کاربر نسخه او را افزایش می‌دهد؛ جدولی که با نسخه
+    قدیمی‌تر ساخته شده باشد هرگز در کش قرار نمی‌گیرد. تغییر یک پیام روی
+    جدول موجود اعمال می‌شود و فقط تغییرهای گروهی کل جدول را باطل می‌کنند.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._tables: Dict[Tuple[str, int], ReplyTable] = {}
+        self._versions: Dict[Tuple[str, int], int] = {}
+        self._listeners: List[Callable[[str, int, Optional[int]], None]] = []
+
+    def get_table(self, db_path: str, user_id: int,
+                  loader: Callable[[], Iterable[Tuple]]) -> ReplyTable:
+        """دریافت جدول پاسخ کاربر و ساخت آن در صورت نبود در کش"""
+        cache_key = (db_path, user_id)
+        with self._lock:
+            table = self._tables.get(cache_key)
+            version = self._versions.get(cache_key, 0)
+        if table is not None:
+            return table
+
+        table = ReplyTable(version, loader())
+
+        with self._lock:
+            # اگر در حین بارگذاری پیامی تغییر کرده، جدول را کش نمی‌کنیم
+            if self._versions.get(cache_key, 0) == version:
+                self._tables[cache_key] = table
+        return table
+
+    def invalidate(self, db_path: str, user_id: int, notify: bool = True):
+        """باطل کردن کامل جدول پاسخ کاربر (مثلاً پس از تغییر گروهی پیام‌ها)"""
+        cache_key = (db_path, user_id)
+        with self._lock:
+            self._versions[cache_key] = self._versions.get(cache_key, 0) + 1
+            self._tables.pop(cache_key, None)
+            listeners = list(self._listeners) if notify else []
+        for callback in listeners:
+            callback(db_path, user_id, None)
+
+    def apply(self, db_path: str, user_id: int, message_id: int,
+              loader: Callable[[], Optional[Tuple]], notify: bool = True):
+        """اعمال تغییر یک پیام روی جدول کش‌شده بدون بارگذاری دوباره کل پیام‌ها
+
+        loader ردیف فعلی پیام (یا None اگر حذف یا غیرفعال شده) را برمی‌گرداند و
+        زیر قفل اجرا می‌شود تا دو ویرایش هم‌زمان به ترتیب اعمال شوند.
+        """
+        cache_key = (db_path, user_id)
+        with self._lock:
+            version = self._versions.get(cache_key, 0) + 1
+            self._versions[cache_key] = version
+            table = self._tables.get(cache_key)
+            if table is not None:
+                try:
+                    table.apply(version, message_id, loader())
+                except Exception:
+                    # جدول ناقص کش نمی‌ماند؛ درخواست بعدی آن را کامل می‌سازد
+                    self._tables.pop(cache_key, None)
+                    raise
+            listeners = list(self._listeners) if notify else []
+        for callback in listeners:
+            callback(db_path, user_id, message_id)
+
+    def add_listener(self, callback: Callable[[str, int, Optional[int]], None]):
+        """ثبت تابعی که پس از هر تغییر فراخوانی می‌شود (مثلاً برای اطلاع به پردازش‌های دیگر)
+
+        شناسه پیام تغییرکرده یا None برای باطل‌سازی کامل به آن داده می‌شود.
+        """
+        with self._lock:
+            self._listeners.append(callback)
+
+    def version(self, db_path: str, user_id: int) -> int:
+        """نسخه فعلی پیام‌های کاربر"""
+        with self._lock:
+            return self._versions.get((db_path, user_id), 0)
+
+
+# کش مشترک بین تمام نمونه‌های MessageManager در این پردازش
+reply_cache = ReplyCache()
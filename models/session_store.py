@@ -0,0 +1,130 @@
+import base64
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import zlib
+from typing import Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# پیشوند sessionهای فشرده در ستون session_data؛ مقادیر بدون پیشوند JSON ساده قدیمی هستند
+COMPRESSED_PREFIX = "z1:"
+
+
+def canonical_json(settings: Dict) -> str:
+    """JSON با ترتیب کلید ثابت تا settings یکسان همیشه hash یکسان داشته باشد"""
+    return json.dumps(settings, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str)
+
+
+def settings_digest(settings: Dict) -> str:
+    """hash محتوای session"""
+    return hashlib.sha256(canonical_json(settings).encode("utf-8")).hexdigest()
+
+
+def encode_session(settings: Dict) -> Tuple[str, str]:
+    """فشرده‌سازی session برای ذخیره در دیتابیس؛ (مقدار ذخیره‌شدنی، hash) برمی‌گرداند"""
+    raw = canonical_json(settings).encode("utf-8")
+    packed = COMPRESSED_PREFIX + base64.b64encode(zlib.compress(raw, 6)).decode("ascii")
+    return packed, hashlib.sha256(raw).hexdigest()
+
+
+def decode_session(value: Optional[str]) -> Optional[Dict]:
+    """خواندن session فشرده یا JSON ساده قدیمی"""
+    if not value:
+        return None
+    if value.startswith(COMPRESSED_PREFIX):
+        raw = zlib.decompress(base64.b64decode(value[len(COMPRESSED_PREFIX):]))
+        return json.loads(raw.decode("utf-8"))
+    return json.loads(value)
+
+
+def write_file_atomic(path: str, content: str):
+    """نوشتن فایل با فایل موقت و os.replace تا فایل نیمه‌نوشته هرگز دیده نشود"""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, temp_path = tempfile.mkstemp(prefix=".session-", suffix=".tmp", dir=directory)
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(content)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, path)
+    except BaseException:
+        try:
+            os.unlink(temp_path)
+        except OSError:
+            pass
+        raise
+
+
+class SessionStore:
+    """ذخیره و بارگذاری session یک حساب با تشخیص تغییر
+
+    session در دیتابیس به صورت فشرده و در فایل پشتیبان به صورت JSON ساده
+    نگه داشته می‌شود. hash آخرین نسخه خوانده یا نوشته‌شده نگه داشته می‌شود
+    و ذخیره session بدون تغییر هیچ نوشتنی در دیتابیس یا فایل ندارد.
+    """
+
+    def __init__(self, user_manager, session_file: str):
+        self.user_manager = user_manager
+        self.session_file = session_file
+        self._digest: Optional[str] = None
+
+    def load(self, account_id: int) -> Optional[Dict]:
+        """بارگذاری session از دیتابیس و در صورت نبود، از فایل پشتیبان"""
+        try:
+            settings = decode_session(self.user_manager.get_account_session(account_id))
+            if settings:
+                self._digest = settings_digest(settings)
+                logger.info("Session از دیتابیس بارگذاری شد")
+                return settings
+        except Exception as e:
+            logger.error(f"خطا در خواندن session از دیتابیس: {e}")
+
+        if not os.path.exists(self.session_file):
+            return None
+
+        try:
+            with open(self.session_file, "r", encoding="utf-8") as f:
+                settings = decode_session(f.read())
+        except Exception as e:
+            logger.error(f"خطا در خواندن فایل session: {e}")
+            return None
+
+        if not settings or "authorization_data" not in settings:
+            return None
+
+        # ذخیره در دیتابیس برای دفعات بعد
+        packed, digest = encode_session(settings)
+        if self.user_manager.update_account_session(account_id, packed):
+            self._digest = digest
+        logger.info("Session از فایل بارگذاری و در دیتابیس ذخیره شد")
+        return settings
+
+    def save(self, account_id: int, settings: Dict) -> bool:
+        """ذخیره session فقط در صورت تغییر نسبت به آخرین نسخه"""
+        if not settings:
+            return False
+
+        packed, digest = encode_session(settings)
+        if digest == self._digest:
+            logger.debug("Session تغییری نکرده است؛ نوشتن انجام نشد")
+            return True
+
+        success = self.user_manager.update_account_session(account_id, packed)
+
+        # فایل پشتیبان به صورت JSON ساده تا با ابزارهای instagrapi هم قابل استفاده باشد
+        try:
+            write_file_atomic(self.session_file, json.dumps(settings))
+        except Exception as e:
+            logger.error(f"خطا در نوشتن فایل session: {e}")
+
+        if success:
+            self._digest = digest
+            logger.info("Session در دیتابیس و فایل ذخیره شد")
+        return success
+
+    def forget(self):
+        """فراموش کردن hash تا ذخیره بعدی حتماً نوشته شود"""
+        self._digest = None
@@ -3,6 +3,8 @@ import sqlite3
 import logging
 from datetime import datetime
 from typing import Dict, List, Optional
+from .database import get_connection, transaction
+from .account_registry import account_registry
 
 logger = logging.getLogger(__name__)
 
@@ -15,61 +17,53 @@ class UserManager:
     
     def init_db(self):
         """ایجاد پایگاه داده کاربران"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS users (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                username TEXT UNIQUE NOT NULL,
-                password_hash TEXT NOT NULL,
-                is_admin BOOLEAN DEFAULT FALSE,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS instagram_accounts (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER NOT NULL,
-                instagram_username TEXT NOT NULL,
-                instagram_password TEXT NOT NULL,
-                session_data TEXT,
-                is_active BOOLEAN DEFAULT TRUE,
-                last_login TIMESTAMP,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (user_id) REFERENCES users (id)
-            )
-        ''')
-        
-        conn.commit()
-        
-        # ایجاد کاربر ادمین پیش‌فرض اگر وجود ندارد
-        cursor.execute("SELECT id FROM users WHERE username = 'admin'")
-        if not cursor.fetchone():
-            password_hash = generate_password_hash('admin123')
-            cursor.execute(
-                "INSERT INTO users (username, password_hash, is_admin) VALUES (?, ?, ?)",
-                ('admin', password_hash, True)
-            )
-        
-        conn.commit()
-        conn.close()
+        with transaction(self.db_path) as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS users (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    username TEXT UNIQUE NOT NULL,
+                    password_hash TEXT NOT NULL,
+                    is_admin BOOLEAN DEFAULT FALSE,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+            
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS instagram_accounts (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    user_id INTEGER NOT NULL,
+                    instagram_username TEXT NOT NULL,
+                    instagram_password TEXT NOT NULL,
+                    session_data TEXT,
+                    is_active BOOLEAN DEFAULT TRUE,
+                    last_login TIMESTAMP,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    FOREIGN KEY (user_id) REFERENCES users (id)
+                )
+            ''')
+            
+            # ایجاد کاربر ادمین پیش‌فرض اگر وجود ندارد
+            cursor.execute("SELECT id FROM users WHERE username = 'admin'")
+            if not cursor.fetchone():
+                password_hash = generate_password_hash('admin123')
+                cursor.execute(
+                    "INSERT INTO users (username, password_hash, is_admin) VALUES (?, ?, ?)",
+                    ('admin', password_hash, True)
+                )
     
     def create_user(self, username: str, password: str, is_admin: bool = False) -> bool:
         """ایجاد کاربر جدید"""
         try:
             password_hash = generate_password_hash(password)
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            cursor.execute(
-                "INSERT INTO users (username, password_hash, is_admin) VALUES (?, ?, ?)",
-                (username, password_hash, is_admin)
-            )
-            
-            conn.commit()
-            conn.close()
+            with transaction(self.db_path) as conn:
+                cursor = conn.cursor()
+                
+                cursor.execute(
+                    "INSERT INTO users (username, password_hash, is_admin) VALUES (?, ?, ?)",
+                    (username, password_hash, is_admin)
+                )
             return True
         except sqlite3.IntegrityError:
             return False  # کاربر از قبل وجود دارد
@@ -80,7 +74,7 @@ class UserManager:
     def verify_user(self, username: str, password: str) -> Optional[Dict]:
         """احراز هویت کاربر"""
         try:
-            conn = sqlite3.connect(self.db_path)
+            conn = get_connection(self.db_path)
             cursor = conn.cursor()
             
             cursor.execute(
@@ -89,7 +83,6 @@ class UserManager:
             )
             
             user = cursor.fetchone()
-            conn.close()
             
             if user and check_password_hash(user[2], password):
                 return {
@@ -105,7 +98,7 @@ class UserManager:
     def get_user_by_id(self, user_id: int) -> Optional[Dict]:
         """دریافت کاربر بر اساس ID"""
         try:
-            conn = sqlite3.connect(self.db_path)
+            conn = get_connection(self.db_path)
             cursor = conn.cursor()
             
             cursor.execute(
@@ -114,7 +107,6 @@ class UserManager:
             )
             
             user = cursor.fetchone()
-            conn.close()
             
             if user:
                 return {
@@ -130,7 +122,7 @@ class UserManager:
     def get_all_users(self) -> List[Dict]:
         """دریافت تمام کاربران"""
         try:
-            conn = sqlite3.connect(self.db_path)
+            conn = get_connection(self.db_path)
             cursor = conn.cursor()
             
             cursor.execute(
@@ -146,7 +138,6 @@ class UserManager:
                     "created_at": row[3]
                 })
             
-            conn.close()
             return users
         except Exception as e:
             logger.error(f"خطا در دریافت کاربران: {e}")
@@ -155,23 +146,21 @@ class UserManager:
     def delete_user(self, user_id: int) -> bool:
         """حذف کاربر"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            # ابتدا حساب‌های اینستاگرام کاربر را حذف می‌کنیم
-            cursor.execute(
-                "DELETE FROM instagram_accounts WHERE user_id = ?",
-                (user_id,)
-            )
-            
-            # سپس کاربر را حذف می‌کنیم
-            cursor.execute(
-                "DELETE FROM users WHERE id = ?",
-                (user_id,)
-            )
-            
-            conn.commit()
-            conn.close()
+            with transaction(self.db_path) as conn:
+                cursor = conn.cursor()
+                
+                # ابتدا حساب‌های اینستاگرام کاربر را حذف می‌کنیم
+                cursor.execute(
+                    "DELETE FROM instagram_accounts WHERE user_id = ?",
+                    (user_id,)
+                )
+                
+                # سپس کاربر را حذف می‌کنیم
+                cursor.execute(
+                    "DELETE FROM users WHERE id = ?",
+                    (user_id,)
+                )
+            account_registry.invalidate(self.db_path, user_id)
             return cursor.rowcount > 0
         except Exception as e:
             logger.error(f"خطا در حذف کاربر: {e}")
@@ -180,16 +169,14 @@ class UserManager:
     def add_instagram_account(self, user_id: int, instagram_username: str, instagram_password: str) -> bool:
         """افزودن حساب اینستاگرام"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            cursor.execute(
-                "INSERT INTO instagram_accounts (user_id, instagram_username, instagram_password) VALUES (?, ?, ?)",
-                (user_id, instagram_username, instagram_password)
-            )
-            
-            conn.commit()
-            conn.close()
+            with transaction(self.db_path) as conn:
+                cursor = conn.cursor()
+                
+                cursor.execute(
+                    "INSERT INTO instagram_accounts (user_id, instagram_username, instagram_password) VALUES (?, ?, ?)",
+                    (user_id, instagram_username, instagram_password)
+                )
+            account_registry.invalidate(self.db_path, user_id)
             return True
         except Exception as e:
             logger.error(f"خطا در افزودن حساب اینستاگرام: {e}")
@@ -198,7 +185,7 @@ class UserManager:
     def get_user_accounts(self, user_id: int) -> List[Dict]:
         """دریافت حساب‌های اینستاگرام کاربر"""
         try:
-            conn = sqlite3.connect(self.db_path)
+            conn = get_connection(self.db_path)
             cursor = conn.cursor()
             
             cursor.execute('''
@@ -218,26 +205,28 @@ class UserManager:
                     "created_at": row[4]
                 })
             
-            conn.close()
             return accounts
         except Exception as e:
             logger.error(f"خطا در دریافت حساب‌های کاربر: {e}")
             return []
     
-    def get_account_credentials(self, account_id: int, user_id: int) -> Optional[Dict]:
-        """دریافت اطلاعات حساب اینستاگرام"""
+    def get_account_credentials(self, account_id: int, user_id: int, include_session: bool = True) -> Optional[Dict]:
+        """دریافت اطلاعات حساب اینستاگرام
+
+        با include_session=False ستون حجیم session_data خوانده نمی‌شود.
+        """
         try:
-            conn = sqlite3.connect(self.db_path)
+            conn = get_connection(self.db_path)
             cursor = conn.cursor()
             
-            cursor.execute('''
-                SELECT instagram_username, instagram_password, session_data 
+            session_column = "session_data" if include_session else "NULL"
+            cursor.execute(f'''
+                SELECT instagram_username, instagram_password, {session_column}
                 FROM instagram_accounts 
                 WHERE id = ? AND user_id = ?
             ''', (account_id, user_id))
             
             account = cursor.fetchone()
-            conn.close()
             
             if account:
                 return {
@@ -250,19 +239,33 @@ class UserManager:
             logger.error(f"خطا در دریافت اطلاعات حساب: {e}")
             return None
     
-    def update_account_session(self, account_id: int, session_data: str) -> bool:
-        """به‌روزرسانی session حساب"""
+    def get_account_session(self, account_id: int) -> Optional[str]:
+        """دریافت فقط session ذخیره‌شده حساب"""
         try:
-            conn = sqlite3.connect(self.db_path)
+            conn = get_connection(self.db_path)
             cursor = conn.cursor()
             
             cursor.execute(
-                "UPDATE instagram_accounts SET session_data = ?, last_login = ? WHERE id = ?",
-                (session_data, datetime.now(), account_id)
+                "SELECT session_data FROM instagram_accounts WHERE id = ?",
+                (account_id,)
             )
             
-            conn.commit()
-            conn.close()
+            row = cursor.fetchone()
+            return row[0] if row else None
+        except Exception as e:
+            logger.error(f"خطا در دریافت session حساب: {e}")
+            return None
+    
+    def update_account_session(self, account_id: int, session_data: str) -> bool:
+        """به‌روزرسانی session حساب"""
+        try:
+            with transaction(self.db_path) as conn:
+                cursor = conn.cursor()
+                
+                cursor.execute(
+                    "UPDATE instagram_accounts SET session_data = ?, last_login = ? WHERE id = ?",
+                    (session_data, datetime.now(), account_id)
+                )
             return True
         except Exception as e:
             logger.error(f"خطا در به‌روزرسانی session: {e}")
@@ -271,16 +274,14 @@ class UserManager:
     def update_account_status(self, account_id: int, is_active: bool) -> bool:
         """به‌روزرسانی وضعیت حساب"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            cursor.execute(
-                "UPDATE instagram_accounts SET is_active = ? WHERE id = ?",
-                (is_active, account_id)
-            )
-            
-            conn.commit()
-            conn.close()
+            with transaction(self.db_path) as conn:
+                cursor = conn.cursor()
+                
+                cursor.execute(
+                    "UPDATE instagram_accounts SET is_active = ? WHERE id = ?",
+                    (is_active, account_id)
+                )
+            account_registry.invalidate_account(self.db_path, account_id)
             return True
         except Exception as e:
             logger.error(f"خطا در به‌روزرسانی وضعیت حساب: {e}")
@@ -289,38 +290,55 @@ class UserManager:
     def delete_instagram_account(self, account_id: int, user_id: int) -> bool:
         """حذف حساب اینستاگرام"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            cursor.execute(
-                "DELETE FROM instagram_accounts WHERE id = ? AND user_id = ?",
-                (account_id, user_id)
-            )
-            
-            conn.commit()
-            conn.close()
+            with transaction(self.db_path) as conn:
+                cursor = conn.cursor()
+                
+                cursor.execute(
+                    "DELETE FROM instagram_accounts WHERE id = ? AND user_id = ?",
+                    (account_id, user_id)
+                )
+            account_registry.invalidate(self.db_path, user_id)
             return cursor.rowcount > 0
         except Exception as e:
             logger.error(f"خطا در حذف حساب اینستاگرام: {e}")
             return False
     
-    def get_account_id(self, user_id: int, instagram_username: str) -> int:
-        """دریافت ID حساب از دیتابیس"""
+    def _load_account_index(self, user_id: int) -> List[Dict]:
+        """بارگذاری اطلاعات تمام حساب‌های کاربر برای ایندکس درون‌حافظه‌ای"""
+        conn = get_connection(self.db_path)
+        cursor = conn.cursor()
+        
+        cursor.execute('''
+            SELECT id, instagram_username, is_active, created_at
+            FROM instagram_accounts
+            WHERE user_id = ?
+        ''', (user_id,))
+        
+        return [
+            {
+                "id": row[0],
+                "instagram_username": row[1],
+                "is_active": bool(row[2]),
+                "created_at": row[3]
+            }
+            for row in cursor.fetchall()
+        ]
+    
+    def get_account(self, user_id: int, instagram_username: str) -> Optional[Dict]:
+        """دریافت اطلاعات حساب از ایندکس درون‌حافظه‌ای"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            cursor.execute(
-                "SELECT id FROM instagram_accounts WHERE user_id = ? AND instagram_username = ?",
-                (user_id, instagram_username)
-            )
-            
-            account = cursor.fetchone()
-            conn.close()
-            
-            if account:
-                return account[0]
-            return -1
+            loader = lambda: self._load_account_index(user_id)
+            account = account_registry.get_account(self.db_path, user_id, instagram_username, loader)
+            if account is None:
+                # ممکن است حساب از پردازش دیگری اضافه شده باشد؛ یک بار از دیتابیس تازه می‌خوانیم
+                account_registry.invalidate(self.db_path, user_id)
+                account = account_registry.get_account(self.db_path, user_id, instagram_username, loader)
+            return account
         except Exception as e:
-            logger.error(f"خطا در دریافت ID حساب: {e}")
-            return -1
\ No newline at end of file
+            logger.error(f"خطا در دریافت اطلاعات حساب: {e}")
+            return None
+    
+    def get_account_id(self, user_id: int, instagram_username: str) -> int:
+        """دریافت ID حساب از ایندکس درون‌حافظه‌ای"""
+        account = self.get_account(user_id, instagram_username)
+        return account["id"] if account else -1
\ No newline at end of file
@@ -0,0 +1,102 @@
+import logging
+from typing import Dict, Optional, Tuple
+from .database import get_connection, transaction
+
+logger = logging.getLogger(__name__)
+
+
+def write_watermark(cursor, account_id: int, thread_id: str, item_id: str, timestamp: float):
+    """upsert watermark روی cursor داده‌شده تا بتواند در تراکنش دیگری (مثلاً ثبت صف ارسال) انجام شود"""
+    cursor.execute('''
+        INSERT INTO thread_watermarks (account_id, thread_id, last_item_id, last_timestamp, updated_at)
+        VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)
+        ON CONFLICT (account_id, thread_id) DO UPDATE SET
+            last_item_id = excluded.last_item_id,
+            last_timestamp = excluded.last_timestamp,
+            updated_at = excluded.updated_at
+        WHERE excluded.last_timestamp >= thread_watermarks.last_timestamp
+    ''', (account_id, thread_id, str(item_id), timestamp))
+
+
+class WatermarkManager:
+    """مدیریت آخرین پیام پردازش‌شده هر thread به ازای هر حساب"""
+
+    def __init__(self, db_path="bot_status.db"):
+        self.db_path = db_path
+        self.init_db()
+
+    def init_db(self):
+        """ایجاد جدول watermark‌ها"""
+        with transaction(self.db_path) as conn:
+            cursor = conn.cursor()
+
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS thread_watermarks (
+                    account_id INTEGER NOT NULL,
+                    thread_id TEXT NOT NULL,
+                    last_item_id TEXT NOT NULL,
+                    last_timestamp REAL NOT NULL,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    PRIMARY KEY (account_id, thread_id)
+                )
+            ''')
+
+    def get_watermarks(self, account_id: int) -> Dict[str, Tuple[str, float]]:
+        """دریافت watermark تمام threadهای یک حساب"""
+        try:
+            conn = get_connection(self.db_path)
+            cursor = conn.cursor()
+
+            cursor.execute('''
+                SELECT thread_id, last_item_id, last_timestamp
+                FROM thread_watermarks
+                WHERE account_id = ?
+            ''', (account_id,))
+
+            return {row[0]: (row[1], row[2]) for row in cursor.fetchall()}
+        except Exception as e:
+            logger.error(f"خطا در دریافت watermark‌ها: {e}")
+            return {}
+
+    def get_watermark(self, account_id: int, thread_id: str) -> Optional[Tuple[str, float]]:
+        """دریافت watermark یک thread"""
+        try:
+            conn = get_connection(self.db_path)
+            cursor = conn.cursor()
+
+            cursor.execute('''
+                SELECT last_item_id, last_timestamp
+                FROM thread_watermarks
+                WHERE account_id = ? AND thread_id = ?
+            ''', (account_id, thread_id))
+
+            row = cursor.fetchone()
+            return (row[0], row[1]) if row else None
+        except Exception as e:
+            logger.error(f"خطا در دریافت watermark: {e}")
+            return None
+
+    def update_watermark(self, account_id: int, thread_id: str, item_id: str, timestamp: float) -> bool:
+        """پیش بردن watermark یک thread؛ watermark هرگز به عقب برنمی‌گردد"""
+        try:
+            with transaction(self.db_path) as conn:
+                write_watermark(conn.cursor(), account_id, thread_id, item_id, timestamp)
+            return True
+        except Exception as e:
+            logger.error(f"خطا در به‌روزرسانی watermark: {e}")
+            return False
+
+    def delete_account_watermarks(self, account_id: int) -> bool:
+        """حذف watermark‌های یک حساب"""
+        try:
+            with transaction(self.db_path) as conn:
+                cursor = conn.cursor()
+
+                cursor.execute(
+                    "DELETE FROM thread_watermarks WHERE account_id = ?",
+                    (account_id,)
+                )
+            return True
+        except Exception as e:
+            logger.error(f"خطا در حذف watermark‌ها: {e}")
+            return False
@@ -0,0 +1,86 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+from unittest import mock
+
+
+class HistoryWriterRetryTest(unittest.TestCase):
+    """دسته ناموفق تاریخچه دوباره نوشته می‌شود و از دست نمی‌رود"""
+
+    def setUp(self):
+        # import بسته models دیتابیس‌های پیش‌فرض را در پوشه جاری می‌سازد
+        self.cwd = os.getcwd()
+        self.workdir = tempfile.mkdtemp(prefix="test_history_writer_")
+        os.chdir(self.workdir)
+        from models import history_writer
+        from models.message_manager import MessageManager
+
+        self.history_writer = history_writer
+        self.db_path = os.path.join(self.workdir, "messages.db")
+        MessageManager(self.db_path)
+        self.writer = None
+        patcher = mock.patch.object(history_writer, "RETRY_BASE_SECONDS", 0.01)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        from models.database import close_connections
+
+        if self.writer:
+            self.writer.close()
+        close_connections()
+        os.chdir(self.cwd)
+        shutil.rmtree(self.workdir, ignore_errors=True)
+
+    def rows(self) -> int:
+        conn = sqlite3.connect(self.db_path)
+        try:
+            return conn.execute("SELECT COUNT(*) FROM message_history").fetchone()[0]
+        finally:
+            conn.close()
+
+    def enqueue_rows(self, count: int):
+        for index in range(count):
+            self.writer.enqueue(1, "1", f"thread_{index}", "100", account_id=7)
+
+    def test_first_commit_failure_is_retried(self):
+        apply_rollups = self.history_writer.apply_rollups
+        calls = []
+
+        def fail_once(conn, batch):
+            calls.append(len(batch))
+            if len(calls) == 1:
+                raise sqlite3.OperationalError("database is locked")
+            return apply_rollups(conn, batch)
+
+        with mock.patch.object(self.history_writer, "apply_rollups", fail_once):
+            self.writer = self.history_writer.HistoryWriter(self.db_path, flush_interval=0.01)
+            self.enqueue_rows(3)
+            self.assertTrue(self.writer.flush(timeout=5))
+
+        self.assertEqual(self.rows(), 3)
+        stats = self.writer.stats()
+        self.assertEqual(stats["rows_written"], 3)
+        self.assertEqual(stats["failed_rows"], 0)
+        self.assertGreaterEqual(stats["retries"], 1)
+
+    def test_rows_failed_after_max_attempts(self):
+        def always_fail(conn, batch):
+            raise sqlite3.OperationalError("database is locked")
+
+        with mock.patch.object(self.history_writer, "apply_rollups", always_fail):
+            self.writer = self.history_writer.HistoryWriter(self.db_path, flush_interval=0.01,
+                                                            max_attempts=3)
+            self.enqueue_rows(3)
+            self.assertTrue(self.writer.flush(timeout=5))
+
+        self.assertEqual(self.rows(), 0)
+        stats = self.writer.stats()
+        self.assertEqual(stats["failed_rows"], 3)
+        self.assertEqual(stats["retries"], 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
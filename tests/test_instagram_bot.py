@@ -0,0 +1,83 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+
+class UnreadBurstTest(unittest.TestCase):
+    """پاسخ به تمام پیام‌های خوانده‌نشده یک thread حتی وقتی payload لیست inbox کوتاه‌تر است"""
+
+    def setUp(self):
+        # import بسته models دیتابیس‌های پیش‌فرض را در پوشه جاری می‌سازد
+        self.cwd = os.getcwd()
+        self.workdir = tempfile.mkdtemp(prefix="test_instagram_bot_")
+        os.chdir(self.workdir)
+        import models
+        import bots.instagram_bot
+        from benchmarks.bench_bot_throughput import configure_fast_limits, make_bot, setup_accounts
+        from benchmarks.fake_client import FakeClient, FakeInstagram
+
+        # نمونه‌های جهانی models ممکن است در پوشه تست قبلی ساخته شده باشند
+        for manager in (models.user_manager, models.message_manager, models.bot_manager,
+                        models.watermark_manager, models.outbound_queue_manager):
+            manager.init_db()
+
+        self.original_client = bots.instagram_bot.Client
+        bots.instagram_bot.Client = FakeClient
+        # payload لیست inbox فقط سه پیام آخر هر thread را دارد
+        self.world = FakeInstagram(threads_per_account=1, messages_per_thread=3)
+        FakeClient.configure(self.world)
+        configure_fast_limits()
+        user_id, usernames = setup_accounts(1)
+        self.username = usernames[0]
+        self.bot = make_bot(self.username, user_id, 0.01)
+        self.assertTrue(self.bot.login())
+
+        self.collected = []
+        resolve_replies = self.bot.resolve_replies
+
+        def record(messages):
+            self.collected.append([message.text for message in messages])
+            return resolve_replies(messages)
+
+        self.bot.resolve_replies = record
+
+    def tearDown(self):
+        import bots.instagram_bot
+        from bots.outbound import get_outbound_dispatcher
+        from models.database import close_connections
+
+        get_outbound_dispatcher().join(timeout=10)
+        self.bot.stop_event.set()
+        bots.instagram_bot.Client = self.original_client
+        close_connections()
+        os.chdir(self.cwd)
+        shutil.rmtree(self.workdir, ignore_errors=True)
+
+    def push(self, count: int):
+        texts = [f"پیام {index}" for index in range(count)]
+        for text in texts:
+            self.world.push_incoming(self.username, 0, text)
+        return texts
+
+    def test_burst_longer_than_inbox_payload(self):
+        texts = self.push(8)
+        self.world.reset_stats()
+
+        self.bot.check_new_messages()
+
+        self.assertEqual(self.collected, [texts])
+        self.assertEqual(self.world.calls["direct_thread"], 1)
+
+    def test_short_burst_uses_inbox_payload(self):
+        texts = self.push(2)
+        self.world.reset_stats()
+
+        self.bot.check_new_messages()
+
+        self.assertEqual(self.collected, [texts])
+        self.assertEqual(self.world.calls["direct_thread"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,53 @@
+import random
+import unittest
+
+
+class IncrementalMatcherTest(unittest.TestCase):
+    """افزودن و حذف کلید روی matcher ساخته‌شده همان نتیجه ساخت از صفر را می‌دهد"""
+
+    def fresh(self, keywords):
+        from models.keyword_matcher import KeywordMatcher
+
+        matcher = KeywordMatcher()
+        for keyword, mode, priority in keywords.values():
+            matcher.add(keyword, keyword, mode, priority)
+        matcher.build()
+        return matcher
+
+    def test_random_edits_match_rebuild(self):
+        from models.keyword_matcher import MATCH_MODES
+
+        rng = random.Random(7)
+        alphabet = "ab c"
+        words = sorted({"".join(rng.choice(alphabet) for _ in range(rng.randint(1, 4))).strip() or "a"
+                        for _ in range(60)})
+        texts = ["".join(rng.choice(alphabet) for _ in range(rng.randint(1, 12))) for _ in range(200)]
+
+        keywords = {}
+        matcher = self.fresh(keywords)
+        for _ in range(300):
+            word = rng.choice(words)
+            if word in keywords and rng.random() < 0.5:
+                self.assertTrue(matcher.remove(word, word))
+                del keywords[word]
+            else:
+                if word in keywords:
+                    matcher.remove(word, word)
+                mode, priority = rng.choice(MATCH_MODES), rng.randint(0, 2)
+                keywords[word] = (word, mode, priority)
+                matcher.add(word, word, mode, priority)
+
+            expected = self.fresh(keywords)
+            self.assertEqual(len(matcher), len(expected))
+            for text in rng.sample(texts, 20):
+                self.assertEqual(matcher.match_all(text), expected.match_all(text), text)
+
+    def test_remove_unknown_keyword(self):
+        matcher = self.fresh({"ab": ("ab", "contains", 0)})
+        self.assertFalse(matcher.remove("abc", "abc"))
+        self.assertFalse(matcher.remove("ab", "other"))
+        self.assertEqual(matcher.match_all("xaby"), ["ab"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,66 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+
+class MetricsAccessTest(unittest.TestCase):
+    """/metrics بدون توکن معتبر یا session مدیر در دسترس نیست"""
+
+    def setUp(self):
+        # import بسته app و models دیتابیس‌ها و فایل لاگ را در پوشه جاری می‌سازد
+        self.cwd = os.getcwd()
+        self.workdir = tempfile.mkdtemp(prefix="test_metrics_")
+        os.chdir(self.workdir)
+        os.environ.setdefault("BOT_WORKER_PROCESSES", "0")
+        from app import create_app
+        from app.routes import metrics
+
+        self.metrics = metrics
+        self.client = create_app().test_client()
+
+    def tearDown(self):
+        from models.database import close_connections
+
+        close_connections()
+        os.chdir(self.cwd)
+        shutil.rmtree(self.workdir, ignore_errors=True)
+
+    def login(self, is_admin: bool):
+        with self.client.session_transaction() as session:
+            session['user_id'] = 1
+            session['username'] = 'admin' if is_admin else 'user'
+            session['is_admin'] = is_admin
+
+    def test_anonymous_refused_without_token(self):
+        with mock.patch.object(self.metrics, 'METRICS_TOKEN', None):
+            response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 403)
+        self.assertNotIn(b'instagram_', response.data)
+
+    def test_anonymous_refused_with_token(self):
+        with mock.patch.object(self.metrics, 'METRICS_TOKEN', 'secret'):
+            self.assertEqual(self.client.get('/metrics').status_code, 403)
+            response = self.client.get('/metrics', headers={'Authorization': 'Bearer wrong'})
+        self.assertEqual(response.status_code, 403)
+
+    def test_non_admin_session_refused(self):
+        self.login(is_admin=False)
+        with mock.patch.object(self.metrics, 'METRICS_TOKEN', None):
+            self.assertEqual(self.client.get('/metrics').status_code, 403)
+
+    def test_token_accepted(self):
+        with mock.patch.object(self.metrics, 'METRICS_TOKEN', 'secret'):
+            response = self.client.get('/metrics', headers={'Authorization': 'Bearer secret'})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'instagram_bots_active', response.data)
+
+    def test_admin_session_accepted(self):
+        self.login(is_admin=True)
+        with mock.patch.object(self.metrics, 'METRICS_TOKEN', None):
+            self.assertEqual(self.client.get('/metrics').status_code, 200)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,75 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+
+
+class ApplyMigrationsTest(unittest.TestCase):
+    """اجرای اتمی migration‌ها: خطا در میانه migration هیچ تغییری باقی نمی‌گذارد"""
+
+    def setUp(self):
+        # import بسته models دیتابیس‌های پیش‌فرض را در پوشه جاری می‌سازد
+        self.cwd = os.getcwd()
+        self.workdir = tempfile.mkdtemp(prefix="test_migrations_")
+        os.chdir(self.workdir)
+        from models.database import close_connections, get_connection
+        from models.migrations import apply_migrations, get_schema_version
+
+        self.apply_migrations = apply_migrations
+        self.get_schema_version = get_schema_version
+        self.get_connection = get_connection
+        self.close_connections = close_connections
+        self.db_path = os.path.join(self.workdir, "test.db")
+
+        conn = sqlite3.connect(self.db_path)
+        conn.execute("CREATE TABLE messages (id INTEGER PRIMARY KEY, key TEXT)")
+        conn.commit()
+        conn.close()
+
+    def tearDown(self):
+        self.close_connections()
+        os.chdir(self.cwd)
+        shutil.rmtree(self.workdir, ignore_errors=True)
+
+    def columns(self):
+        conn = self.get_connection(self.db_path)
+        return [row[1] for row in conn.execute("PRAGMA table_info(messages)")]
+
+    def test_failed_migration_is_rolled_back(self):
+        def add_columns_then_fail(cursor):
+            cursor.execute("ALTER TABLE messages ADD COLUMN match_mode TEXT DEFAULT 'exact'")
+            raise sqlite3.OperationalError("خطای تزریق‌شده")
+
+        migrations = [
+            (1, "ستون اول", lambda cursor: cursor.execute("ALTER TABLE messages ADD COLUMN content TEXT")),
+            (2, "ستون‌های نیمه‌کاره", add_columns_then_fail),
+        ]
+        with self.assertRaises(sqlite3.OperationalError):
+            self.apply_migrations(self.db_path, migrations)
+
+        self.assertEqual(self.get_schema_version(self.get_connection(self.db_path)), 1)
+        self.assertEqual(self.columns(), ["id", "key", "content"])
+
+    def test_retry_after_failure_succeeds(self):
+        calls = []
+
+        def add_columns(cursor):
+            cursor.execute("ALTER TABLE messages ADD COLUMN match_mode TEXT DEFAULT 'exact'")
+            if not calls:
+                calls.append(1)
+                raise sqlite3.OperationalError("خطای تزریق‌شده")
+            cursor.execute("ALTER TABLE messages ADD COLUMN priority INTEGER DEFAULT 0")
+
+        migrations = [(1, "حالت تطبیق و اولویت", add_columns)]
+        with self.assertRaises(sqlite3.OperationalError):
+            self.apply_migrations(self.db_path, migrations)
+
+        # بدون rollback کامل، اجرای دوباره با «duplicate column name» شکست می‌خورد
+        self.assertEqual(self.apply_migrations(self.db_path, migrations), 1)
+        self.assertEqual(self.columns(), ["id", "key", "match_mode", "priority"])
+        self.assertEqual(self.apply_migrations(self.db_path, migrations), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,55 @@
+import threading
+import time
+import unittest
+
+
+class DeferredSendTest(unittest.TestCase):
+    """ارسالی که باید منتظر بماند worker مشترک را برای حساب‌های دیگر اشغال نمی‌کند"""
+
+    def setUp(self):
+        from bots.outbound import OutboundDeferred, OutboundDispatcher, OutboundJob
+        from bots.rate_limiter import RateLimiter
+
+        self.OutboundDeferred = OutboundDeferred
+        self.OutboundJob = OutboundJob
+        # یک worker؛ اگر کار در حال انتظار در آن بخوابد حساب دیگر معطل می‌ماند
+        self.dispatcher = OutboundDispatcher(workers=1, limiter=RateLimiter())
+        self.dispatcher.start()
+        self.events = []
+        self.lock = threading.Lock()
+
+    def tearDown(self):
+        self.dispatcher.shutdown()
+
+    def record(self, name: str):
+        with self.lock:
+            self.events.append((name, time.monotonic()))
+
+    def test_deferred_job_yields_worker(self):
+        steps = {"slow": 0}
+
+        def slow_send(job):
+            steps["slow"] += 1
+            self.record(f"slow{steps['slow']}")
+            if steps["slow"] == 1:
+                raise self.OutboundDeferred(0.5)
+
+        def fast_send(job):
+            self.record("fast")
+
+        start = time.monotonic()
+        self.dispatcher.submit(self.OutboundJob("a", "t1", "u1", [], 1.0, slow_send))
+        self.dispatcher.submit(self.OutboundJob("b", "t2", "u2", [], 2.0, fast_send))
+        self.assertTrue(self.dispatcher.join(timeout=5))
+
+        names = [name for name, _ in self.events]
+        self.assertEqual(names, ["slow1", "fast", "slow2"])
+        times = dict(self.events)
+        self.assertLess(times["fast"] - start, 0.3)
+        self.assertGreaterEqual(times["slow2"] - times["slow1"], 0.45)
+        stats = self.dispatcher.stats()
+        self.assertEqual((stats["deferred"], stats["sent"], stats["failed"]), (1, 2, 0))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,55 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+
+class OutboundEnqueueTest(unittest.TestCase):
+    """ثبت پاسخ در صف ارسال و جلو رفتن watermark در یک تراکنش"""
+
+    def setUp(self):
+        # import بسته models دیتابیس‌های پیش‌فرض را در پوشه جاری می‌سازد
+        self.cwd = os.getcwd()
+        self.workdir = tempfile.mkdtemp(prefix="test_outbound_")
+        os.chdir(self.workdir)
+        from models.database import close_connections, get_connection
+        from models.outbound_queue import OutboundQueueManager
+        from models.watermark_manager import WatermarkManager
+
+        self.close_connections = close_connections
+        self.get_connection = get_connection
+        self.db_path = os.path.join(self.workdir, "outbound.db")
+        self.queue = OutboundQueueManager(self.db_path)
+        self.watermarks = WatermarkManager(self.db_path)
+
+    def tearDown(self):
+        self.close_connections()
+        os.chdir(self.cwd)
+        shutil.rmtree(self.workdir, ignore_errors=True)
+
+    def enqueue(self, item_id: str, timestamp: float):
+        return self.queue.enqueue(1, "t1", "u1", item_id, [("text", "سلام")], timestamp,
+                                  watermark=(item_id, timestamp))
+
+    def test_watermark_written_with_row(self):
+        outbound_id = self.enqueue("i2", 200.0)
+        self.assertIsNotNone(outbound_id)
+        self.assertEqual(self.watermarks.get_watermark(1, "t1"), ("i2", 200.0))
+        # بررسی دوباره همان پیام ردیف تازه نمی‌سازد
+        self.assertEqual(self.enqueue("i2", 200.0), outbound_id)
+
+    def test_failed_watermark_discards_row(self):
+        conn = self.get_connection(self.db_path)
+        conn.execute('''
+            CREATE TRIGGER fail_watermark BEFORE INSERT ON thread_watermarks
+            BEGIN SELECT RAISE(ABORT, 'injected'); END
+        ''')
+        conn.commit()
+
+        self.assertIsNone(self.enqueue("i2", 200.0))
+        self.assertEqual(sum(self.queue.count_by_state().values()), 0)
+        self.assertIsNone(self.watermarks.get_watermark(1, "t1"))
+
+
+if __name__ == "__main__":
+    unittest.main()
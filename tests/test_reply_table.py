@@ -0,0 +1,92 @@
+import os
+import shutil
+import tempfile
+import unittest
+from datetime import date
+
+
+class IncrementalReplyTableTest(unittest.TestCase):
+    """ویرایش یک پیام جدول کش‌شده را به‌روز می‌کند بدون بارگذاری دوباره کل پیام‌ها"""
+
+    def setUp(self):
+        # import بسته models دیتابیس‌های پیش‌فرض را در پوشه جاری می‌سازد
+        self.cwd = os.getcwd()
+        self.workdir = tempfile.mkdtemp(prefix="test_reply_table_")
+        os.chdir(self.workdir)
+        from models.database import close_connections
+        from models.message_manager import MessageManager
+        from models.reply_table import ReplyTable
+
+        self.close_connections = close_connections
+        self.ReplyTable = ReplyTable
+        self.manager = MessageManager(os.path.join(self.workdir, "messages.db"))
+        self.loads = 0
+        load_rows = self.manager._load_reply_rows
+
+        def counted(user_id):
+            self.loads += 1
+            return load_rows(user_id)
+
+        self.manager._load_reply_rows = counted
+
+    def tearDown(self):
+        self.close_connections()
+        os.chdir(self.cwd)
+        shutil.rmtree(self.workdir, ignore_errors=True)
+
+    def message_id(self, key: str) -> int:
+        return next(message["id"] for message in self.manager.get_all_messages(1) if message["key"] == key)
+
+    def assert_matches_rebuild(self, texts):
+        """جدول به‌روزشده باید با جدول ساخته‌شده از صفر یکسان پاسخ دهد"""
+        from models.reply_table import reply_cache
+
+        cached = reply_cache.get_table(self.manager.db_path, 1, lambda: self.fail("جدول دوباره بارگذاری شد"))
+        rebuilt = self.ReplyTable(0, self.manager._load_reply_rows(1))
+        today = date(2026, 1, 1)
+        for text in texts:
+            self.assertEqual(cached.lookup(text, today), rebuilt.lookup(text, today), text)
+        self.assertEqual(len(cached.matcher), len(rebuilt.matcher))
+
+    def test_edits_applied_in_place(self):
+        self.manager.add_message(1, "سلام", "درود", "text", match_mode="word")
+        self.manager.add_message(1, "قیمت", "لیست قیمت", "text", match_mode="contains")
+        self.manager.add_message(1, "1", "منو", "number")
+        self.assertEqual(self.manager.get_message(1, "سلام خوبی"), "درود")
+        self.assertEqual(self.loads, 1)
+
+        self.manager.add_message(1, "ارسال", "هزینه ارسال", "text", match_mode="contains", priority=5)
+        self.assertEqual(self.manager.get_message(1, "قیمت ارسال چنده"), "هزینه ارسال")
+
+        self.manager.update_message(self.message_id("قیمت"), 1, "تخفیف", "کد تخفیف", "text",
+                                    match_mode="contains")
+        self.assertIsNone(self.manager.get_message(1, "قیمت چنده"))
+        self.assertEqual(self.manager.get_message(1, "تخفیف دارید"), "کد تخفیف")
+
+        self.manager.update_message(self.message_id("سلام"), 1, "سلام", "درود", "text",
+                                    is_active=False, match_mode="word")
+        self.assertIsNone(self.manager.get_message(1, "سلام خوبی"))
+
+        self.manager.delete_message(self.message_id("ارسال"), 1)
+        self.assertIsNone(self.manager.get_message(1, "قیمت ارسال"))
+
+        self.assertEqual(self.loads, 1)
+        self.assert_matches_rebuild(["سلام خوبی", "قیمت ارسال", "تخفیف دارید", "1", "2"])
+
+    def test_normalized_keys_keep_newest_row(self):
+        # «علي» و «علی» یک کلید نرمال‌شده‌اند و جدیدترین ردیف پاسخ می‌دهد
+        self.manager.add_message(1, "علي", "قدیمی", "text", match_mode="contains")
+        self.assertEqual(self.manager.get_message(1, "علی"), "قدیمی")
+        self.manager.add_message(1, "علی", "جدید", "number")
+        self.assertEqual(self.manager.get_message(1, "علی"), "جدید")
+        # جدیدترین ردیف عددی است پس کلید متنی دیگر درون پیام تطبیق نمی‌خورد
+        self.assertIsNone(self.manager.get_message(1, "سلام علی"))
+
+        self.manager.delete_message(self.message_id("علی"), 1)
+        self.assertEqual(self.manager.get_message(1, "سلام علی"), "قدیمی")
+        self.assertEqual(self.loads, 1)
+        self.assert_matches_rebuild(["علی", "سلام علی", "علي"])
+
+
+if __name__ == "__main__":
+    unittest.main()